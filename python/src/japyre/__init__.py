@@ -0,0 +1,89 @@
+'''
+Japyre: a socket-based connection between Java-side gyms and Python-side RL algorithms.
+
+The classes below can be imported directly from the package, e.g.
+
+    from japyre import GymEnvClient
+
+Submodules are only loaded when one of their classes is first used, so that e.g. a
+worker process that only needs the client does not pay for loading NumPy, gym, or
+stable-baselines3. The client/server core (gymenv_client, commandserver, modelserver,
+codec, transport, ...) does not import any of these itself.
+'''
+
+import importlib
+from typing import TYPE_CHECKING
+
+__version__ = "0.1.0"
+
+# the public name -> the submodule defining it:
+_EXPORTS = {
+    # the client/server core, without heavy dependencies:
+    "GymEnvClient"       : "gymenv_client",
+    "AsyncGymEnvClient"  : "async_gymenv_client",
+    "GymEnvServer"       : "gymenv_server",
+    "CommandServer"      : "commandserver",
+    "ModelServer"        : "modelserver",
+    "ModelRegistry"      : "modelregistry",
+    "MicroBatcher"       : "microbatcher",
+    "SquareWorld"        : "squareworld",
+    "Instrumentation"    : "instrumentation",
+    "Recorder"           : "recording",
+    "RecordedGymEnv"     : "recording",
+    "SharedRing"         : "shm_ring",
+    "TransitionCache"    : "transition_cache",
+    "parseAddress"       : "transport",
+    "EnvServerSupervisor": "supervisor",
+    # these need NumPy:
+    "Qlearning"          : "qlearning",
+    "ParallelQlearning"  : "parallel_qlearning",
+    "ReplayBuffer"       : "replay_buffer",
+    "TransitionModel"    : "transition_model",
+    "SparseQTable"       : "sparse_qtable",
+    "VecSquareWorld"     : "vec_squareworld",
+    "ObservationSchema"  : "obs_schema",
+    "Field"              : "obs_schema",
+    # and these gym (and stable-baselines3, when installed):
+    "VecGymEnv"          : "vec_gymenv",
+    "SqWorldEnv"         : "sqworld_env",
+    "SquareWorldVecEnv"  : "vec_squareworld",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name:str):
+    module = _EXPORTS.get(name)
+    if module is None :
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    # cache it, so that __getattr__ is not called for it again:
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+if TYPE_CHECKING :
+    from .gymenv_client import GymEnvClient
+    from .async_gymenv_client import AsyncGymEnvClient
+    from .gymenv_server import GymEnvServer
+    from .commandserver import CommandServer
+    from .modelserver import ModelServer
+    from .modelregistry import ModelRegistry
+    from .microbatcher import MicroBatcher
+    from .squareworld import SquareWorld
+    from .instrumentation import Instrumentation
+    from .recording import Recorder, RecordedGymEnv
+    from .shm_ring import SharedRing
+    from .transition_cache import TransitionCache
+    from .transport import parseAddress
+    from .supervisor import EnvServerSupervisor
+    from .qlearning import Qlearning
+    from .parallel_qlearning import ParallelQlearning
+    from .replay_buffer import ReplayBuffer
+    from .transition_model import TransitionModel
+    from .sparse_qtable import SparseQTable
+    from .vec_squareworld import VecSquareWorld, SquareWorldVecEnv
+    from .obs_schema import ObservationSchema, Field
+    from .vec_gymenv import VecGymEnv
+    from .sqworld_env import SqWorldEnv
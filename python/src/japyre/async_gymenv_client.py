@@ -0,0 +1,224 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, List
+from .socketchannel import LINE_FRAMING, LENGTH_FRAMING, encodeFrame, framingOverhead, readFrameAsync
+from .codec import JSON_CODEC, SET_CODEC, encodeMessage, decodeMessage
+from .transport import parseAddress, openConnection
+from .gymenv_client import parseResponse
+from .instrumentation import Instrumentation, STATS, ENCODE, WAIT, DECODE
+
+HOST = "127.0.0.1"  # Standard loopback interface address (localhost)
+PORT = 9999         # Port to listen on (non-privileged ports are > 1023)
+logger = logging.getLogger(__name__)
+
+class AsyncGymEnvClient:
+    '''
+    An asyncio version of GymEnvClient. It offers the same methods, but as coroutines,
+    e.g. "o = await client.reset()". Because waiting for a response does not block
+    the thread, a single event-loop can drive many GymEnvServers at the same time,
+    without needing a thread for every server.
+
+    By default, a client has at most one command outstanding, just as GymEnvClient.
+    In the pipelined mode, several commands can be sent to the server before their
+    responses have arrived. The server answers them one by one, in the order they
+    were sent, and the responses are matched to the commands in that same
+    (first-in-first-out) order. For example, several steps can be in flight at once:
+
+        results = await asyncio.gather(client.step("up"), client.step("left"))
+
+    This saves the latency of all round-trips but one. Note that the commands are
+    still executed in the order they were issued.
+
+    Use the coroutine create() to construct a connected client:
+
+        client = await AsyncGymEnvClient.create(HOST,PORT)
+    '''
+
+    def __init__(self, host, port=None, pipelined=False, framing=LINE_FRAMING, maxMessageSize=2**24, codec=JSON_CODEC):
+        '''
+        Create a client; it does not connect yet. Use the coroutine connect() for that,
+        or just use the coroutine create() to do both. As for GymEnvClient, the host can
+        also be an address-URI, such as "unix:///tmp/gym.sock".
+
+        Parameters:
+        pipelined (bool): if true, several commands can be in flight at the same time
+        framing (str): how messages are delimited on the socket; "line" (the default,
+                       as used by the Java-side GymEnvServer) or "length".
+        maxMessageSize (int): the size of the largest message that can be received
+                       in the line-framing.
+        codec (str): the codec to ask from the server when connecting; see GymEnvClient.
+        '''
+        self.host = host
+        self.port = port
+        self.endpoint = parseAddress(host,port)
+        self.pipelined = pipelined
+        self.framing = framing
+        self.maxMessageSize = maxMessageSize
+        self.requestedCodec = codec
+        self.codec = JSON_CODEC
+        self.reader = None
+        self.writer = None
+        # (cmd,future,timings) of the commands sent, whose response has not arrived yet;
+        # timings is (encodeNanos,sentAt,bytesSent):
+        self.pending = deque()
+        self.lock = None
+        self.receiverTask = None
+        self.actionSpace = None
+        # the number of bytes that went over the wire, including framing:
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        # the timings of every command, as in GymEnvClient; in the pipelined mode, the
+        # wait of a command includes the time it was queued behind earlier ones:
+        self.stats = Instrumentation()
+
+    @classmethod
+    async def create(cls, host, port=None, **options) :
+        '''
+        Create a client, and connect it to the GymEnvServer at the given host and port.
+        The options are passed to the constructor.
+        '''
+        client = cls(host,port,**options)
+        await client.connect()
+        return client
+
+    async def connect(self) -> None :
+        self.reader, self.writer = await openConnection(self.endpoint, self.maxMessageSize)
+        self.lock = asyncio.Lock()
+        self.receiverTask = asyncio.get_running_loop().create_task(self._receiveResponses())
+        if self.requestedCodec != JSON_CODEC :
+            await self.negotiateCodec(self.requestedCodec)
+        self.actionSpace = await self.sendCommand("GET_ACTIONSPACE")
+
+    async def negotiateCodec(self, codec) -> str :
+        '''
+        Ask the server to switch to the given codec; see GymEnvClient.negotiateCodec().
+        This should be done while no other command is in flight.
+        '''
+        await self.sendCommand(SET_CODEC,[codec,JSON_CODEC])
+        return self.codec
+
+    async def _receiveResponses(self) -> None :
+        '''
+        Keep reading responses from the server, and hand each over to the oldest
+        command still waiting for one.
+        '''
+        try:
+            while True :
+                received = await readFrameAsync(self.reader,self.framing)
+                if received is None :
+                    break
+                self.bytesReceived += len(received) + framingOverhead(self.framing)
+                t0 = time.perf_counter_ns()
+                receivedJson = decodeMessage(received,self.codec)
+                if logger.isEnabledFor(logging.DEBUG) :
+                    logger.debug("receiving %s", receivedJson)
+                cmd,future,(encodeNanos,sentAt,bytesSent) = self.pending.popleft()
+                if cmd == SET_CODEC and receivedJson is not None and receivedJson != JSON_CODEC :
+                    # the next response already comes in the agreed codec:
+                    self.codec = receivedJson
+                    self.framing = LENGTH_FRAMING
+                response = parseResponse(cmd,receivedJson)
+                self.stats.record(cmd, {ENCODE:encodeNanos, WAIT:t0 - sentAt, DECODE:time.perf_counter_ns() - t0},
+                                  bytesSent, len(received))
+                if not future.cancelled() :
+                    future.set_result(response)
+            error = ConnectionError("The GymEnvServer has closed the connection.")
+        except Exception as e:
+            error = e
+        while self.pending :
+            cmd,future,_ = self.pending.popleft()
+            if not future.done() :
+                future.set_exception(error)
+
+    def _send(self, cmd, arg) -> tuple :
+        '''
+        Write the command; returns its timings (encodeNanos,sentAt,bytesSent).
+        '''
+        pckg  = {"cmd":cmd, "arg":arg}
+        t0 = time.perf_counter_ns()
+        message = encodeMessage(pckg,self.codec)
+        frame = encodeFrame(message,self.framing)
+        sentAt = time.perf_counter_ns()
+        self.writer.write(frame)
+        self.bytesSent += len(frame)
+        if logger.isEnabledFor(logging.DEBUG) :
+            logger.debug("sending %s", pckg)
+        return (sentAt - t0, sentAt, len(message))
+
+    async def _request(self, cmd, arg) -> Any :
+        future = asyncio.get_running_loop().create_future()
+        # registering the future and writing the command happen without awaiting in
+        # between, so the order of self.pending is the order on the wire:
+        entry = [cmd,future,None]
+        self.pending.append(entry)
+        entry[2] = self._send(cmd,arg)
+        await self.writer.drain()
+        return await future
+
+    async def sendCommand(self, cmd, arg=None) -> Any :
+        '''
+        Send a command to the GymEnvServer, and wait for its response. The response
+        is returned in the same form as GymEnvClient.sendCommand() does.
+        '''
+        if cmd == "KILL" :
+            self._send(cmd,arg)
+            await self.writer.drain()
+            return None
+        if self.pipelined :
+            return await self._request(cmd,arg)
+        async with self.lock :
+            return await self._request(cmd,arg)
+
+    async def serverStats(self) :
+        '''
+        Ask the server for its statistics; see GymEnvClient.serverStats().
+        '''
+        return await self.sendCommand(STATS)
+
+    async def reset(self) :
+        '''
+        Reset the Java-side GymEnv to its intial state, and return the initial observation.
+        '''
+        return await self.sendCommand("RESET")
+
+    async def step(self, action) :
+        '''
+        Execute the given action on the Java-side GymEnv; returns a tuple (obs,r,done,info).
+        '''
+        return await self.sendCommand("STEP",action)
+
+    async def step_many(self, actions) -> List :
+        '''
+        Execute a sequence of actions in a single round-trip; see GymEnvClient.step_many().
+        '''
+        return await self.sendCommand("STEP_BATCH",list(actions))
+
+    async def softClose(self) -> None :
+        '''
+        Close the Java-side GymEnv; this will not close the GymEnvServer that runs it.
+        '''
+        await self.sendCommand("CLOSE")
+
+    async def close(self) -> None :
+        '''
+        Close the Java-side GymEnv and the GymEnvServer that runs it.
+        '''
+        await self.sendCommand("CLOSE")
+        await self.sendCommand("KILL")
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receiverTask
+
+
+# just for testing:
+if __name__ == '__main__':
+    async def main():
+        client = await AsyncGymEnvClient.create(HOST,PORT,pipelined=True)
+        print(f"### action space: {client.actionSpace}")
+        await client.reset()
+        print(await asyncio.gather(client.step("up"), client.step("right")))
+        await client.close()
+
+    asyncio.run(main())
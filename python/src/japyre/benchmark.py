@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import contextlib
+import itertools
+import tempfile
+import numpy as np
+from typing import Dict, List
+from .socketchannel import LINE_FRAMING
+from .codec import JSON_CODEC, SUPPORTED_CODECS
+from .squareworld import SquareWorld
+from .gymenv_server import GymEnvServer
+from .gymenv_client import GymEnvClient
+from .async_gymenv_client import AsyncGymEnvClient
+from .vec_gymenv import VecGymEnv
+from .qlearning import Qlearning
+from .transition_model import TransitionModel
+from .vec_squareworld import VecSquareWorld
+
+# A benchmark suite for the Python-side of japyre. It runs SquareWorld gyms in
+# Python stand-in GymEnvServers (see gymenv_server.py), so no JVM is needed, and
+# measures how fast the different clients can drive them:
+#
+#    single     : GymEnvClient, one round-trip per step
+#    batched    : GymEnvClient.step_many(), one round-trip per batch of steps
+#    vectorized : VecGymEnv over several servers
+#    async      : pipelined AsyncGymEnvClients over several servers, on one event-loop
+#    inprocess  : VecSquareWorld, many SquareWorlds stepped at once as NumPy arrays,
+#                 without any server: the no-network baseline for the others
+#    qlearning  : Q-table updates per second, one at a time and vectorized
+#    convergence: the env-steps and wall-clock time Q-learning needs to find a path
+#                 to the goal, without and with Dyna-style planning
+#
+# The client benchmarks are run over every selected transport (see transport.py):
+# TCP with TCP_NODELAY ("tcp"), TCP with Nagle's algorithm on ("tcp-nagle"), and
+# Unix-domain sockets ("unix"). The name of a result says which, e.g. "single@unix".
+#
+# The agent just moves left and right, so an episode never ends and every round-trip
+# is a plain step. The results are printed as Json, e.g.:
+#
+#    python -m japyre.benchmark --steps 5000 --latency 0.0001 --output results.json
+
+HOST = "127.0.0.1"
+
+_socketCounter = itertools.count()
+
+def serverAddress(transport:str) -> str :
+    '''
+    The address-URI for a new stand-in server over the given transport.
+    '''
+    if transport == "tcp" :
+        return f"tcp://{HOST}:0"
+    if transport == "tcp-nagle" :
+        return f"tcp://{HOST}:0?nodelay=0"
+    if transport == "unix" :
+        return f"unix://{tempfile.gettempdir()}/japyre-bench-{os.getpid()}-{next(_socketCounter)}.sock"
+    raise ValueError(f"Unknown transport: {transport}")
+
+TRANSPORTS = ["tcp", "tcp-nagle", "unix"]
+
+def summary(name:str, steps:int, seconds:float, roundTrips:List[float], bytesSent:int=0, bytesReceived:int=0) -> Dict :
+    '''
+    Summarize a benchmark run as a Json-serializable dictionary.
+
+    Parameters:
+    steps (int): the number of gym-steps (or Q-updates) done
+    seconds (float): the total wall-clock time of the run
+    roundTrips : the duration of every round-trip (or update), in seconds
+    '''
+    lat = np.asarray(roundTrips) * 1e6
+    return {
+        "name" : name,
+        "steps" : steps,
+        "seconds" : seconds,
+        "stepsPerSec" : steps / seconds if seconds > 0 else None,
+        "p50Micros" : float(np.percentile(lat,50)) if len(lat) > 0 else None,
+        "p99Micros" : float(np.percentile(lat,99)) if len(lat) > 0 else None,
+        "bytesSent" : bytesSent,
+        "bytesReceived" : bytesReceived,
+        "bytesPerStep" : (bytesSent + bytesReceived) / steps if steps > 0 else None
+    }
+
+def startServers(count:int, options, transport:str) -> List[GymEnvServer] :
+    '''
+    Start the given number of stand-in GymEnvServers in the background, each on its own
+    address (e.g. a free port) over the given transport.
+    '''
+    servers = []
+    for _ in range(count) :
+        server = GymEnvServer(serverAddress(transport),None,SquareWorld(options.size,options.padding),
+                              framing=options.framing,latency=options.latency)
+        server.startInBackground()
+        servers.append(server)
+    return servers
+
+def alternating(n:int, first=SquareWorld.LEFT, second=SquareWorld.RIGHT) -> List :
+    return [ first if i % 2 == 0 else second for i in range(n) ]
+
+def benchSingle(options, transport:str) -> Dict :
+    server = startServers(1,options,transport)[0]
+    client = GymEnvClient(str(server.endpoint),framing=options.framing,codec=options.codec,
+                          sharedMemorySize=options.shm)
+    client.reset()
+    actions = alternating(options.steps)
+    roundTrips = []
+    start = time.perf_counter()
+    for a in actions :
+        t0 = time.perf_counter()
+        client.step(a)
+        roundTrips.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    result = summary("single",options.steps,seconds,roundTrips,
+                     client.channel.bytesSent,client.channel.bytesReceived)
+    client.close()
+    return result
+
+def benchBatched(options, transport:str) -> Dict :
+    server = startServers(1,options,transport)[0]
+    client = GymEnvClient(str(server.endpoint),framing=options.framing,codec=options.codec,
+                          sharedMemorySize=options.shm)
+    client.reset()
+    batch = alternating(options.batch)
+    numberOfBatches = max(1, options.steps // options.batch)
+    roundTrips = []
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(numberOfBatches) :
+        t0 = time.perf_counter()
+        steps += len(client.step_many(batch))
+        roundTrips.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    result = summary(f"batched[{options.batch}]",steps,seconds,roundTrips,
+                     client.channel.bytesSent,client.channel.bytesReceived)
+    client.close()
+    return result
+
+def benchVectorized(options, transport:str) -> Dict :
+    from gym import spaces
+    servers = startServers(options.envs,options,transport)
+    env = VecGymEnv([ str(s.endpoint) for s in servers ],
+                    lambda obs : [obs["x"],obs["y"]],
+                    spaces.Box(low=-1, high=options.size, shape=(2,), dtype=np.float32),
+                    framing=options.framing, codec=options.codec, sharedMemorySize=options.shm)
+    env.reset()
+    left = env.actionNames.index(SquareWorld.LEFT)
+    right = env.actionNames.index(SquareWorld.RIGHT)
+    numberOfSteps = max(1, options.steps // options.envs)
+    roundTrips = []
+    start = time.perf_counter()
+    for i in range(numberOfSteps) :
+        actions = np.full(options.envs, left if i % 2 == 0 else right)
+        t0 = time.perf_counter()
+        env.step(actions)
+        roundTrips.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    bytesSent = sum(c.channel.bytesSent for c in env.clients)
+    bytesReceived = sum(c.channel.bytesReceived for c in env.clients)
+    env.close()
+    return summary(f"vectorized[{options.envs}]",numberOfSteps * options.envs,seconds,roundTrips,
+                   bytesSent,bytesReceived)
+
+def benchAsync(options, transport:str) -> Dict :
+    servers = startServers(options.envs,options,transport)
+    stepsPerEnv = max(1, options.steps // options.envs)
+
+    async def drive(client, roundTrips) :
+        # keep a window of options.pipeline steps in flight:
+        async def timedStep(a) :
+            t0 = time.perf_counter()
+            await client.step(a)
+            roundTrips.append(time.perf_counter() - t0)
+        actions = alternating(stepsPerEnv)
+        for i in range(0, stepsPerEnv, options.pipeline) :
+            await asyncio.gather(*[ timedStep(a) for a in actions[i:i + options.pipeline] ])
+
+    async def main() :
+        clients = [ await AsyncGymEnvClient.create(str(s.endpoint),pipelined=True,framing=options.framing,
+                                              codec=options.codec)
+                    for s in servers ]
+        for c in clients :
+            await c.reset()
+        roundTrips = []
+        start = time.perf_counter()
+        await asyncio.gather(*[ drive(c,roundTrips) for c in clients ])
+        seconds = time.perf_counter() - start
+        bytesSent = sum(c.bytesSent for c in clients)
+        bytesReceived = sum(c.bytesReceived for c in clients)
+        for c in clients :
+            await c.close()
+        return summary(f"async[{options.envs}x{options.pipeline}]",stepsPerEnv * options.envs,
+                       seconds,roundTrips,bytesSent,bytesReceived)
+
+    return asyncio.run(main())
+
+def benchInProcess(options, transport:str=None) -> Dict :
+    world = VecSquareWorld(options.size,options.inprocessEnvs)
+    world.reset()
+    left = np.full(options.inprocessEnvs, world.actionSpace().index(SquareWorld.LEFT))
+    right = np.full(options.inprocessEnvs, world.actionSpace().index(SquareWorld.RIGHT))
+    # every env does options.steps steps:
+    numberOfSteps = options.steps
+    roundTrips = []
+    start = time.perf_counter()
+    for i in range(numberOfSteps) :
+        t0 = time.perf_counter()
+        world.step(left if i % 2 == 0 else right)
+        roundTrips.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    return summary(f"inprocess[{options.inprocessEnvs}]",numberOfSteps * options.inprocessEnvs,seconds,roundTrips)
+
+def benchQlearning(options, transport:str=None) -> List[Dict] :
+    numberOfStates = (options.size + 2) ** 2
+    numberOfActions = 4
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, numberOfStates, options.updates)
+    actions = rng.integers(0, numberOfActions, options.updates)
+    nextStates = rng.integers(0, numberOfStates, options.updates)
+    rewards = rng.choice([0.0, 100.0, -100.0], options.updates)
+
+    qalg = Qlearning(numberOfStates,numberOfActions)
+    durations = []
+    start = time.perf_counter()
+    for i in range(options.updates) :
+        t0 = time.perf_counter()
+        qalg.applyReward(int(states[i]),int(actions[i]),int(nextStates[i]),float(rewards[i]))
+        durations.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    results = [ summary("qlearning.applyReward",options.updates,seconds,durations) ]
+
+    qalg = Qlearning(numberOfStates,numberOfActions)
+    durations = []
+    start = time.perf_counter()
+    for i in range(0, options.updates, options.batch) :
+        j = i + options.batch
+        t0 = time.perf_counter()
+        qalg.applyRewards(states[i:j],actions[i:j],nextStates[i:j],rewards[i:j])
+        durations.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - start
+    results.append(summary(f"qlearning.applyRewards[{options.batch}]",options.updates,seconds,durations))
+    return results
+
+def greedyRunReachesGoal(qalg:Qlearning, size:int) -> bool :
+    '''
+    Check, on a local SquareWorld (so without costing any env-steps), whether the greedy
+    policy of the Q-table leads from the initial state to the goal.
+    '''
+    world = SquareWorld(size)
+    actionSpace = world.actionSpace()
+    o = world.reset()
+    for _ in range(2 * size) :
+        o,reward,done = world.step(actionSpace[qalg.getNextTrainedAction((o["x"],o["y"]))])
+        if done :
+            return reward > 0
+    return False
+
+def benchConvergence(options, transport:str) -> List[Dict] :
+    from .sqworld_env import SqWorldEnv
+    N_plus_2 = options.size + 2
+    results = []
+    for planningSteps in options.planning :
+        server = GymEnvServer(serverAddress(transport),None,SquareWorld(options.size,options.padding),
+                              framing=options.framing,latency=options.latency)
+        serverThread = server.startInBackground()
+        client = GymEnvClient(str(server.endpoint),framing=options.framing,codec=options.codec)
+        env = SqWorldEnv(options.size,client=client)
+        qalg = Qlearning(N_plus_2 * N_plus_2, len(client.actionSpace))
+        qalg.stateIndexer = lambda obs : (int(obs[0]) + 1) * N_plus_2 + int(obs[1]) + 1
+        model = TransitionModel(N_plus_2 * N_plus_2 * len(client.actionSpace),qalg.rng) if planningSteps > 0 else None
+        start = time.perf_counter()
+        steps = qalg.learn(env,options.convergenceSteps,model=model,planningSteps=planningSteps,
+                           batchSize=options.batch,until=lambda : greedyRunReachesGoal(qalg,options.size))
+        seconds = time.perf_counter() - start
+        result = summary(f"convergence[planning={planningSteps}]",steps,seconds,[],
+                         client.channel.bytesSent,client.channel.bytesReceived)
+        result["planningSteps"] = planningSteps
+        result["converged"] = greedyRunReachesGoal(qalg,options.size)
+        results.append(result)
+        env.close()
+        # let the server finish (and report it) while stdout is still redirected:
+        serverThread.join()
+    return results
+
+BENCHMARKS = {
+    "single" : benchSingle,
+    "batched" : benchBatched,
+    "vectorized" : benchVectorized,
+    "async" : benchAsync,
+    "inprocess" : benchInProcess,
+    "qlearning" : benchQlearning,
+    "convergence" : benchConvergence
+}
+
+# the benchmarks that do not use any server, so are run only once:
+WITHOUT_SERVERS = ["inprocess", "qlearning"]
+
+def runBenchmarks(options) -> Dict :
+    '''
+    Run the selected benchmarks, and return their results along with the configuration.
+    '''
+    results = []
+    # the servers report their progress on stdout; keep stdout clean for the Json:
+    with contextlib.redirect_stdout(sys.stderr) :
+        for name in options.only :
+            transports = [None] if name in WITHOUT_SERVERS else options.transports
+            for transport in transports :
+                r = BENCHMARKS[name](options,transport)
+                for result in (r if isinstance(r,list) else [r]) :
+                    if transport is not None :
+                        result["name"] += f"@{transport}"
+                        result["transport"] = transport
+                    results.append(result)
+    config = { k:v for k,v in vars(options).items() if k != "output" }
+    return {
+        "config" : config,
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "results" : results
+    }
+
+def parseArguments(argv=None) :
+    parser = argparse.ArgumentParser(description="Benchmark the japyre Python-side against stand-in GymEnvServers.")
+    parser.add_argument("--steps", type=int, default=2000, help="number of gym-steps per client benchmark")
+    parser.add_argument("--updates", type=int, default=20000, help="number of Q-updates in the qlearning benchmark")
+    parser.add_argument("--size", type=int, default=6, help="the size of the square world")
+    parser.add_argument("--latency", type=float, default=0.0, help="synthetic server latency per command, in seconds")
+    parser.add_argument("--padding", type=int, default=0, help="number of extra numbers in every observation")
+    parser.add_argument("--framing", default=LINE_FRAMING, choices=["line","length"])
+    parser.add_argument("--codec", default=JSON_CODEC, choices=SUPPORTED_CODECS)
+    parser.add_argument("--shm", type=int, default=0,
+                        help="size of a shared-memory ring for large observation-arrays (not used by the async clients)")
+    parser.add_argument("--batch", type=int, default=32, help="batch size of step_many and applyRewards")
+    parser.add_argument("--envs", type=int, default=4, help="number of servers for the vectorized and async benchmarks")
+    parser.add_argument("--inprocessEnvs", type=int, default=4096, help="number of envs in the inprocess benchmark")
+    parser.add_argument("--pipeline", type=int, default=8, help="number of steps in flight per async client")
+    parser.add_argument("--transports", nargs="+", default=["tcp","unix"], choices=TRANSPORTS,
+                        help="the transports to run the client benchmarks over")
+    parser.add_argument("--only", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS),
+                        help="the benchmarks to run")
+    parser.add_argument("--planning", type=int, nargs="+", default=[0,10,50],
+                        help="the numbers of planning steps per env-step to run the convergence benchmark with")
+    parser.add_argument("--convergenceSteps", type=int, default=20000,
+                        help="the maximum number of env-steps in the convergence benchmark")
+    parser.add_argument("--output", help="write the Json results to this file, rather than to stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    options = parseArguments()
+    report = runBenchmarks(options)
+    if options.output :
+        with open(options.output,"w") as f :
+            json.dump(report,f,indent=2)
+    else :
+        print(json.dumps(report,indent=2))
@@ -0,0 +1,229 @@
+import sys
+import json
+import struct
+from typing import Any, List, Sequence, Tuple
+
+# Codecs determine how messages are encoded to bytes:
+#
+#    "json"   : UTF-8 Json text. This is the default, and the only codec the
+#               Java-side ObjectReaderWriter_OverSocket understands.
+#    "binary" : a compact tagged binary format (see encodeBinary), in which NumPy
+#               arrays are sent as raw array data. Binary messages can contain
+#               newline-characters, so with this codec the length-framing is used.
+#
+# The codec is chosen by a handshake right after connecting: the client sends the
+# command SET_CODEC with the list of codecs it wants, in order of preference. The
+# server replies, still in Json, with the first one it supports; a server that only
+# knows Json replies "json". From the next message on, both sides use the chosen codec.
+
+JSON_CODEC   = "json"
+BINARY_CODEC = "binary"
+SET_CODEC    = "SET_CODEC"
+
+SUPPORTED_CODECS = [JSON_CODEC, BINARY_CODEC]
+
+_ALIGNMENT = 8
+_INT   = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_COUNT = struct.Struct("<I")
+
+def chooseCodec(proposed:Sequence[str]) -> str :
+    '''
+    Choose the codec to use, given the list of codecs a client proposed in the
+    handshake: the first one that is supported, or else "json".
+    '''
+    for c in proposed :
+        if c in SUPPORTED_CODECS :
+            return c
+    return JSON_CODEC
+
+def _jsonDefault(obj:Any) -> Any :
+    # NumPy arrays and scalars are sent as (lists of) plain numbers:
+    if hasattr(obj,"tolist") :
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not Json serializable")
+
+def encodeMessage(obj:Any, codec:str=JSON_CODEC) -> bytes :
+    '''
+    Encode the given object to bytes, with the given codec.
+    '''
+    if codec == JSON_CODEC :
+        return json.dumps(obj, default=_jsonDefault).encode("utf-8")
+    if codec == BINARY_CODEC :
+        return encodeBinary(obj)
+    raise ValueError(f"Unknown codec: {codec}")
+
+def decodeMessage(payload:bytes, codec:str=JSON_CODEC) -> Any :
+    '''
+    Decode an object from the given bytes, with the given codec.
+    '''
+    if codec == JSON_CODEC :
+        return json.loads(payload)
+    if codec == BINARY_CODEC :
+        return decodeBinary(payload)
+    raise ValueError(f"Unknown codec: {codec}")
+
+def encodeBinary(obj:Any) -> bytes :
+    '''
+    Encode an object to the binary format. Every value starts with a one-byte tag:
+
+       N : None          T, F : True, False
+       i : int64         n : an int not fitting in 64 bits, as a decimal string
+       d : float64       s : str (uint32 length + UTF-8 bytes)
+       b : bytes (uint32 length + the bytes)
+       l : list or tuple (uint32 count + the elements)
+       m : dictionary (uint32 count + key,value pairs)
+       a : NumPy array (uint8 length + dtype-string, uint8 ndim, uint32 per dimension,
+           padding to a multiple of 8 bytes from the start of the message, raw C-ordered data)
+
+    All numbers are little-endian.
+    '''
+    out = bytearray()
+    _encodeValue(obj,out)
+    return bytes(out)
+
+def _encodeValue(obj:Any, out:bytearray) -> None :
+    if obj is None :
+        out += b"N"
+    elif obj is True :
+        out += b"T"
+    elif obj is False :
+        out += b"F"
+    elif isinstance(obj,int) :
+        if -2**63 <= obj < 2**63 :
+            out += b"i"
+            out += _INT.pack(obj)
+        else :
+            out += b"n"
+            _encodeBytes(str(obj).encode("ascii"),out)
+    elif isinstance(obj,float) :
+        out += b"d"
+        out += _FLOAT.pack(obj)
+    elif isinstance(obj,str) :
+        out += b"s"
+        _encodeBytes(obj.encode("utf-8"),out)
+    elif isinstance(obj,(bytes,bytearray)) :
+        out += b"b"
+        _encodeBytes(obj,out)
+    elif isinstance(obj,(list,tuple)) :
+        out += b"l"
+        out += _COUNT.pack(len(obj))
+        for x in obj :
+            _encodeValue(x,out)
+    elif isinstance(obj,dict) :
+        out += b"m"
+        out += _COUNT.pack(len(obj))
+        for k,v in obj.items() :
+            _encodeValue(k,out)
+            _encodeValue(v,out)
+    else :
+        # an object can only be a NumPy array if NumPy has been imported already, so
+        # there is no need to import it here:
+        np = sys.modules.get("numpy")
+        if np is not None and isinstance(obj,np.ndarray) :
+            _encodeArray(obj,out)
+        elif np is not None and isinstance(obj,np.generic) :
+            _encodeValue(obj.item(),out)
+        else :
+            raise TypeError(f"Cannot encode an object of type {type(obj).__name__}")
+
+def _encodeBytes(data:bytes, out:bytearray) -> None :
+    out += _COUNT.pack(len(data))
+    out += data
+
+def _encodeArray(array, out:bytearray) -> None :
+    if array.dtype.hasobject :
+        raise TypeError("Cannot encode a NumPy array of Python objects")
+    dtype = array.dtype.str.encode("ascii")
+    out += b"a"
+    out += bytes((len(dtype),))
+    out += dtype
+    out += bytes((array.ndim,))
+    for n in array.shape :
+        out += _COUNT.pack(n)
+    out += bytes((-len(out)) % _ALIGNMENT)
+    out += array.tobytes()
+
+def decodeBinary(payload:bytes) -> Any :
+    '''
+    Decode an object encoded with encodeBinary(). NumPy arrays are not copied: they
+    are read-only views (numpy.frombuffer) into the payload.
+    '''
+    obj,offset = _decodeValue(payload,0)
+    if offset != len(payload) :
+        raise ValueError("Trailing bytes after a binary message.")
+    return obj
+
+def _decodeValue(buf:bytes, offset:int) -> Tuple[Any,int] :
+    tag = buf[offset:offset+1]
+    offset += 1
+    if tag == b"N" :
+        return None, offset
+    if tag == b"T" :
+        return True, offset
+    if tag == b"F" :
+        return False, offset
+    if tag == b"i" :
+        return _INT.unpack_from(buf,offset)[0], offset + _INT.size
+    if tag == b"d" :
+        return _FLOAT.unpack_from(buf,offset)[0], offset + _FLOAT.size
+    if tag in (b"s", b"b", b"n") :
+        (n,) = _COUNT.unpack_from(buf,offset)
+        offset += _COUNT.size
+        data = bytes(buf[offset:offset+n])
+        if len(data) != n :
+            raise ValueError("Truncated binary message.")
+        if tag == b"s" :
+            return data.decode("utf-8"), offset + n
+        if tag == b"n" :
+            return int(data), offset + n
+        return data, offset + n
+    if tag == b"l" :
+        (n,) = _COUNT.unpack_from(buf,offset)
+        offset += _COUNT.size
+        items : List = []
+        for _ in range(n) :
+            x,offset = _decodeValue(buf,offset)
+            items.append(x)
+        return items, offset
+    if tag == b"m" :
+        (n,) = _COUNT.unpack_from(buf,offset)
+        offset += _COUNT.size
+        d = {}
+        for _ in range(n) :
+            k,offset = _decodeValue(buf,offset)
+            v,offset = _decodeValue(buf,offset)
+            d[k] = v
+        return d, offset
+    if tag == b"a" :
+        return _decodeArray(buf,offset)
+    raise ValueError(f"Unknown tag {tag!r} in a binary message.")
+
+def _decodeArray(buf:bytes, offset:int) -> Tuple[Any,int] :
+    import numpy as np
+    n = buf[offset]
+    dtype = np.dtype(bytes(buf[offset+1:offset+1+n]).decode("ascii"))
+    offset += 1 + n
+    ndim = buf[offset]
+    offset += 1
+    shape = struct.unpack_from(f"<{ndim}I",buf,offset)
+    offset += _COUNT.size * ndim
+    offset += (-offset) % _ALIGNMENT
+    count = 1
+    for d in shape :
+        count *= d
+    size = count * dtype.itemsize
+    if offset + size > len(buf) :
+        raise ValueError("Truncated binary message.")
+    array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return array, offset + size
+
+
+# just for testing:
+if __name__ == '__main__':
+    import numpy as np
+    msg = { "obs" : { "x":1, "y":-2, "img":np.arange(12,dtype=np.uint8).reshape(3,4) },
+            "rw" : 0.5, "end" : False, "etc" : None }
+    encoded = encodeBinary(msg)
+    print(f">> {len(encoded)} bytes; json: {len(encodeMessage(msg))} bytes")
+    print(decodeBinary(encoded))
@@ -1,31 +1,135 @@
+import time
 import socket
-import json
-from typing import Any, Callable, Dict
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from .socketchannel import SocketChannel, LINE_FRAMING, LENGTH_FRAMING, encodeFrame, readFrameAsync
+from .codec import JSON_CODEC, SET_CODEC, chooseCodec, encodeMessage, decodeMessage
+from .transport import parseAddress, listen, configure, removeSocketFile, startServer
+from .instrumentation import Instrumentation, STATS, DECODE, INTERPRET, ENCODE
 
 HOST = "127.0.0.1"  # Standard loopback interface address (localhost)
 PORT = 9999         # Port to listen on (non-privileged ports are > 1023)
-  
-debug = True 
+
+logger = logging.getLogger(__name__)
+
+THREADS_BACKEND = "threads"  # serve every client in its own thread, from a pool
+ASYNCIO_BACKEND = "asyncio"  # serve all clients from a single asyncio event-loop
+
+SHUTDOWN = "SHUTDOWN"  # the command a client can send to stop the server
+OK_ = "OK__"
+ERROR = "error"        # the key of the reply to a command that could not be served
+
+def errorReply(message:str) -> Dict :
+    '''
+    The reply sent back for a command that could not be served, e.g. an unknown one.
+    '''
+    return { ERROR : message }
+
+def checkArg(arg:Any, schema:Any) -> Optional[str] :
+    '''
+    Check an argument against the schema a handler declared for it. The schema is:
+        None : anything goes
+        a type, or a tuple of types : the arg must be an instance of (one of) them
+        a dictionary {key:schema} : the arg must be a dictionary that has these keys,
+                                    whose values meet their schemas
+    Returns None if the arg is fine, else a message describing the problem.
+    '''
+    if schema is None :
+        return None
+    if isinstance(schema,dict) :
+        if not isinstance(arg,dict) :
+            return f"expecting a dictionary, got {type(arg).__name__}"
+        for key,valueSchema in schema.items() :
+            if key not in arg :
+                return f"missing the key {key}"
+            problem = checkArg(arg[key],valueSchema)
+            if problem is not None :
+                return f"{key}: {problem}"
+        return None
+    if not isinstance(arg,schema) :
+        expected = " or ".join(t.__name__ for t in schema) if isinstance(schema,tuple) else schema.__name__
+        return f"expecting {expected}, got {type(arg).__name__}"
+    return None
+
+class Handler:
+    '''
+    A handler registered for a command; see CommandServer.registerHandler().
+    '''
+    def __init__(self, function:Callable[[Any],Any], argSchema:Any=None, fastPath:bool=False):
+        self.function = function
+        self.argSchema = argSchema
+        self.fastPath = fastPath
 
 class CommandServer:
     '''
     This class implements a generic command-server. To use it, first create an instance
-    of this class, then run the method deploy().
+    of this class, register a handler for every command it should understand (see
+    registerHandler()), then run the method deploy().
+
+    Commands are dispatched by looking their handler up in a table. A command that has
+    no handler is passed to the interpreter attached with attachInterpreter(), if any;
+    otherwise, as when its arg does not meet the handler's schema, or the handler
+    fails, the client gets the reply {"error":message}, and the server keeps running.
+
+    Every command served is timed: self.stats keeps, per command, latency-histograms
+    of decoding it, interpreting it, and encoding the response, along with the bytes
+    received and sent. A client can ask for these with the command STATS; see
+    instrumentation.py. The commands themselves are logged at the DEBUG level, to
+    the logger "japyre.commandserver".
     '''
 
-    def __init__(self, host:str, port:int):
+    def __init__(self, host:str, port:Optional[int]=None, framing:str=LINE_FRAMING, maxConnections:int=16):
         '''
         The constructor. When created, the server does not run yet.
         The method deploy() will deploy/run the server; it will then be bound
         to the given ip (host) and port.
 
         Parameters:
-        host (string): the ip where this server will be hosted
-        port (int):    the port number
+        host (string): the ip where this server will be hosted, or an address-URI such
+                       as "unix:///tmp/server.sock" (see transport.py)
+        port (int):    the port number; not needed when host is a URI
+        framing (str): how messages are delimited on the socket; "line" (the default,
+                       compatible with the Java-side clients) or "length".
+        maxConnections (int): the maximum number of clients served at the same time,
+                       when the server is deployed with a multi-client backend.
+                       Further clients wait until a connection is freed.
         '''
         self.host = host
         self.port = port
+        self.endpoint = parseAddress(host,port)
+        self.framing = framing
+        self.maxConnections = maxConnections
         self.commandInterpreter = None
+        self.handlers : Dict[str,Handler] = {}
+        self.shutdownRequested = threading.Event()
+        # while the asyncio backend runs, a function that wakes up its event-loop on shutdown:
+        self.wakeUpOnShutdown = None
+        self.stats = Instrumentation()
+        self.registerHandler(SHUTDOWN, self._shutdownHandler, fastPath=True)
+        self.registerHandler(STATS, lambda arg : self.stats.snapshot(), fastPath=True)
+
+    def _shutdownHandler(self, arg) :
+        self.shutdown()
+        return OK_
+
+    def registerHandler(self, cmd:str, handler:Callable[[Any],Any], argSchema:Any=None, fastPath:bool=False) -> None :
+        '''
+        Register the function handler(arg) to serve the command cmd; it gets the
+        command's arg, already decoded, and returns the answer to send back. This
+        replaces the handler cmd had, if any.
+
+        Parameters:
+        argSchema : if given, the arg is checked against it before the handler is
+                    called, and an error is sent back if it does not fit; see checkArg()
+        fastPath (bool) : for frequent commands, e.g. asking for the next action: the
+                    command is not logged, and its arg is not checked
+        '''
+        self.handlers[cmd] = Handler(handler,argSchema,fastPath)
+
+    def unregisterHandler(self, cmd:str) -> None :
+        self.handlers.pop(cmd,None)
 
     def attachInterpreter(self, commandInterpreter : Callable[[Dict,Dict],Any]) :
         ''' 
@@ -34,11 +138,13 @@ class CommandServer:
         The arg is assumed to be a Json-string.
         
         The function f is assumed to return a Json-string.
+
+        The interpreter only gets the commands that have no registered handler.
         '''
         self.commandInterpreter = commandInterpreter
 
 
-    def deploy(self, receiveBufferSize=4096) -> None :
+    def deploy(self, receiveBufferSize=4096, backend:Optional[str]=None) -> None :
         '''
         Deploy this command-server at the ip-address and port specified by
         self.host and self.port. This method will just run in a forever-cycle (until
@@ -54,39 +160,211 @@ class CommandServer:
         a pair (cmd,arg) from the client, f(cmd,arg) is invoked. The function is
         assumed to produce a Json-string, which is then sent back to the client.
 
-        The server closes when the client asks it to close. 
+        By default, the server serves a single client, and closes when that client
+        leaves. When a backend is specified, the server serves many clients at
+        the same time, at most self.maxConnections of them:
+
+            backend="threads" : every client is served by its own thread, from a pool.
+            backend="asyncio" : all clients are served from a single asyncio event-loop;
+                                the commands are interpreted in a pool of threads,
+                                so that a slow handler does not stall the other
+                                clients.
+
+        A client leaving then only ends its own session. The server keeps running
+        until a client sends the command SHUTDOWN (or shutdown() is called); it then
+        stops accepting new clients and closes when the connected ones have left.
+        Note that with either backend the interpreter can be called from several
+        threads at the same time.
+
+        The parameter receiveBufferSize is the initial size of the receive-buffer;
+        the buffer grows automatically when a bigger command arrives.
+
+        Messages are Json, unless a client asks for another codec with the command
+        SET_CODEC (see codec.py); this only affects the session of that client.
+        '''
+        self.shutdownRequested.clear()
+        if backend is None :
+            self._deploySingleClient(receiveBufferSize)
+        elif backend == THREADS_BACKEND :
+            self._deployThreaded(receiveBufferSize)
+        elif backend == ASYNCIO_BACKEND :
+            # asyncio takes long to import, and is only needed by this backend:
+            import asyncio
+            asyncio.run(self._deployAsync())
+        else :
+            raise ValueError(f"Unknown backend: {backend}")
+
+    def shutdown(self) -> None :
+        '''
+        Ask the server to stop. This has the same effect as a client sending the
+        command SHUTDOWN: the server stops accepting new clients, and closes once
+        the clients it is serving have left.
+        '''
+        self.shutdownRequested.set()
+        wakeUp = self.wakeUpOnShutdown
+        if wakeUp is not None :
+            wakeUp()
+
+    def _interpret(self, received:bytes, codec:str=JSON_CODEC) -> Tuple[bytes,str] :
+        '''
+        Interpret a single received command, encoded with the given codec. Returns the
+        response to send back, and the codec to use from then on; the latter only
+        changes when the command is SET_CODEC.
+        '''
+        t0 = time.perf_counter_ns()
+        myjson = decodeMessage(received,codec)
+        cmd = myjson["cmd"] # the command-string
+        arg = myjson["arg"] # the arg-object, represented as a nested Dictionary
+        if cmd == SET_CODEC :
+            # the answer is still sent in the current codec:
+            agreed = chooseCodec(arg)
+            return encodeMessage(agreed,codec), agreed
+        t1 = time.perf_counter_ns()
+        handler = self.handlers.get(cmd)
+        if handler is not None and handler.fastPath :
+            result = self._call(cmd,handler.function,arg)
+        else :
+            verbose = logger.isEnabledFor(logging.DEBUG)
+            if verbose :
+                logger.debug("receiving cmd: %s, arg: %s", cmd, arg)
+            if handler is not None :
+                problem = checkArg(arg,handler.argSchema)
+                if problem is None :
+                    result = self._call(cmd,handler.function,arg)
+                else :
+                    result = errorReply(f"Bad argument of {cmd}: {problem}")
+            elif self.commandInterpreter is not None :
+                # interpret the command:
+                result = self._call(cmd,self.commandInterpreter,cmd,arg)
+            else :
+                result = errorReply(f"Unknown command: {cmd}")
+            if verbose :
+                logger.debug("sending %s", result)
+        t2 = time.perf_counter_ns()
+        response = encodeMessage(result,codec)
+        self.stats.record(cmd, {DECODE:t1 - t0, INTERPRET:t2 - t1, ENCODE:time.perf_counter_ns() - t2},
+                          len(response), len(received))
+        return response, codec
+
+    def _call(self, cmd:str, function:Callable, *args) -> Any :
+        '''
+        Call a handler; if it fails, the failure is logged and reported back to the
+        client, rather than ending the session.
+        '''
+        try:
+            return function(*args)
+        except Exception as e:
+            logger.exception("Serving %s failed", cmd)
+            return errorReply(f"{cmd} failed: {e}")
+
+    def _serve(self, clientSocket:socket.socket, addr, receiveBufferSize:int) -> None :
+        '''
+        Serve the commands of a single connected client, until it leaves.
         '''
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((self.host,self.port))
-            s.listen()
-            print(f"> Starting a sever at {self.host}:{self.port}")
+        with clientSocket:
+            print(f"> CONNECTED by {addr}")
+            channel = SocketChannel(clientSocket,self.framing,receiveBufferSize)
+            codec = JSON_CODEC
+            while True:
+                received = channel.readFrame()
+                if received is None:
+                    print(f"> The client {addr} left.")
+                    break
+                # send result back to the client; the channel takes care of
+                # delimiting it, so that the client knows where it ends:
+                response, newCodec = self._interpret(received,codec)
+                channel.writeFrame(response)
+                if newCodec != codec :
+                    codec = newCodec
+                    channel.framing = LENGTH_FRAMING
+
+    def _deploySingleClient(self, receiveBufferSize:int) -> None :
+        with listen(self.endpoint,reuseAddress=False) as s:
+            print(f"> Starting a sever at {self.endpoint}")
             clientSocket, addr = s.accept()
-            with clientSocket:
-                print(f"> CONNECTED by {addr}")
-                while True:
-                    received = clientSocket.recv(receiveBufferSize) 
-                    if not received:
-                        print("> CLOSING the server.")
-                        break
-                    text = received.decode("utf-8")
-                    myjson = json.loads(text)
-                    cmd = myjson["cmd"] # the command-string
-                    arg = myjson["arg"] # the arg-object, represented as a nested Dictionary
-                    if debug :
-                        #print(f"> receiving {text}")
-                        print(f"> receiving cmd: {cmd}")
-                        print(f">           arg: {arg}")
-                        
-                    # interpret the command:
-                    result =  self.commandInterpreter(cmd,arg)   
-                    resultJson = json.dumps(result) 
-                    # send result back to the client:
-                    # need to add that newline-char at the end, else the client does not
-                    # know that the string that was sent has ended:
-                    clientSocket.sendall(bytes(resultJson  + "\n",encoding="utf-8"))
-                    if debug :
-                        print(f"> sending {resultJson}")
-            s.close()
+            configure(clientSocket,self.endpoint)
+            self._serve(clientSocket,addr,receiveBufferSize)
+            print("> CLOSING the server.")
+        removeSocketFile(self.endpoint)
+
+    def _deployThreaded(self, receiveBufferSize:int, pollInterval:float=0.2) -> None :
+        freeConnections = threading.BoundedSemaphore(self.maxConnections)
+        def serveAndRelease(clientSocket, addr):
+            try:
+                self._serve(clientSocket,addr,receiveBufferSize)
+            finally:
+                freeConnections.release()
+
+        # the listening socket is closed first, then we wait for the sessions to end:
+        with ThreadPoolExecutor(max_workers=self.maxConnections) as pool, \
+             listen(self.endpoint) as s:
+            # we poll, so that a shutdown-request is noticed while waiting:
+            s.settimeout(pollInterval)
+            print(f"> Starting a multi-client sever at {self.endpoint}")
+            while not self.shutdownRequested.is_set():
+                if not freeConnections.acquire(timeout=pollInterval):
+                    continue
+                try:
+                    clientSocket, addr = s.accept()
+                except socket.timeout:
+                    freeConnections.release()
+                    continue
+                clientSocket.settimeout(None)
+                configure(clientSocket,self.endpoint)
+                pool.submit(serveAndRelease,clientSocket,addr)
+            print("> SHUTTING DOWN; waiting for the connected clients to leave.")
+            removeSocketFile(self.endpoint)
+        print("> CLOSING the server.")
+
+    async def _deployAsync(self) -> None :
+        import asyncio
+        freeConnections = asyncio.Semaphore(self.maxConnections)
+        sessions = set()
+
+        async def serve(reader:"asyncio.StreamReader", writer:"asyncio.StreamWriter"):
+            addr = writer.get_extra_info("peername")
+            sessions.add(asyncio.current_task())
+            try:
+                async with freeConnections:
+                    print(f"> CONNECTED by {addr}")
+                    framing = self.framing
+                    codec = JSON_CODEC
+                    while True:
+                        received = await readFrameAsync(reader,framing)
+                        if received is None:
+                            print(f"> The client {addr} left.")
+                            break
+                        response, newCodec = await loop.run_in_executor(interpreters,self._interpret,received,codec)
+                        writer.write(encodeFrame(response,framing))
+                        await writer.drain()
+                        if newCodec != codec :
+                            codec = newCodec
+                            framing = LENGTH_FRAMING
+            finally:
+                writer.close()
+                sessions.discard(asyncio.current_task())
+
+        loop = asyncio.get_running_loop()
+        # a session has at most one command in progress, so this many threads suffice:
+        interpreters = ThreadPoolExecutor(max_workers=self.maxConnections)
+        stopping = asyncio.Event()
+        # shutdown() may be called from any thread, e.g. from an interpreter-thread:
+        self.wakeUpOnShutdown = lambda : loop.call_soon_threadsafe(stopping.set)
+        try:
+            server = await startServer(serve, self.endpoint)
+            print(f"> Starting a multi-client sever at {self.endpoint}")
+            if not self.shutdownRequested.is_set() :
+                await stopping.wait()
+            print("> SHUTTING DOWN; waiting for the connected clients to leave.")
+            server.close()
+            await server.wait_closed()
+            removeSocketFile(self.endpoint)
+            if sessions :
+                await asyncio.gather(*sessions, return_exceptions=True)
+        finally:
+            self.wakeUpOnShutdown = None
+            interpreters.shutdown()
+        print("> CLOSING the server.")
 
 
 # just for testing:
@@ -96,5 +374,6 @@ if __name__ == '__main__':
         return xxx
 
     server = CommandServer(HOST,PORT)
+    server.registerHandler("GET_HERO", lambda arg : { "id":arg, "name":"Batman" }, argSchema=int)
     server.attachInterpreter(testCmdInterpreter)
     server.deploy()        
@@ -1,6 +1,7 @@
-from qlearning   import Qlearning
-from sqworld_env import SqWorldEnv
-import gymenv_client
+from japyre.qlearning   import Qlearning
+from japyre.sqworld_env import SqWorldEnv
+from japyre.instrumentation import formatSnapshot
+import logging
 
 # This demonstrates an example of applying a Python-side RL algorithm
 # on a Gym-env in Java.
@@ -16,7 +17,8 @@ import gymenv_client
 # the Python-Java connection.
 #
 
-gymenv_client.debug = False
+# To see every message exchanged with the Java-side, turn on debug-logging:
+#logging.basicConfig(level=logging.DEBUG)
 
 # Run a Python-side client that would connect to the Java-side server of
 # SquareWorld Gym. This client then also provides a Gym-env like interface
@@ -35,10 +37,22 @@ def convertToIndex(obs) :
     y = obs[1]
     return ((x+1) * N_plus_2) + y +1
 qalg.stateIndexer = convertToIndex    
+# Alternatively, use a sparse Q-table. It allocates a row for a state when the state
+# is first visited, and identifies states by the observations themselves, so no
+# indexing function is needed:
+#qalg = Qlearning(None, len(env.javaGym.actionSpace))
 
 # Ok.. now we can run the Q-learning algorithm to train it:
 print("====== Training...")
 qalg.learn(env,maxNumberOfSteps=2000,verbose=True)
+# Alternatively, learn from minibatches replayed from a buffer of past transitions,
+# to get more learning out of every step on the Java-side:
+#from japyre.replay_buffer import ReplayBuffer
+#qalg.learn(env,maxNumberOfSteps=500,verbose=True,replay=ReplayBuffer(10000,prioritized=True),updatesPerStep=4)
+# Or plan Dyna-style: record the transitions in a model of the gym, and after every
+# step on the Java-side do e.g. 20 simulated updates from that model:
+#from japyre.transition_model import TransitionModel
+#qalg.learn(env,maxNumberOfSteps=300,verbose=True,model=TransitionModel(10000),planningSteps=20)
 
 # Training is done, now we obtain a sequence of action that
 # use the trained model:
@@ -47,6 +61,8 @@ print("====== Demonstrating trained skill ...")
 seq = qalg.getRun(env,10,verbose=True)
 print("======")
 print(f"obtained run: {seq}")
+# the time spent per command, e.g. waiting for the Java-side:
+print(formatSnapshot(env.javaGym.stats.snapshot()))
 env.close()
 
 
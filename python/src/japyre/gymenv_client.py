@@ -1,10 +1,38 @@
-import socket
-import json
+import copy
+import time
+import logging
 from typing import Any, Callable, Dict
+from .socketchannel import SocketChannel, LINE_FRAMING, LENGTH_FRAMING
+from .codec import JSON_CODEC, SET_CODEC, encodeMessage, decodeMessage
+from .shm_ring import SharedRing, SHM_OPEN
+from .transport import parseAddress, connect
+from .recording import Recorder
+from .instrumentation import Instrumentation, STATS, ENCODE, WAIT, DECODE
+from .transition_cache import TransitionCache
 
 HOST = "127.0.0.1"  # Standard loopback interface address (localhost)
 PORT = 9999         # Port to listen on (non-privileged ports are > 1023)
-debug = False 
+logger = logging.getLogger(__name__)
+
+PING = "PING"  # a cheap command to check that a server is alive; it answers OK__
+
+def parseResponse(cmd,receivedJson):
+    '''
+    Convert the GymEnvServer's Json-response to the command cmd to the form that
+    GymEnvClient.sendCommand() returns.
+    '''
+    if cmd == "RESET" :
+        return receivedJson
+    if cmd == "STEP" :
+        observation = receivedJson["obs"]
+        reward = receivedJson["rw"]
+        episodeDone = receivedJson["end"]
+        return (observation,reward,episodeDone,None)
+    if cmd == "STEP_BATCH" :
+        return [ (r["obs"],r["rw"],r["end"]) for r in receivedJson ]
+    if cmd == "GET_ACTIONSPACE" or cmd == SET_CODEC or cmd == SHM_OPEN or cmd == STATS or cmd == PING :
+        return receivedJson
+    return None
 
 class GymEnvClient:
     '''
@@ -23,49 +51,219 @@ class GymEnvClient:
     will be represented either primitive value, or as dictionaries (possibly nested) of 
     name-value pairs. You will need to convert them to suitable datatypes expected by 
     your RL algorithm.
+
+    Every command is timed: self.stats keeps, per command, latency-histograms of
+    encoding it, waiting for the response, and decoding that, along with the bytes
+    sent and received; see instrumentation.py. The messages themselves are logged at
+    the DEBUG level, to the logger "japyre.gymenv_client".
+
+    For a deterministic Java-side gym, whose state is fully determined by its last
+    observation (as SquareWorld's is), a transition cache can be turned on: step()
+    then answers an (observation,action) pair it has seen before from the cache,
+    without a round-trip. The server is kept in sync lazily: the actions answered
+    from the cache are kept pending, and are sent along with the next action that
+    misses the cache, in a single STEP_BATCH (or before any other command; a reset
+    simply drops them, unless the session is being recorded). The server's answers to the pending actions are checked
+    against the cache, and counted as mismatches when they differ. See cacheStats().
     '''
 
-    def __init__(self,host,port,receiveBufferSize=4096):
+    def __init__(self,host,port=None,receiveBufferSize=4096,framing=LINE_FRAMING,codec=JSON_CODEC,
+                 sharedMemorySize=0,sharedMemoryThreshold=4096,transitionCacheSize=0):
+        '''
+        Create a client and connect it to the GymEnvServer at the given host and port.
+        The host can also be an address-URI such as "unix:///tmp/gym.sock" or
+        "tcp://127.0.0.1:9999?sndbuf=262144"; the port is then not needed. See transport.py.
+
+        Parameters:
+        receiveBufferSize (int): the initial size of the receive-buffer. It grows
+                                 automatically when a bigger message arrives.
+        framing (str): how messages are delimited on the socket; "line" (the default,
+                       as used by the Java-side GymEnvServer) or "length".
+        codec (str): how messages are encoded; "json" (the default) or "binary". A
+                       codec other than Json is asked from the server when connecting;
+                       the one the server agreed to is in self.codec. See codec.py.
+        sharedMemorySize (int): if positive, a shared-memory ring of this many bytes is
+                       offered to the server (which must run on the same host). Arrays
+                       of at least sharedMemoryThreshold bytes in observations are then
+                       passed through the ring, and returned as read-only NumPy views
+                       on it, without copying. See shm_ring.py for how long such a view
+                       stays valid.
+        transitionCacheSize (int): if positive, a transition cache of at most this many
+                       transitions is used; only use this with a deterministic gym.
+        '''
         self.host = host 
         self.port = port
         self.receiveBufferSize = receiveBufferSize
-        self.socket = socket.socket()
+        self.codec = JSON_CODEC
+        self.ring = None
+        self.recorder = None
+        self.lastArg = None
+        self.stats = Instrumentation()
+        self.cache = TransitionCache(transitionCacheSize) if transitionCacheSize > 0 else None
+        self.lastObservation = None
+        # (cache-key,action) of the steps answered from the cache, not yet sent to the server:
+        self.pendingActions = []
+        # the timings of the command in flight:
+        self.encodeNanos = 0
+        self.sentAt = 0
+        self.bytesSent = 0
+        self.endpoint = parseAddress(host,port)
         # connect to the Java-side GymEnvServer:
-        self.socket.connect((host,port))
+        self.socket = connect(self.endpoint)
+        self.channel = SocketChannel(self.socket,framing,receiveBufferSize)
+        if codec != JSON_CODEC :
+            self.negotiateCodec(codec)
+        if sharedMemorySize > 0 :
+            self.openSharedMemory(sharedMemorySize,sharedMemoryThreshold)
         self.actionSpace = self.sendCommand("GET_ACTIONSPACE") 
 
+    def negotiateCodec(self,codec):
+        '''
+        Ask the server to switch to the given codec. If the server agrees, the
+        client switches too, along with the length-framing; otherwise Json is
+        kept. Returns the codec used from now on.
+        '''
+        agreed = self.sendCommand(SET_CODEC,[codec,JSON_CODEC])
+        if agreed is not None and agreed != JSON_CODEC :
+            self.codec = agreed
+            self.channel.framing = LENGTH_FRAMING
+        return self.codec
+
+    def openSharedMemory(self,size,threshold=4096):
+        '''
+        Create a shared-memory ring of the given size, and ask the server to put arrays
+        of at least threshold bytes there. Returns True if the server agreed; a server
+        that does not support this (such as the Java-side GymEnvServer, for now) keeps
+        sending everything over the socket.
+        '''
+        ring = SharedRing.create(size)
+        try:
+            reply = self.sendCommand(SHM_OPEN,{"path":ring.path, "threshold":threshold})
+        finally:
+            # the server has mapped the ring by now (or will never), so the file
+            # itself is not needed anymore:
+            ring.unlink()
+        if reply != "OK__" :
+            ring.close()
+            return False
+        self.ring = ring
+        return True
+
+    def startRecording(self,fname,chunkSize=1<<20,compressLevel=6):
+        '''
+        Start recording the commands sent to the GymEnvServer, along with its responses,
+        to the given file (which is appended to, if it exists). The recorded episodes
+        can later be replayed with recording.RecordedGymEnv, without a server. The file
+        is written by a background thread; see recording.Recorder.
+
+        While recording, steps answered from a transition cache are still sent to the
+        server before a RESET, CLOSE or KILL (rather than dropped), so that the
+        recorded episodes are complete.
+        '''
+        self.stopRecording()
+        if self.pendingActions :
+            # these belong to the time before the recording:
+            self._sendPendingActions([])
+        self.recorder = Recorder(fname, meta={"actionSpace":self.actionSpace},
+                                 chunkSize=chunkSize, compressLevel=compressLevel)
+        return self.recorder
+
+    def stopRecording(self):
+        '''
+        Stop recording, and write out what is still buffered.
+        '''
+        if self.recorder is not None :
+            if self.pendingActions :
+                self._sendPendingActions([])
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
 
     def sendCommand(self,cmd,arg=None):
         '''
-        Send a command to the GymEnvServer.
+        Send a command to the GymEnvServer, and wait for its response.
 
         Parameters:
            cmd (str) : the name of the command
            arg       : an argument to send along with the command; it can be
                        a primitive value e.g. a string, or a dictionary.
         '''
-        pckg     = {"cmd":cmd, "arg":arg}
-        jsonPckg = json.dumps(pckg) 
-        self.socket.sendall(bytes(jsonPckg  + "\n",encoding="utf-8"))
-        if debug :
-            print(f"> sending {jsonPckg}")
+        self.sendRequest(cmd,arg)
         if cmd == "KILL" :
             return None
-        received = self.socket.recv(self.receiveBufferSize)     
-        text = received.decode("utf-8")
-        receivedJson = json.loads(text)
-        if debug :
-            print(f"> receiving {receivedJson}")
-        if cmd == "RESET" :
-            return receivedJson
-        if cmd == "STEP" :
-            observation = receivedJson["obs"]
-            reward = receivedJson["rw"]
-            episodeDone = receivedJson["end"]
-            return (observation,reward,episodeDone,None)
-        if cmd == "GET_ACTIONSPACE" :
-            return receivedJson
-        return None
+        return self.receiveResponse(cmd)
+
+    def sendRequest(self,cmd,arg=None):
+        '''
+        Send a command to the GymEnvServer, without waiting for its response. The
+        response must later be collected with receiveResponse(cmd). This allows
+        a command to be sent to many servers first, before waiting for any of them.
+        '''
+        if self.pendingActions :
+            if (cmd == "RESET" or cmd == "CLOSE" or cmd == "KILL") and self.recorder is None :
+                # these make the pending steps irrelevant (unless they are to be recorded):
+                self.pendingActions = []
+            else :
+                self._sendPendingActions([])
+        pckg = {"cmd":cmd, "arg":arg}
+        self.lastArg = arg
+        t0 = time.perf_counter_ns()
+        message = encodeMessage(pckg,self.codec)
+        self.sentAt = time.perf_counter_ns()
+        self.encodeNanos = self.sentAt - t0
+        self.bytesSent = len(message)
+        self.channel.writeFrame(message)
+        if logger.isEnabledFor(logging.DEBUG) :
+            logger.debug("sending %s", pckg)
+
+    def receiveResponse(self,cmd):
+        '''
+        Wait for the GymEnvServer's response to a command cmd that was sent earlier
+        with sendRequest(), and return it in the same form as sendCommand() does.
+        '''
+        received = self.channel.readFrame()
+        if received is None :
+            raise ConnectionError("The GymEnvServer has closed the connection.")
+        t0 = time.perf_counter_ns()
+        receivedJson = decodeMessage(received,self.codec)
+        if self.ring is not None :
+            receivedJson = self.ring.resolve(receivedJson)
+        if logger.isEnabledFor(logging.DEBUG) :
+            logger.debug("receiving %s", receivedJson)
+        response = parseResponse(cmd,receivedJson)
+        t1 = time.perf_counter_ns()
+        self.stats.record(cmd, {ENCODE:self.encodeNanos, WAIT:t0 - self.sentAt, DECODE:t1 - t0},
+                          self.bytesSent, len(received))
+        if self.recorder is not None :
+            # views on the shared-memory ring would be overwritten before the recorder
+            # gets to them:
+            self.recorder.record(cmd, self.lastArg,
+                                 copy.deepcopy(response) if self.ring is not None else response)
+        return response
+
+    def ping(self,timeout=None):
+        '''
+        Check that the server is alive and answers; returns True if so. A server that
+        does not know PING (an older Java-side GymEnvServer) does not answer at all,
+        so only use this on servers that do.
+
+        If a timeout (in seconds) is given, a socket.timeout is raised when the server
+        has not answered by then. The connection should then no longer be used, as a
+        late answer would be taken for the answer to the next command.
+        '''
+        self.socket.settimeout(timeout)
+        try:
+            return self.sendCommand(PING) == "OK__"
+        finally:
+            self.socket.settimeout(None)
+
+    def serverStats(self):
+        '''
+        Ask the server for its own statistics of the commands it served (see
+        instrumentation.Instrumentation.snapshot()). The client's statistics are
+        in self.stats.
+        '''
+        return self.sendCommand(STATS)
 
     def reset(self) :
         '''
@@ -74,6 +272,8 @@ class GymEnvClient:
         Observation is returned either as a privitive value, or as a Dictionary.
         '''
         o = self.sendCommand("RESET")
+        if self.cache is not None :
+            self.lastObservation = self._keepable(o)
         return o 
 
     def softClose(self):
@@ -87,9 +287,12 @@ class GymEnvClient:
         '''
         Close the Java-side GymEnv and the GymEnvServer that runs it.
         '''
+        self.stopRecording()
         self.sendCommand("CLOSE")    
         self.sendCommand("KILL")    
         self.socket.close()
+        if self.ring is not None :
+            self.ring.close()
 
     def step(self,action):
         '''
@@ -99,9 +302,111 @@ class GymEnvClient:
         for the action; done is true if the new state is terminal; and
         info is additional information, if there is any.
         Observation is returned either as a privitive value, or as a Dictionary.
+
+        With a transition cache, the answer may come from the cache; the observation
+        is then the same object as returned earlier, so it should not be modified.
+        If, when the pending actions are sent, the server turns out to reach a terminal
+        state earlier than the cache predicted, the given action is not done: the
+        server's last observation is returned, with a zero reward, done=True, and the
+        info {"truncated":True, "cacheMismatch":True}.
+        '''
+        if self.cache is None or self.lastObservation is None :
+            o = self.sendCommand("STEP",action)
+            return o  
+        key = TransitionCache.key(self.lastObservation,action)
+        cached = self.cache.lookup(key)
+        if cached is not None :
+            self.pendingActions.append((key,action))
+            obs,reward,done = cached
+            self.lastObservation = obs
+            return (obs,reward,done,None)
+        if self.pendingActions :
+            numberOfPending = len(self.pendingActions)
+            mismatchesBefore = self.cache.mismatches
+            results = self._sendPendingActions([(key,action)])
+            if len(results) <= numberOfPending :
+                # the episode ended before the action could be done:
+                return self._truncatedStep(results)
+            obs,reward,done = results[-1]
+            r = (obs,reward,done,None)
+            if self.cache.mismatches != mismatchesBefore :
+                # the server was not in the state the cache predicted, so key does not
+                # describe the transition the server actually did; do not cache it:
+                self.lastObservation = self._keepable(obs)
+                return r
+        else :
+            r = self.sendCommand("STEP",action)
+            if r is None :
+                return r
+            obs,reward,done,_ = r
+        obs = self._keepable(obs)
+        self.cache.store(key,obs,reward,done)
+        self.lastObservation = obs
+        return r
+
+    def _keepable(self,obs):
+        '''
+        A version of the observation that can be kept in the cache: arrays that are
+        views on the shared-memory ring are overwritten later, so they are copied.
+        '''
+        return copy.deepcopy(obs) if self.ring is not None else obs
+
+    def _truncatedStep(self,results):
+        '''
+        The answer to a step that was not done, because the server reached a terminal
+        state while doing the pending actions before it.
+        '''
+        if results :
+            obs = self._keepable(results[-1][0])
+            self.lastObservation = obs
+        else :
+            # the server was already in a terminal state, whose observation is unknown;
+            # the cache is not used again until the next reset:
+            obs = self.lastObservation
+            self.lastObservation = None
+        return (obs, 0.0, True, {"truncated":True, "cacheMismatch":True})
+
+    def _sendPendingActions(self,more):
+        '''
+        Send the pending actions, followed by the given (key,action) pairs, to the server
+        in one STEP_BATCH, and check the answers to the pending ones against the cache.
+        Returns the server's answers; the server stops at the first terminal state, so
+        there may be fewer answers than actions sent.
+        '''
+        batch = self.pendingActions + more
+        self.pendingActions = []
+        results = self.sendCommand("STEP_BATCH",[ a for _,a in batch ])
+        for (key,_),(obs,reward,done) in zip(batch[:len(batch)-len(more)],results) :
+            self.cache.verify(key,obs,reward,done)
+        if len(results) < len(batch) :
+            # the server reached a terminal state earlier than the cache predicted:
+            self.cache.mismatches += 1
+        return results
+
+    def cacheStats(self):
+        '''
+        The counters of the transition cache (see TransitionCache.stats()), and the
+        number of pending actions; None if there is no cache.
+        '''
+        if self.cache is None :
+            return None
+        stats = self.cache.stats()
+        stats["pending"] = len(self.pendingActions)
+        return stats
+
+    def step_many(self,actions):
+        '''
+        Command the Java-side GymEnv to execute the given sequence of actions, one
+        after another, in a single round-trip. The method returns a list of tuples
+        (obs,r,done), one for each executed action. The execution stops at the first
+        terminal state, so the list can be shorter than the given sequence of actions.
+        This is useful to e.g. do an open-loop rollout, or to replay a run, without
+        paying for a socket round-trip for every step.
         '''
-        o = self.sendCommand("STEP",action)
-        return o  
+        results = self.sendCommand("STEP_BATCH",list(actions))
+        if self.cache is not None and results :
+            self.lastObservation = self._keepable(results[-1][0])
+        return results
 
 
 # just for testing:
@@ -0,0 +1,180 @@
+import time
+import logging
+import threading
+import argparse
+from typing import Any
+from .socketchannel import SocketChannel, LINE_FRAMING, LENGTH_FRAMING
+from .codec import JSON_CODEC, SET_CODEC, chooseCodec, encodeMessage, decodeMessage
+from .shm_ring import SharedRing, SHM_OPEN
+from .transport import parseAddress, listen, configure, removeSocketFile
+from .squareworld import SquareWorld
+from .gymenv_client import PING
+from .instrumentation import Instrumentation, STATS, DECODE, INTERPRET, ENCODE
+
+HOST = "127.0.0.1"  # Standard loopback interface address (localhost)
+PORT = 9999         # Port to listen on (non-privileged ports are > 1023)
+
+OK_ = "OK__"
+
+logger = logging.getLogger(__name__)
+
+def stepData(r) -> Any :
+    '''
+    Convert a (obs,reward,done) tuple returned by a gym's step() to the Json-object
+    the Java-side RLStepData is serialized to.
+    '''
+    if r is None :
+        return None
+    obs,reward,done = r
+    return { "obs":obs, "rw":reward, "end":done, "etc":None }
+
+class GymEnvServer:
+    '''
+    A Python-side stand-in for the Java class GymEnvServer. It deploys a gym as a
+    server that speaks the same protocol as the Java-side GymEnvServer, so that
+    GymEnvClient (and everything built on it) can be run and tested without a JVM.
+
+    The served gym should provide the same methods as the Java interface IJavaGymEnv:
+        reset() : reset the gym and return the initial observation
+        close() : close the gym
+        actionSpace() : return the list of action-names
+        step(action) : do the action, and return a tuple (obs,reward,done), or None
+                       if no action is possible anymore.
+    See the class SquareWorld for an example.
+
+    To mimic a slower (e.g. a game-based) Java-side gym, a synthetic latency can be
+    added to every command. The server binds its socket when it is created; with
+    port 0 a free port is chosen, which is then available in self.port. Like the
+    clients, the server can also be given an address-URI such as "unix:///tmp/gym.sock",
+    see transport.py.
+
+    Unlike the Java-side GymEnvServer, this server also accepts the binary codec
+    (see codec.py), when a client asks for it with SET_CODEC, and can put large arrays
+    in observations in a shared-memory ring (see shm_ring.py), when a client on the
+    same host offers one with SHM_OPEN. Like CommandServer, it times the commands it
+    serves (see instrumentation.py), and sends the statistics back on STATS.
+    '''
+
+    def __init__(self, host:str, port:int, gymEnv, framing:str=LINE_FRAMING, latency:float=0.0):
+        '''
+        Parameters:
+        latency (float): the number of seconds the server waits before answering a command
+        '''
+        self.host = host
+        self.gymEnv = gymEnv
+        self.framing = framing
+        self.latency = latency
+        self.endpoint = parseAddress(host,port)
+        self.serversocket = listen(self.endpoint)
+        self.port = self.endpoint.port
+        self.stats = Instrumentation()
+
+    def startInBackground(self) -> threading.Thread :
+        '''
+        Run start() in a daemon thread, and return the thread.
+        '''
+        t = threading.Thread(target=self.start, daemon=True)
+        t.start()
+        return t
+
+    def start(self) -> None :
+        '''
+        Accept a single client, and serve its commands until it sends KILL or leaves.
+        '''
+        print(f"> Starting a GymEnv-server at {self.endpoint}")
+        clientSocket, addr = self.serversocket.accept()
+        # e.g. TCP_NODELAY, so that responses are not held back by Nagle's algorithm:
+        configure(clientSocket,self.endpoint)
+        with clientSocket :
+            channel = SocketChannel(clientSocket,self.framing)
+            codec = JSON_CODEC
+            ring = None
+            threshold = 0
+            while True :
+                received = channel.readFrame()
+                if received is None :
+                    print("> The client left.")
+                    break
+                t0 = time.perf_counter_ns()
+                command = decodeMessage(received,codec)
+                cmd = command["cmd"]
+                arg = command["arg"]
+                if logger.isEnabledFor(logging.DEBUG) :
+                    logger.debug("receiving cmd: %s, arg: %s", cmd, arg)
+                if cmd == "KILL" :
+                    break
+                if cmd == SET_CODEC :
+                    # the answer is still sent in the current codec, then we switch:
+                    agreed = chooseCodec(arg)
+                    channel.writeFrame(encodeMessage(agreed,codec))
+                    if agreed != JSON_CODEC :
+                        codec = agreed
+                        channel.framing = LENGTH_FRAMING
+                    continue
+                if cmd == PING :
+                    channel.writeFrame(encodeMessage(OK_,codec))
+                    continue
+                if cmd == SHM_OPEN :
+                    ring = SharedRing.attach(arg["path"])
+                    threshold = arg["threshold"]
+                    channel.writeFrame(encodeMessage(OK_,codec))
+                    continue
+                t1 = time.perf_counter_ns()
+                if cmd == STATS :
+                    result = self.stats.snapshot()
+                else :
+                    if self.latency > 0 :
+                        time.sleep(self.latency)
+                    result = self.interpret(cmd,arg)
+                t2 = time.perf_counter_ns()
+                if ring is not None :
+                    result = ring.export(result,threshold)
+                response = encodeMessage(result,codec)
+                self.stats.record(cmd, {DECODE:t1 - t0, INTERPRET:t2 - t1, ENCODE:time.perf_counter_ns() - t2},
+                                  len(response), len(received))
+                channel.writeFrame(response)
+            if ring is not None :
+                ring.close()
+        print("> Closing GymEnv-server...")
+        self.serversocket.close()
+        removeSocketFile(self.endpoint)
+
+    def interpret(self, cmd:str, arg) -> Any :
+        '''
+        Execute a single command on the served gym, and return the answer to be sent
+        back to the client.
+        '''
+        if cmd == "RESET" :
+            return self.gymEnv.reset()
+        if cmd == "CLOSE" :
+            self.gymEnv.close()
+            return OK_
+        if cmd == "GET_ACTIONSPACE" :
+            return self.gymEnv.actionSpace()
+        if cmd == "STEP" :
+            return stepData(self.gymEnv.step(arg))
+        if cmd == "STEP_BATCH" :
+            results = []
+            for action in arg :
+                r = self.gymEnv.step(action)
+                if r is None :
+                    break
+                results.append(stepData(r))
+                # stop at the first terminal state:
+                if r[2] :
+                    break
+            return results
+        return None
+
+
+# just for testing:
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a Python SquareWorld gym, as a stand-in for SquareWorldGymServer.")
+    parser.add_argument("--host", default=HOST, help="a host, or an address-URI such as unix:///tmp/gym.sock")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--size", type=int, default=6, help="the size of the square world")
+    parser.add_argument("--latency", type=float, default=0.0, help="synthetic latency per command, in seconds")
+    parser.add_argument("--padding", type=int, default=0, help="number of extra numbers in every observation")
+    args = parser.parse_args()
+    server = GymEnvServer(args.host,args.port,SquareWorld(args.size,args.padding),latency=args.latency)
+    server.start()
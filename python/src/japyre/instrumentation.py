@@ -0,0 +1,175 @@
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATS = "STATS"  # the command that asks a server for its statistics
+
+# The phases a command is timed in. At the client-side:
+ENCODE    = "encode"     # encoding the command
+WAIT      = "wait"       # from sending the command until its response has arrived
+DECODE    = "decode"     # decoding the response
+# and at the server-side, decode, then:
+INTERPRET = "interpret"  # executing the command
+# and encode.
+
+# The latency-histograms have a bucket for every power of two microseconds: bucket
+# i counts latencies t with 2^(i-1) <= t < 2^i microseconds (bucket 0 those below 1),
+# up to 2^(NUMBER_OF_BUCKETS-2) microseconds (about 9 minutes).
+NUMBER_OF_BUCKETS = 31
+
+class LatencyHistogram:
+    '''
+    A histogram of latencies, with exponentially growing buckets. Recording a latency
+    is a few integer operations, so this can be left on all the time; percentiles are
+    approximate (they are the upper bound of the bucket they fall in).
+    '''
+
+    def __init__(self):
+        self.buckets = [0] * NUMBER_OF_BUCKETS
+        self.count = 0
+        self.totalNanos = 0
+        self.maxNanos = 0
+
+    def record(self, nanos:int) -> None :
+        b = (nanos // 1000).bit_length()
+        self.buckets[b if b < NUMBER_OF_BUCKETS else NUMBER_OF_BUCKETS - 1] += 1
+        self.count += 1
+        self.totalNanos += nanos
+        if nanos > self.maxNanos :
+            self.maxNanos = nanos
+
+    def percentile(self, p:float) -> float :
+        '''
+        The p-th percentile (0 <= p <= 100) of the recorded latencies, in microseconds.
+        '''
+        if self.count == 0 :
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for b,n in enumerate(self.buckets) :
+            seen += n
+            if seen >= rank and n > 0 :
+                return float(min(1 << b, self.maxNanos / 1000))
+        return self.maxNanos / 1000
+
+    def snapshot(self) -> Dict :
+        return {
+            "count" : self.count,
+            "meanMicros" : self.totalNanos / self.count / 1000 if self.count > 0 else 0.0,
+            "p50Micros" : self.percentile(50),
+            "p99Micros" : self.percentile(99),
+            "maxMicros" : self.maxNanos / 1000,
+            "buckets" : list(self.buckets)
+        }
+
+class CommandStats:
+    '''
+    The statistics of a single command: a latency-histogram per phase, and the
+    number of bytes sent and received for it.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.phases : Dict[str,LatencyHistogram] = {}
+
+    def snapshot(self) -> Dict :
+        return {
+            "count" : self.count,
+            "bytesSent" : self.bytesSent,
+            "bytesReceived" : self.bytesReceived,
+            "phases" : { phase:h.snapshot() for phase,h in self.phases.items() }
+        }
+
+class Instrumentation:
+    '''
+    Keeps the statistics of the commands a client sent, or a server served: per
+    command, latency-histograms of its phases (see above), and byte-counters. Bytes
+    are those of the encoded messages, without the framing.
+
+    Hooks can be added to e.g. trace every command, or export the timings elsewhere.
+    A hook is called as hook(cmd,timings,bytesSent,bytesReceived) after every command,
+    where timings maps phases to nanoseconds; it should be quick, as it runs on the
+    path of the command.
+
+    Instrumentation is on by default; when disabled, record() returns immediately.
+    '''
+
+    def __init__(self, enabled:bool=True):
+        self.enabled = enabled
+        self.commands : Dict[str,CommandStats] = {}
+        self.hooks : List[Callable] = []
+        self.started = time.time()
+        # a server can serve several clients from different threads:
+        self.lock = threading.Lock()
+
+    def addHook(self, hook:Callable[[str,Dict[str,int],int,int],None]) -> None :
+        self.hooks.append(hook)
+
+    def removeHook(self, hook:Callable) -> None :
+        self.hooks.remove(hook)
+
+    def record(self, cmd:str, timings:Dict[str,int], bytesSent:int=0, bytesReceived:int=0) -> None :
+        '''
+        Record an executed command, with the nanoseconds spent in each of its phases.
+        '''
+        if not self.enabled :
+            return
+        with self.lock :
+            stats = self.commands.get(cmd)
+            if stats is None :
+                stats = self.commands[cmd] = CommandStats()
+            stats.count += 1
+            stats.bytesSent += bytesSent
+            stats.bytesReceived += bytesReceived
+            for phase,nanos in timings.items() :
+                h = stats.phases.get(phase)
+                if h is None :
+                    h = stats.phases[phase] = LatencyHistogram()
+                h.record(nanos)
+        for hook in self.hooks :
+            try:
+                hook(cmd,timings,bytesSent,bytesReceived)
+            except Exception:
+                logger.exception("An instrumentation hook failed on %s", cmd)
+
+    def reset(self) -> None :
+        with self.lock :
+            self.commands = {}
+            self.started = time.time()
+
+    def snapshot(self) -> Dict :
+        '''
+        The statistics so far, as a Json-serializable dictionary; this is also what
+        a server sends back on the command STATS.
+        '''
+        with self.lock :
+            commands = { cmd:stats.snapshot() for cmd,stats in self.commands.items() }
+        return {
+            "seconds" : time.time() - self.started,
+            "bytesSent" : sum(c["bytesSent"] for c in commands.values()),
+            "bytesReceived" : sum(c["bytesReceived"] for c in commands.values()),
+            "commands" : commands
+        }
+
+def formatSnapshot(snapshot:Dict) -> str :
+    '''
+    Format a snapshot as a table, for printing. Numbers missing from the snapshot (e.g.
+    one from an older server) are shown as "-".
+    '''
+    def number(d, key) :
+        v = d.get(key)
+        return f"{v:>10.1f}" if v is not None else f"{'-':>10}"
+    lines = [ f"{'command':<16}{'count':>9}{'phase':>11}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'max us':>10}" ]
+    for cmd,stats in sorted(snapshot.get("commands",{}).items()) :
+        first = True
+        for phase,h in stats.get("phases",{}).items() :
+            lines.append(f"{cmd if first else '':<16}{stats.get('count','-') if first else '':>9}{phase:>11}"
+                         f"{number(h,'meanMicros')}{number(h,'p50Micros')}{number(h,'p99Micros')}{number(h,'maxMicros')}")
+            first = False
+    lines.append(f"bytes sent: {snapshot.get('bytesSent','-')}, received: {snapshot.get('bytesReceived','-')}")
+    return "\n".join(lines)
@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+class MicroBatcher:
+    '''
+    Collects single requests, arriving concurrently from several threads, into
+    micro-batches that are handed to a batch-function in one call. This allows e.g.
+    a neural policy to do a single forward pass for many queries at once.
+
+    A batch is closed when it holds maxBatchSize requests, or when maxWaitMicros
+    microseconds have passed since its first request arrived, whichever comes first.
+    So, a request waits at most maxWaitMicros (plus the time to compute its batch)
+    for its answer. A larger window gives bigger batches and more throughput, but
+    adds latency; the counters reported by stats() help to tune it.
+    '''
+
+    def __init__(self, batchFunction:Callable[[List],List], maxBatchSize:int=32, maxWaitMicros:int=500):
+        '''
+        Parameters:
+        batchFunction : a function that takes a list of arguments, and returns a list
+                        of the same length, containing the answer for each argument
+        maxBatchSize (int) : the maximum number of requests in a batch
+        maxWaitMicros (int): how long a batch is kept open for more requests
+        '''
+        self.batchFunction = batchFunction
+        self.maxBatchSize = maxBatchSize
+        self.maxWaitMicros = maxWaitMicros
+        self.requests = queue.SimpleQueue()
+        self.worker = None
+        self.startLock = threading.Lock()
+        self.statsLock = threading.Lock()
+        self.resetStats()
+
+    def resetStats(self) -> None :
+        with self.statsLock :
+            self.numberOfRequests = 0
+            self.numberOfBatches = 0
+            self.largestBatch = 0
+            self.totalLatency = 0.0
+            self.totalComputeTime = 0.0
+            self.since = time.perf_counter()
+
+    def submit(self, arg) -> Any :
+        '''
+        Submit a single request, and wait for its answer. This can be called from
+        many threads at the same time.
+        '''
+        if self.worker is None :
+            with self.startLock :
+                if self.worker is None :
+                    self.worker = threading.Thread(target=self._run, daemon=True)
+                    self.worker.start()
+        future = Future()
+        self.requests.put((arg,future,time.perf_counter()))
+        return future.result()
+
+    def _run(self) -> None :
+        maxWait = self.maxWaitMicros / 1e6
+        while True :
+            first = self.requests.get()
+            if first is None :
+                return
+            batch = [first]
+            deadline = first[2] + maxWait
+            while len(batch) < self.maxBatchSize :
+                remaining = deadline - time.perf_counter()
+                try:
+                    r = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if r is None :
+                    # stop after this batch:
+                    self.requests.put(None)
+                    break
+                batch.append(r)
+            self._process(batch)
+
+    def _process(self, batch:List) -> None :
+        t0 = time.perf_counter()
+        try:
+            answers = self.batchFunction([ arg for (arg,_,_) in batch ])
+            if len(answers) != len(batch) :
+                raise ValueError(f"The batch-function returned {len(answers)} answers for {len(batch)} requests.")
+        except Exception as e:
+            for (_,future,_) in batch :
+                future.set_exception(e)
+            answers = None
+        t1 = time.perf_counter()
+        if answers is not None :
+            for (_,future,_),answer in zip(batch,answers) :
+                future.set_result(answer)
+        with self.statsLock :
+            self.numberOfRequests += len(batch)
+            self.numberOfBatches += 1
+            self.largestBatch = max(self.largestBatch,len(batch))
+            self.totalComputeTime += t1 - t0
+            self.totalLatency += sum(t1 - arrival for (_,_,arrival) in batch)
+
+    def stats(self) -> Dict :
+        '''
+        Return counters to judge the throughput-vs-latency trade-off of the batching:
+        the number of requests and batches, the mean and largest batch size, the mean
+        latency of a request (from submission to answer) and the mean time spent in
+        the batch-function per batch (both in microseconds), and the number of
+        requests served per second since the counters were (re)set.
+        '''
+        with self.statsLock :
+            elapsed = time.perf_counter() - self.since
+            n = self.numberOfRequests
+            b = self.numberOfBatches
+            return {
+                "requests" : n,
+                "batches" : b,
+                "meanBatchSize" : n / b if b > 0 else 0.0,
+                "largestBatch" : self.largestBatch,
+                "meanLatencyMicros" : 1e6 * self.totalLatency / n if n > 0 else 0.0,
+                "meanBatchComputeMicros" : 1e6 * self.totalComputeTime / b if b > 0 else 0.0,
+                "requestsPerSecond" : n / elapsed if elapsed > 0 else 0.0
+            }
+
+    def close(self) -> None :
+        '''
+        Stop the worker thread, after the requests already submitted are served.
+        '''
+        if self.worker is not None :
+            self.requests.put(None)
+            self.worker.join()
+            self.worker = None
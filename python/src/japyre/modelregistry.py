@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+class ModelRegistry:
+    '''
+    An in-process cache of loaded models, keyed by their model-id. A model is loaded
+    (through the given loader function) on the first request for it, and is then kept,
+    so that switching back and forth between models does not reload them from disk.
+
+    The cache holds at most `capacity` models, and optionally at most `memoryBudget`
+    bytes worth of models (as measured by the function sizeOf). When either limit is
+    exceeded, the least recently used models are evicted.
+
+    A model can be hot-swapped with hotSwap(): its new version is loaded in the
+    background, while the old version keeps serving; the registry then switches over
+    to the new version in one step. Queries that already obtained the old version
+    simply finish with it.
+
+    The registry can be used from several threads at the same time.
+    '''
+
+    def __init__(self, loader:Callable[[str],Any], capacity:int=4,
+                 memoryBudget:Optional[int]=None,
+                 sizeOf:Callable[[Any],int]=lambda model : getattr(model,"nbytes",0)):
+        '''
+        Parameters:
+        loader : a function that loads the model with the given id, and returns it
+        capacity (int) : the maximum number of models kept loaded
+        memoryBudget (int) : if given, the maximum total size, in bytes, of the models
+                             kept loaded
+        sizeOf : a function giving the size of a model in bytes; by default this is
+                 its attribute nbytes (as NumPy arrays have), or else 0
+        '''
+        self.loader = loader
+        self.capacity = capacity
+        self.memoryBudget = memoryBudget
+        self.sizeOf = sizeOf
+        self.models = OrderedDict()
+        self.sizes = {}
+        self.lock = threading.Lock()
+        # model-ids being loaded, mapped to an event that is set when the loading is done:
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.swaps = 0
+        self.totalLoadTime = 0.0
+
+    def _load(self, mId:str) -> Any :
+        t0 = time.perf_counter()
+        model = self.loader(mId)
+        t = time.perf_counter() - t0
+        size = self.sizeOf(model)
+        with self.lock :
+            self.loads += 1
+            self.totalLoadTime += t
+            self.models[mId] = model
+            self.models.move_to_end(mId)
+            self.sizes[mId] = size
+            self._evict()
+        return model
+
+    def _evict(self) -> None :
+        '''
+        Evict least recently used models until the limits are met again; the most
+        recently used model is never evicted. Must be called while holding self.lock.
+        '''
+        while len(self.models) > 1 and (len(self.models) > self.capacity or
+                (self.memoryBudget is not None and sum(self.sizes.values()) > self.memoryBudget)) :
+            mId,_ = self.models.popitem(last=False)
+            del self.sizes[mId]
+            self.evictions += 1
+
+    def get(self, mId:str) -> Any :
+        '''
+        Return the model with the given id, loading it first if it is not in the cache.
+        '''
+        while True :
+            with self.lock :
+                # (a loader may return None, e.g. when it loads the model elsewhere)
+                if mId in self.models :
+                    self.models.move_to_end(mId)
+                    self.hits += 1
+                    return self.models[mId]
+                done = self.loading.get(mId)
+                if done is None :
+                    # nobody is loading this model yet, so we will:
+                    self.misses += 1
+                    done = self.loading[mId] = threading.Event()
+                    break
+            # someone else is loading the model; wait for it, then try again:
+            done.wait()
+        try:
+            return self._load(mId)
+        finally:
+            with self.lock :
+                del self.loading[mId]
+            done.set()
+
+    def hotSwap(self, mId:str, background:bool=True) -> Optional[threading.Thread] :
+        '''
+        Load a (new version of) the model with the given id, and then replace the cached
+        version with it. With background=True the loading happens in a separate thread,
+        which is returned; meanwhile, requests are still served with the old version.
+        '''
+        def swap():
+            self._load(mId)
+            with self.lock :
+                self.swaps += 1
+        if not background :
+            swap()
+            return None
+        t = threading.Thread(target=swap, daemon=True)
+        t.start()
+        return t
+
+    def loadedModels(self) -> List[str] :
+        '''
+        Return the ids of the loaded models, from least to most recently used.
+        '''
+        with self.lock :
+            return list(self.models.keys())
+
+    def stats(self) -> Dict :
+        '''
+        Return the registry's counters: the number of cache hits and misses, the hit
+        rate, the number of loads and evictions and hot-swaps, the total and mean
+        load time in seconds, and the total size of the loaded models.
+        '''
+        with self.lock :
+            requests = self.hits + self.misses
+            return {
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "hitRate" : self.hits / requests if requests > 0 else 0.0,
+                "loads" : self.loads,
+                "evictions" : self.evictions,
+                "swaps" : self.swaps,
+                "totalLoadSeconds" : self.totalLoadTime,
+                "meanLoadSeconds" : self.totalLoadTime / self.loads if self.loads > 0 else 0.0,
+                "loadedModels" : len(self.models),
+                "loadedBytes" : sum(self.sizes.values())
+            }
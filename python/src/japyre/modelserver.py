@@ -1,5 +1,10 @@
-from commandserver import CommandServer
-from typing import Any, Callable, Dict
+import logging
+from .commandserver import CommandServer, errorReply
+from .microbatcher import MicroBatcher
+from .modelregistry import ModelRegistry
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
 
 class ModelServer:
     '''
@@ -10,42 +15,182 @@ class ModelServer:
     The client can send two commands: 
         LOAD model-id : the server is then supposed to load this model
         GETNEXTACTION arg: the server passes arg to the model to ask what the next action is
+    Other commands get an error reply (see CommandServer).
 
     To interaction with the model, two functions must be attached to this server:
         loader(mId) : a function that is responsible for laoading a model, when requested to do it
         nextActionGetter(arg) : a function that actually passes arg to the model and returns back the model answer.
 
     These two functions are attached to the server through the method attachNeededFunctions(). 
+
+    Alternatively, the server can keep several models loaded at once in a ModelRegistry,
+    see attachModelRegistry(). Clients can then also name the model they want to query,
+    and ask for a model to be hot-swapped.
+
+    By default the server serves a single client. It can also be deployed to serve
+    many clients (e.g. a fleet of test agents) at the same time; see deploy().
     '''
 
-    def __init__(self, host:str, port:int):
-        self.commandserver = server = CommandServer(host,port)
+    def __init__(self, host:str, port:Optional[int]=None, maxConnections:int=16):
+        self.commandserver = CommandServer(host,port,maxConnections=maxConnections)
+        self.batcher = None
+        self.registry = None
+        self.currentModelId = None
     
+    def _useBatching(self, batchFunction, maxBatchSize:int, maxWaitMicros:int) -> Callable :
+        '''
+        Replace the current micro-batcher (if any) with one over the given batch-function,
+        and return its submit-function.
+        '''
+        if self.batcher is not None :
+            self.batcher.close()
+            self.batcher = None
+        if batchFunction is None :
+            return None
+        self.batcher = MicroBatcher(batchFunction,maxBatchSize,maxWaitMicros)
+        return self.batcher.submit
+
     def attachNeededFunctions(self, 
                 loader : Callable[[str],Any],
-                nextActionGetter : Callable[[Dict],Any]) :
+                nextActionGetter : Callable[[Dict],Any] = None,
+                nextActionsGetter : Callable[[List[Dict]],List[Any]] = None,
+                maxBatchSize : int = 32,
+                maxWaitMicros : int = 500) :
         '''
         Attach these two functions to the server:
 
             loader(mId) : a function that is responsible for laoading a model, when requested to do it
             nextActionGetter(arg) : a function that actually passes arg to the model and returns back the model answer.
+
+        Instead of nextActionGetter, a batch-aware function can be attached:
+
+            nextActionsGetter(args) : a function that passes a list of args to the model at once,
+                                      and returns the list of the model's answers, in the same order.
+
+        GETNEXTACTION requests that arrive concurrently from several clients are then
+        collected into micro-batches of at most maxBatchSize requests, waiting at most
+        maxWaitMicros microseconds for a batch to fill up. Batching only pays off when the
+        server is deployed with a backend ("threads" or "asyncio"). Use batchingStats() to inspect the
+        resulting throughput and latency.
+        '''
+        if (nextActionGetter is None) == (nextActionsGetter is None) :
+            raise ValueError("Attach either a nextActionGetter or a nextActionsGetter.")
+        if nextActionsGetter is not None :
+            nextActionGetter = self._useBatching(nextActionsGetter,maxBatchSize,maxWaitMicros)
+        else :
+            self._useBatching(None,maxBatchSize,maxWaitMicros)
+        self.registry = None
+
+        def load(mId) :
+            loader(mId)
+            return True
+
+        server = self.commandserver
+        server.registerHandler("LOAD", load)
+        # asked for every step of an agent, so it takes the fast path:
+        server.registerHandler("GETNEXTACTION", nextActionGetter, fastPath=True)
+        server.unregisterHandler("GETNEXTACTION_OF")
+        server.unregisterHandler("SWAP")
+
+    def attachModelRegistry(self,
+                registry : ModelRegistry,
+                nextActionGetter : Callable[[Any,Dict],Any] = None,
+                nextActionsGetter : Callable[[Any,List[Dict]],List[Any]] = None,
+                maxBatchSize : int = 32,
+                maxWaitMicros : int = 500) :
+        '''
+        Serve the models held by the given registry. The registry's loader must return
+        the loaded model. The function nextActionGetter(model,arg) passes arg to the given
+        model and returns the model's answer. As in attachNeededFunctions(), a batch-aware
+        nextActionsGetter(model,args) can be given instead; a micro-batch is then split
+        per model before it is passed to it.
+
+        The server then understands these commands:
+            LOAD model-id : load the model (if it is not cached yet), and make it the current model
+            GETNEXTACTION arg : ask the current model what the next action is; before any
+                                LOAD, this gets an error reply
+            GETNEXTACTION_OF {"model":model-id, "arg":arg} : ask the named model what the next action is
+            SWAP model-id : reload the model in the background, and switch over to the new
+                            version when it is loaded; meanwhile the old version keeps serving
+
+        Note that the current model is shared by all connected clients; clients that use
+        different models should name them with GETNEXTACTION_OF.
         '''
+        if (nextActionGetter is None) == (nextActionsGetter is None) :
+            raise ValueError("Attach either a nextActionGetter or a nextActionsGetter.")
+        self.registry = registry
+        self.currentModelId = None
+        if nextActionsGetter is not None :
+            def batchFunction(requests:List) -> List :
+                # group the requests per model:
+                groups = {}
+                for k,(mId,_) in enumerate(requests) :
+                    groups.setdefault(mId,[]).append(k)
+                answers = [None] * len(requests)
+                for mId,ks in groups.items() :
+                    try:
+                        modelAnswers = nextActionsGetter(registry.get(mId), [ requests[k][1] for k in ks ])
+                    except Exception as e:
+                        # only the requests for this model fail, not the whole batch:
+                        logger.exception("Querying model %s failed", mId)
+                        modelAnswers = [ errorReply(f"Querying model {mId} failed: {e}") ] * len(ks)
+                    for k,answer in zip(ks,modelAnswers) :
+                        answers[k] = answer
+                return answers
+            submit = self._useBatching(batchFunction,maxBatchSize,maxWaitMicros)
+            query = lambda mId,arg : submit((mId,arg))
+        else :
+            self._useBatching(None,maxBatchSize,maxWaitMicros)
+            query = lambda mId,arg : nextActionGetter(registry.get(mId),arg)
+
+        def load(mId) :
+            registry.get(mId)
+            self.currentModelId = mId
+            return True
+
+        def swap(mId) :
+            registry.hotSwap(mId)
+            return True
 
-        def act(cmd:str,arg):
-            if cmd=="LOAD" :
-                loader(arg)
-                return True
-            if cmd=="GETNEXTACTION" :
-                nextAction = nextActionGetter(arg) 
-                return nextAction
+        def queryCurrent(arg) :
+            mId = self.currentModelId
+            if mId is None :
+                return errorReply("No model is loaded; send LOAD first.")
+            return query(mId,arg)
 
-        self.commandserver.attachInterpreter(lambda cmd,arg: act(cmd,arg))
+        server = self.commandserver
+        server.registerHandler("LOAD", load)
+        server.registerHandler("GETNEXTACTION", queryCurrent, fastPath=True)
+        server.registerHandler("GETNEXTACTION_OF", lambda req : query(req["model"],req["arg"]),
+                               argSchema={ "model":object, "arg":object })
+        server.registerHandler("SWAP", swap)
+
+    def registryStats(self) -> Optional[Dict] :
+        '''
+        Return the counters of the attached model registry (see ModelRegistry.stats()),
+        or None if no registry is attached.
+        '''
+        if self.registry is None :
+            return None
+        return self.registry.stats()
+
+    def deploy(self, backend:Optional[str]=None):
+        '''
+        Deploy the model-sever. If a backend ("threads" or "asyncio") is given, the
+        server serves many clients at the same time, until a client sends SHUTDOWN;
+        see CommandServer.deploy(). Note that the attached functions may then be
+        called concurrently.
+        '''
+        self.commandserver.deploy(backend=backend) 
 
-    def deploy(self):
+    def batchingStats(self) -> Optional[Dict] :
         '''
-        Deploy the model-sever.
+        Return the throughput and latency counters of the micro-batching of GETNEXTACTION
+        requests (see MicroBatcher.stats()), or None if no batch-aware function is attached.
         '''
-        self.commandserver.deploy() 
+        if self.batcher is None :
+            return None
+        return self.batcher.stats()
 
 # just for testing:
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+import numpy as np
+from typing import Any, Optional, Sequence, Tuple, Union
+
+class Field:
+    '''
+    A field in the observations a GymEnvServer sends, which are (nested) dictionaries.
+    The field is identified by its path: a sequence of keys (or list-indices) leading
+    to it, which can also be written as a dotted string, e.g. "agent.pos". The value
+    there is a number, or a (nested) list or array of numbers of the given shape; the
+    latter is flattened into consecutive slots of the decoded observation.
+    '''
+
+    def __init__(self, path:Union[str,Sequence], shape:Tuple[int,...]=(),
+                 low:float=-np.inf, high:float=np.inf):
+        '''
+        Parameters:
+        path : the path to the field, e.g. "x", "agent.pos", or ("agent","pos")
+        shape : the shape of the field's value; () for a single number
+        low, high : the bounds of the field's values, used for the observation-space
+        '''
+        self.path = tuple(path.split(".")) if isinstance(path,str) else tuple(path)
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape, dtype=np.int64))
+        self.low = low
+        self.high = high
+
+    def get(self, obs:Any) -> Any :
+        for key in self.path :
+            obs = obs[key]
+        return obs
+
+class ObservationSchema:
+    '''
+    Declares how the observations of a GymEnvServer are decoded into a flat NumPy
+    array, as RL algorithms (e.g. those of stable-baselines3) want them. For example,
+    for SquareWorld:
+
+        schema = ObservationSchema([Field("x",low=-1,high=N), Field("y",low=-1,high=N)], np.int32)
+        env.observation_space = schema.observationSpace()
+        ...
+        obs = schema.decode(o)
+
+    Every field gets its own slots in the decoded array, in the order they are given.
+    The observation-space is derived from the same fields, so that it always matches
+    the decoded observations.
+
+    The decoded observations are written into preallocated buffers, rather than
+    into new arrays. There are two buffers, used in turn, so the array returned by
+    decode() stays valid during the next decode(): the observation before and after
+    a step can both be used, but copy an observation that has to be kept longer.
+    '''
+
+    def __init__(self, fields:Sequence[Field], dtype=np.float32):
+        self.fields = list(fields)
+        self.dtype = np.dtype(dtype)
+        # the slots of every field in the decoded array:
+        self.slots = []
+        offset = 0
+        for f in self.fields :
+            self.slots.append((f, offset, offset + f.size))
+            offset += f.size
+        self.size = offset
+        self.buffers = (np.zeros(self.size, dtype=self.dtype), np.zeros(self.size, dtype=self.dtype))
+        self.current = 0
+
+    @property
+    def shape(self) -> Tuple[int] :
+        return (self.size,)
+
+    def low(self) -> np.ndarray :
+        return np.concatenate([ np.full(f.size, f.low, dtype=np.float64) for f in self.fields ])
+
+    def high(self) -> np.ndarray :
+        return np.concatenate([ np.full(f.size, f.high, dtype=np.float64) for f in self.fields ])
+
+    def observationSpace(self) :
+        '''
+        Return the gym Box-space of the decoded observations.
+        '''
+        from gym import spaces
+        low, high = self.low(), self.high()
+        if np.issubdtype(self.dtype, np.integer) :
+            # a Box of integers cannot have infinite bounds:
+            info = np.iinfo(self.dtype)
+            low = np.clip(low, info.min, info.max)
+            high = np.clip(high, info.min, info.max)
+        return spaces.Box(low=low.astype(self.dtype), high=high.astype(self.dtype),
+                          shape=self.shape, dtype=self.dtype)
+
+    def decode(self, obs:Any, out:Optional[np.ndarray]=None) -> np.ndarray :
+        '''
+        Decode an observation received from a GymEnvServer. The values are written
+        into out, when given (e.g. a row of a batch of observations), else into the
+        next of the two internal buffers, which is returned.
+        '''
+        if out is None :
+            self.current ^= 1
+            out = self.buffers[self.current]
+        for f,start,end in self.slots :
+            value = f.get(obs)
+            if end - start == 1 and not f.shape :
+                out[start] = value
+            elif isinstance(value,np.ndarray) :
+                out[start:end] = value.reshape(-1)
+            else :
+                # numpy reads the (nested) list directly into the slots:
+                out[start:end].reshape(f.shape)[...] = value
+        return out
+
+    def __call__(self, obs:Any) -> np.ndarray :
+        return self.decode(obs)
+
+
+# just for testing:
+if __name__ == '__main__':
+    schema = ObservationSchema([ Field("x",low=-1,high=6), Field("y",low=-1,high=6),
+                                 Field("agent.pos",shape=(3,)), Field(("grid",),shape=(2,2),low=0,high=1) ])
+    obs = { "x":1, "y":2, "agent":{ "pos":[0.5,1.5,2.5] }, "grid":[[0,1],[1,0]] }
+    print(schema.decode(obs))
+    print(schema.observationSpace())
@@ -0,0 +1,17 @@
+from typing import Any, Hashable
+
+def canonicalKey(obs:Any) -> Hashable :
+    '''
+    Convert an observation, as received from a GymEnvServer, to a hashable key, such
+    that two observations get the same key if and only if they are equal. Dictionaries
+    (possibly nested) become tuples of (name,value) pairs sorted on name, lists become
+    tuples, and NumPy arrays become a tuple of their dtype, shape and raw bytes.
+    Primitive values are their own key.
+    '''
+    if isinstance(obs,dict) :
+        return tuple(sorted((k,canonicalKey(v)) for k,v in obs.items()))
+    if isinstance(obs,(list,tuple)) :
+        return tuple(canonicalKey(v) for v in obs)
+    if hasattr(obs,"tobytes") and hasattr(obs,"dtype") :
+        return ("ndarray", str(obs.dtype), tuple(obs.shape), obs.tobytes())
+    return obs
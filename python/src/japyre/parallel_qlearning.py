@@ -0,0 +1,216 @@
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+from typing import Any, Callable, Dict, List
+from .qlearning import Qlearning
+
+AVERAGE_MERGE   = "average"   # the central table becomes the mean of the workers' tables
+MAXDELTA_MERGE  = "maxdelta"  # every entry takes the change of the worker that changed it most
+
+def mergeTables(central:np.ndarray, local:np.ndarray, merge:str=AVERAGE_MERGE) -> None :
+    '''
+    Merge the workers' tables local (of shape (W,NS,NA)) into the central table, in place.
+    The workers' tables all started as copies of the central table.
+    '''
+    if merge == AVERAGE_MERGE :
+        np.mean(local, axis=0, out=central)
+    elif merge == MAXDELTA_MERGE :
+        deltas = local - central
+        biggest = np.abs(deltas).argmax(axis=0)
+        central += np.take_along_axis(deltas, biggest[np.newaxis], axis=0)[0]
+    else :
+        raise ValueError(f"Unknown merge: {merge}")
+
+class ParallelQlearning:
+    '''
+    Runs Q-learning in several worker processes at once, each with its own env (e.g.
+    connected to its own Java-side GymEnvServer) and its own copy of the Q-table. Every
+    syncInterval steps, the workers stop, their tables are merged into a central table,
+    and the merged table is handed back to all workers, after which they continue.
+    So the throughput grows with the number of env-servers that can be run.
+
+    The tables live in shared memory: the central table and one table per worker. A
+    worker updates its own table in place, and merging reads all of them directly, so
+    no table is ever pickled or sent between processes.
+
+    The workers are configured after a given Qlearning instance (its hyper-parameters
+    and state- and action-indexers, which are all that is passed to them; not its
+    table); at the end, the merged table is copied into it.
+    Only dense Q-tables are supported: a sparse table's rows are allocated on the fly,
+    differently in every worker, so the tables cannot be merged row by row.
+
+    The envs are created in the workers, by calling envFactory(workerId). The factory
+    and the indexers are passed to the worker processes; when processes are not
+    started with "fork" (the default on Linux), they must be picklable, so e.g. not
+    lambdas.
+    '''
+
+    def __init__(self, qalg:Qlearning, envFactory:Callable[[int],Any], numberOfWorkers:int,
+                 syncInterval:int=100, merge:str=AVERAGE_MERGE):
+        '''
+        Parameters:
+        qalg : the Qlearning instance to train
+        envFactory : envFactory(i) creates the env of worker i
+        numberOfWorkers (int): the number of worker processes
+        syncInterval (int): the number of steps a worker does between two merges
+        merge (str): how tables are merged; "average" or "maxdelta"
+        '''
+        if qalg.sparse :
+            raise ValueError("ParallelQlearning needs a dense Q-table.")
+        if merge != AVERAGE_MERGE and merge != MAXDELTA_MERGE :
+            raise ValueError(f"Unknown merge: {merge}")
+        self.qalg = qalg
+        self.envFactory = envFactory
+        self.numberOfWorkers = numberOfWorkers
+        self.syncInterval = syncInterval
+        self.merge = merge
+
+    def learn(self, maxNumberOfSteps:int, verbose:bool=False) -> Dict :
+        '''
+        Let every worker do maxNumberOfSteps steps of Q-learning. Returns statistics:
+        the steps/sec of every worker (counting only the time it spent stepping and
+        learning), and the aggregate steps/sec over the whole run.
+        '''
+        W = self.numberOfWorkers
+        table = np.asarray(self.qalg.qtable, dtype=np.float64)
+        rounds = -(-maxNumberOfSteps // self.syncInterval)
+        # layout of the shared block: the central table, W local tables, and W (steps,seconds):
+        tableBytes = table.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=(W+1)*tableBytes + W*2*8)
+        central = local = stats = None
+        try:
+            central, local, stats = _views(shm.buf, table.shape, W)
+            central[...] = table
+            stats[...] = 0
+            # the workers and this process meet at the barrier before and after every merge:
+            barrier = mp.Barrier(W+1)
+            # only what the workers need of the Qlearning instance, so not its table:
+            config = { "seed" : self.qalg.seed,
+                       "alpha" : self.qalg.alpha,
+                       "gamma" : self.qalg.gamma,
+                       "exploreProbability" : self.qalg.exploreProbability,
+                       "stateIndexer" : self.qalg.stateIndexer,
+                       "actionIndexer" : self.qalg.actionIndexer }
+            workers = [ mp.Process(target=_work,
+                                   args=(i, shm.name, table.shape, W, config, self.envFactory,
+                                         maxNumberOfSteps, self.syncInterval, barrier, verbose),
+                                   daemon=True)
+                        for i in range(W) ]
+            start = time.perf_counter()
+            for p in workers :
+                p.start()
+            try:
+                for r in range(rounds) :
+                    barrier.wait()
+                    mergeTables(central, local, self.merge)
+                    barrier.wait()
+                    if verbose :
+                        print(f">> Round {r}: merged {W} tables")
+            except BrokenBarrierError:
+                for p in workers :
+                    p.terminate()
+                raise RuntimeError("A Q-learning worker has failed.")
+            finally:
+                for p in workers :
+                    p.join()
+            seconds = time.perf_counter() - start
+            self.qalg.qtable = central.copy()
+            steps = stats[:,0].copy()
+            busy = stats[:,1].copy()
+        finally:
+            # the views on the block must be gone before it can be closed:
+            del central, local, stats
+            shm.close()
+            shm.unlink()
+        return {
+            "workers" : [ { "steps":int(steps[i]), "seconds":float(busy[i]),
+                            "stepsPerSec":float(steps[i]/busy[i]) if busy[i] > 0 else None }
+                          for i in range(W) ],
+            "steps" : int(steps.sum()),
+            "seconds" : seconds,
+            "stepsPerSec" : float(steps.sum()/seconds),
+            "merges" : rounds
+        }
+
+def _views(buf, shape, W:int):
+    '''
+    The central table, the local tables, and the statistics, as views on the shared block.
+    '''
+    size = int(np.prod(shape))
+    central = np.ndarray(shape, dtype=np.float64, buffer=buf)
+    local = np.ndarray((W,) + tuple(shape), dtype=np.float64, buffer=buf, offset=size*8)
+    stats = np.ndarray((W,2), dtype=np.float64, buffer=buf, offset=(W+1)*size*8)
+    return central, local, stats
+
+def _work(workerId:int, shmName:str, shape, W:int, config:Dict, envFactory,
+          maxNumberOfSteps:int, syncInterval:int, barrier, verbose:bool) -> None :
+    '''
+    The body of a worker process.
+    '''
+    shm = shared_memory.SharedMemory(name=shmName)
+    try:
+        _learnInWorker(workerId, shm.buf, shape, W, config, envFactory,
+                       maxNumberOfSteps, syncInterval, barrier, verbose)
+    except BaseException:
+        # release the other workers and the driver, who are waiting at the barrier:
+        barrier.abort()
+        raise
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # views on the block are still referred to from a traceback
+            pass
+
+def _learnInWorker(workerId:int, buf, shape, W:int, config:Dict, envFactory,
+                   maxNumberOfSteps:int, syncInterval:int, barrier, verbose:bool) -> None :
+    central, local, stats = _views(buf, shape, W)
+    myTable = local[workerId]
+    qalg = Qlearning(shape[0], shape[1], seed=config["seed"] + workerId)
+    qalg.alpha = config["alpha"]
+    qalg.gamma = config["gamma"]
+    qalg.exploreProbability = config["exploreProbability"]
+    qalg.stateIndexer = config["stateIndexer"]
+    qalg.actionIndexer = config["actionIndexer"]
+    qalg.qtable = myTable
+    env = envFactory(workerId)
+    k = 0
+    episode = 0
+    o = env.reset()
+    while k < maxNumberOfSteps :
+        myTable[...] = central
+        t0 = time.perf_counter()
+        for _ in range(min(syncInterval, maxNumberOfSteps - k)) :
+            action = qalg.getNextAction(o)
+            nextObs,reward,done,_ = env.step(action)
+            qalg.applyReward(o,action,nextObs,reward)
+            o = nextObs
+            if done :
+                episode += 1
+                o = env.reset()
+            k += 1
+        stats[workerId,0] = k
+        stats[workerId,1] += time.perf_counter() - t0
+        # wait until the driver has merged all tables:
+        barrier.wait()
+        barrier.wait()
+    if verbose :
+        print(f">> Worker {workerId} finished: {k} steps, {episode} episodes")
+    env.close()
+
+
+# just for testing:
+if __name__ == '__main__':
+    from .sqworld_env import SqWorldEnv
+    # this assumes two SquareWorldGymServers are running, at ports 9999 and 10000:
+    N = 6
+    def convertToIndex(obs) :
+        return ((int(obs[0])+1) * (N+2)) + int(obs[1]) + 1
+    def makeEnv(workerId) :
+        return SqWorldEnv(N, port=9999+workerId)
+    qalg = Qlearning((N+2)*(N+2), 4)
+    qalg.stateIndexer = convertToIndex
+    stats = ParallelQlearning(qalg, makeEnv, 2, syncInterval=200).learn(2000, verbose=True)
+    print(f"### {stats}")
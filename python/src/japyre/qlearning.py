@@ -1,8 +1,21 @@
-import random
-from xmlrpc.client import Boolean
-import gym
 import numpy as np
-from typing import Any, Callable, Dict, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from .obskey import canonicalKey
+from .sparse_qtable import SparseQTable
+from .qtable_file import saveTable, loadTable
+from .replay_buffer import ReplayBuffer
+from .transition_model import TransitionModel
+
+if TYPE_CHECKING :
+    # only for the type-hints; importing gym takes long
+    import gym
+
+def identity(i) :
+    '''
+    The default state- and action-indexer. It is a module-level function rather than a
+    lambda, so that it can be pickled, e.g. to pass it to ParallelQlearning's workers.
+    '''
+    return i
 
 class Qlearning:
     '''
@@ -20,24 +33,58 @@ class Qlearning:
     is a 2D array, such that to know the value of Q[s][a] we first need
     to translate s and a to the corresponding index, say si and ai, and
     the we inspect self.qtable[si][ai].
+
+    When the state space is too large (or unbounded) to allocate such a table
+    up front, a sparse Q-table can be used instead (see SparseQTable). Its rows
+    are only allocated when a state is visited for the first time. States then do
+    not need to be indexed: by default an observation (e.g. a dictionary received
+    from a GymEnvClient) is converted to a hashable key by obskey.canonicalKey,
+    and that key identifies the state's row.
     '''
-    def __init__(self,numberOfStates,numberOfActions):
+    def __init__(self,numberOfStates,numberOfActions,seed=127,sparse=False,maxStates:Optional[int]=None):
         '''
         Constructor. Specify the number of possible states and the number
-        of possible actions to consider.
+        of possible actions to consider. The seed initializes the random
+        generator used to initialize the qtable and to choose exploratory actions.
+
+        If sparse is true, or numberOfStates is None, a sparse Q-table is used; the
+        table then holds at most maxStates states, if given (the least visited states
+        are evicted to make room for new ones).
         '''
         self.numberOfStates  = numberOfStates
         self.numberOfActions = numberOfActions
-        self.seed  = 127
+        self.seed  = seed
         self.alpha = 0.5
         self.gamma = 0.9
         self.exploreProbability = 0.16
-        random.seed(self.seed)
-        a = [ [ random.random()/100.0 for y in range(numberOfActions) ] for x in range(numberOfStates) ]
-        self.qtable = np.array(a)
+        self.rng = np.random.default_rng(self.seed)
+        self.sparse = sparse or numberOfStates is None
+        if self.sparse :
+            self.qtable = SparseQTable(numberOfActions,maxStates=maxStates,rng=self.rng)
+            self.stateIndexer = canonicalKey
+        else :
+            self.qtable = self.rng.random((numberOfStates,numberOfActions)) / 100.0
+            self.stateIndexer = identity
+        self.actionIndexer = identity
+        # the names of the actions, if known; the action with index i is actionSpace[i]:
+        self.actionSpace = None
 
-        self.stateIndexer  = lambda i : i
-        self.actionIndexer = lambda i : i
+    def qvalues(self) -> np.ndarray :
+        '''
+        Return the 2D array holding the Q-values. For a dense Q-table this is the
+        table itself; for a sparse one it is the arena holding the allocated rows.
+        '''
+        return self.qtable.values if self.sparse else self.qtable
+
+    def stateRows(self, states) -> np.ndarray :
+        '''
+        Return the indices of the rows in qvalues() that hold the Q-values of the
+        given states (observations). With a sparse Q-table, rows are allocated for
+        states not seen before.
+        '''
+        if self.sparse :
+            return self.qtable.rows(self.stateIndexer(s) for s in states)
+        return np.fromiter((self.stateIndexer(s) for s in states), dtype=np.intp, count=len(states))
 
     def maxActionValue(self,indexOfcurrentState:int) -> Dict :
         '''
@@ -46,14 +93,9 @@ class Qlearning:
         an action), such that qtable[si][a] = max{qtable[si][b] | b is action},
         and v is the value of qtable[si][a].
         '''
-        bestAction = 0
-        bestValue = self.qtable[indexOfcurrentState][0]
-        for a in range(1,self.numberOfActions) :
-            v = self.qtable[indexOfcurrentState][a]
-            if v > bestValue :
-               bestAction = a
-               bestValue = v
-        return { "bestAction" : bestAction, "bestValue" : bestValue }
+        row = self.qtable[indexOfcurrentState]
+        bestAction = int(row.argmax())
+        return { "bestAction" : bestAction, "bestValue" : row[bestAction] }
 
 
     def getNextTrainedAction(self, currentState) -> int :
@@ -62,8 +104,7 @@ class Qlearning:
         the best according to the qtable. 
         '''
         si = self.stateIndexer(currentState)
-        best = self.maxActionValue(si)
-        return best["bestAction"]
+        return int(self.qtable[si].argmax())
 
     def applyReward(self, oldstate:int, action:int, newstate:int, reward:float) -> None :
         '''
@@ -72,9 +113,47 @@ class Qlearning:
         oldSi = self.stateIndexer(oldstate)
         newSi = self.stateIndexer(newstate)
         ai = self.actionIndexer(action)
-        valOldState = self.qtable[oldSi][ai]
-        valNewState = self.maxActionValue(newSi)["bestValue"]
-        self.qtable[oldSi][ai] = valOldState + self.alpha * (reward + self.gamma * valNewState - valOldState)
+        if self.sparse :
+            oldSi,newSi = self.qtable.rows((oldSi,newSi))
+        q = self.qvalues()
+        row = q[oldSi]
+        valOldState = row[ai]
+        valNewState = q[newSi].max()
+        row[ai] = valOldState + self.alpha * (reward + self.gamma * valNewState - valOldState)
+
+    def applyRewards(self, states, actions, next_states, rewards, dones=None) -> None :
+        '''
+        Apply the Q-learning update to a batch of transitions (states[k],actions[k]) -> next_states[k],
+        with reward rewards[k], in a single vectorized step. All updates are computed from the
+        qtable as it is before the batch; when the same (state,action) pair occurs several times
+        in the batch, the updates of these occurrences are averaged (summing them would multiply
+        the step size by the number of occurrences, and overshoot). If dones is given, the value
+        of next_states[k] is not counted when dones[k] is true (it is a terminal state).
+        '''
+        rows = self.stateRows(list(states) + list(next_states))
+        si  = rows[:len(states)]
+        nsi = rows[len(states):]
+        ai  = np.fromiter((self.actionIndexer(a) for a in actions), dtype=np.intp, count=len(actions))
+        self.applyMinibatch(si,ai,nsi,np.asarray(rewards,dtype=float),dones)
+
+    def applyIndexedRewards(self, si, ai, nsi, rewards, dones=None, weights=None) -> np.ndarray :
+        '''
+        As applyRewards(), but the states and actions are already given as arrays of
+        row-indices into qvalues() (see stateRows()) and action-indices. Returns the
+        array of temporal-difference errors (target value minus old value) of the
+        transitions. If weights are given, the update of every transition is
+        multiplied by its weight. Note that the updates of a (state,action) pair that
+        occurs several times are summed here; see applyMinibatch() to average them.
+        '''
+        q = self.qvalues()
+        valOld = q[si,ai]
+        valNew = q[nsi].max(axis=1)
+        if dones is not None :
+            valNew = np.where(dones, 0.0, valNew)
+        tdErrors = rewards + self.gamma * valNew - valOld
+        updates = self.alpha * tdErrors if weights is None else self.alpha * weights * tdErrors
+        np.add.at(q, (si,ai), updates)
+        return tdErrors
         
     def getNextAction(self, currentState) -> int :
         '''
@@ -82,33 +161,126 @@ class Qlearning:
         according to the current qtable, or just a random action, by some probability
         epsilon.
         '''
-        if random.random() < self.exploreProbability :
-            action = random.randint(0,self.numberOfActions-1)
-            return action  
+        if self.rng.random() < self.exploreProbability :
+            return int(self.rng.integers(self.numberOfActions))
         else:
             return self.getNextTrainedAction(currentState)
         
 
     def save(self,fname):
-        print(f">>> implement this --> Saving a model to {fname}")
-        raise 
+        '''
+        Save the model to the given file: the qtable, the hyper-parameters, the action
+        space (if known), and, for a sparse qtable, the keys of the stored states and
+        its maximum number of states. The file can be loaded with load(); see
+        qtable_file for its format. Note that the stateIndexer of a dense qtable is a
+        function, so it is not saved.
+        '''
+        meta = {
+            "numberOfStates" : self.numberOfStates,
+            "numberOfActions" : self.numberOfActions,
+            "seed" : self.seed,
+            "alpha" : self.alpha,
+            "gamma" : self.gamma,
+            "exploreProbability" : self.exploreProbability,
+            "actionSpace" : self.actionSpace,
+            "sparse" : self.sparse,
+            "stateKeys" : None,
+            "maxStates" : None
+        }
+        if self.sparse :
+            rows = [ self.qtable.index[k] for k in self.qtable.stateKeys() ]
+            meta["stateKeys"] = self.qtable.stateKeys()
+            meta["maxStates"] = self.qtable.maxStates
+            saveTable(fname,self.qtable.values[rows],meta)
+        else :
+            saveTable(fname,self.qtable,meta)
 
-    def load(self,fname):
-        print(f">>> implement this --> Loading a model from {fname}")    
-        raise
+    def load(self,fname,mode="r"):
+        '''
+        Load a model saved by save(), replacing this model's qtable, hyper-parameters
+        and action space. The qtable is memory-mapped rather than read, so loading is
+        near instantaneous, and several processes (e.g. ModelServers) loading the same
+        file share a single copy of it in the OS page-cache. With the default mode "r"
+        the qtable is read-only; use mode "c" to be able to train it further (the
+        changes are then kept in memory, and not written to the file).
+
+        If this model has a dense qtable whose shape does not match the one in the file,
+        a ValueError is raised.
+        '''
+        table, meta = loadTable(fname,mode)
+        if not self.sparse and not meta["sparse"] and self.numberOfStates > 0 \
+                and table.shape != (self.numberOfStates,self.numberOfActions) :
+            raise ValueError(f"The qtable in {fname} has shape {table.shape}, but this model expects "
+                             + f"{(self.numberOfStates,self.numberOfActions)}.")
+        self.numberOfStates = meta["numberOfStates"]
+        self.numberOfActions = meta["numberOfActions"]
+        self.seed = meta["seed"]
+        self.alpha = meta["alpha"]
+        self.gamma = meta["gamma"]
+        self.exploreProbability = meta["exploreProbability"]
+        self.actionSpace = meta["actionSpace"]
+        if meta["sparse"] :
+            qtable = SparseQTable.fromRows(table,meta["stateKeys"],maxStates=meta.get("maxStates"),rng=self.rng)
+            if not self.sparse :
+                self.stateIndexer = canonicalKey
+            self.sparse = True
+            self.qtable = qtable
+        else :
+            if self.sparse :
+                self.stateIndexer = identity
+            self.sparse = False
+            self.qtable = table
+
+    @classmethod
+    def fromFile(cls,fname,mode="r"):
+        '''
+        Create a model from a file saved by save(); see load(). This can serve e.g. as
+        the loader of a ModelRegistry.
+        '''
+        model = cls(0,0)
+        model.load(fname,mode)
+        return model
+
+    @property
+    def nbytes(self) -> int :
+        '''
+        The size of the qtable in bytes.
+        '''
+        return self.qvalues().nbytes
 
     def __str__(self) -> str:
         s = f"{self.qtable}"
         return s
 
-    def learn(self, env : gym.Env, maxNumberOfSteps:int, verbose:Boolean=False) -> None :
+    def learn(self, env : "gym.Env", maxNumberOfSteps:int, verbose:bool=False,
+              replay:Optional[ReplayBuffer]=None, batchSize:int=32, updatesPerStep:int=1,
+              model:Optional[TransitionModel]=None, planningSteps:int=10,
+              until:Optional[Callable[[],bool]]=None) -> int :
         '''
         Run the Q-learning algorithm on the given Gym-env, for some maximum number
         of steps. Whenever a terminal state is encountered, the env will be reset
         to initial state, and a new episode of learning is started. This goed on
         until we reach the max-number of steps (totalled over all episodes).
+
+        If a replay buffer is given, every transition is stored in it rather than
+        learned from directly. After every step, updatesPerStep minibatches of
+        batchSize transitions are sampled from the buffer and learned from, in a
+        vectorized update (once the buffer holds at least batchSize transitions).
+
+        If a transition model is given instead, learning is Dyna-style: every transition
+        is learned from directly, and recorded in the model; then planningSteps simulated
+        transitions are sampled from the model and learned from, in vectorized updates
+        of at most batchSize transitions each. So planningSteps is the number of
+        simulated updates per real step. The model assumes the env is deterministic.
+
+        If until is given, learning also stops at the end of the first episode after
+        which until() is true. Returns the number of steps done.
         '''
+        if replay is not None and model is not None :
+            raise ValueError("Use either a replay buffer or a transition model, not both.")
         print("====== Learning ...")
+        if self.actionSpace is None and hasattr(env,"javaGym") :
+            self.actionSpace = env.javaGym.actionSpace
         k = 0
         stepCountInEpisode = 0
         totalRewardInEpisode = 0
@@ -120,7 +292,12 @@ class Qlearning:
             nextObs,reward,done,i = env.step(action) 
             #print(f"### next={nextObs}, next_={nextO_}")
             totalRewardInEpisode = totalRewardInEpisode + reward
-            self.applyReward(o,action,nextObs,reward)
+            if replay is not None :
+                self.replayStep(replay,o,action,nextObs,reward,done,batchSize,updatesPerStep)
+            elif model is not None :
+                self.planStep(model,o,action,nextObs,reward,done,planningSteps,batchSize)
+            else :
+                self.applyReward(o,action,nextObs,reward)
             debugo = o
             o = nextObs
             if done :
@@ -134,13 +311,60 @@ class Qlearning:
                 #    print(f"### o={debugo}, o_={o_}, next={nextObs}, next_={nextO_}, rw={reward}")
                 #    print(f"### updated enrty={qalg.qtable[o_][action]}")
                 #    break   
+                if until is not None and until() :
+                    k = k + 1
+                    break
             else:
                 stepCountInEpisode = stepCountInEpisode + 1
             k = k + 1
 
         print("====== Training has finished.")
+        return k
+
+    def replayStep(self, replay:ReplayBuffer, obs, action, nextObs, reward:float, done:bool,
+                   batchSize:int=32, updatesPerStep:int=1) -> None :
+        '''
+        Store the transition obs -action-> nextObs in the replay buffer, then learn from
+        updatesPerStep minibatches sampled from it.
+        '''
+        si,nsi = self.stateRows((obs,nextObs))
+        replay.add(si,self.actionIndexer(action),reward,nsi,done)
+        if len(replay) < batchSize :
+            return
+        for _ in range(updatesPerStep) :
+            indices,s,a,r,ns,d = replay.sample(batchSize)
+            tdErrors = self.applyMinibatch(s,a,ns,r,d)
+            if replay.prioritized :
+                replay.updatePriorities(indices,tdErrors)
+
+    def planStep(self, model:TransitionModel, obs, action, nextObs, reward:float, done:bool,
+                 planningSteps:int=10, batchSize:int=32) -> None :
+        '''
+        A step of Dyna-Q: learn from the transition obs -action-> nextObs, record it in
+        the model, then learn from planningSteps transitions sampled from the model.
+        '''
+        si,nsi = self.stateRows((obs,nextObs))
+        ai = self.actionIndexer(action)
+        self.applyIndexedRewards(np.array([si]),np.array([ai]),np.array([nsi]),np.array([reward]),
+                                 np.array([done]))
+        model.add(int(si),ai,reward,int(nsi),done)
+        remaining = planningSteps
+        while remaining > 0 :
+            n = min(remaining,batchSize)
+            s,a,r,ns,d = model.sample(n)
+            self.applyMinibatch(s,a,ns,r,d)
+            remaining -= n
+
+    def applyMinibatch(self, si, ai, nsi, rewards, dones) -> np.ndarray :
+        '''
+        As applyIndexedRewards(), but the updates of a (state,action) pair that occurs
+        several times in the batch (as it often does in e.g. a minibatch sampled from a
+        replay buffer) are averaged rather than summed, to not overshoot.
+        '''
+        _,pair,counts = np.unique(si * self.numberOfActions + ai, return_inverse=True, return_counts=True)
+        return self.applyIndexedRewards(si,ai,nsi,rewards,dones,1.0 / counts[pair])
 
-    def getRun(self, env : gym.Env, maxNumberOfSteps:int, verbose:Boolean=False) -> Dict :
+    def getRun(self, env : "gym.Env", maxNumberOfSteps:int, verbose:bool=False) -> Dict :
         '''
         Return a sequence of actions (starting from the env's initial state) that
         greedily choose each next action such that it is the action with the greatest
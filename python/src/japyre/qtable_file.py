@@ -0,0 +1,104 @@
+import json
+import struct
+import zlib
+import base64
+import numpy as np
+from typing import Any, Dict, Tuple
+
+# Layout of a Q-table file:
+#
+#    magic (8 bytes) | metaLength (uint32) | metaCrc (uint32) | dataOffset (uint64)
+#    meta (metaLength bytes of Json)
+#    padding up to dataOffset, which is a multiple of ALIGNMENT
+#    the table, as raw C-ordered array data
+#
+# All header integers are big-endian. The meta-data holds, among others, the dtype and
+# shape of the table; its CRC32 is stored in the header, so that a corrupted or
+# truncated header is detected before the table is mapped.
+
+MAGIC = b"JAPYREQT"
+_HEADER = struct.Struct(">8sIIQ")
+ALIGNMENT = 64
+VERSION = 1
+
+def _encodeKey(key:Any) -> Any :
+    '''
+    Convert a state-key (see obskey.canonicalKey) to a Json-compatible value.
+    '''
+    if isinstance(key,tuple) :
+        return [ _encodeKey(k) for k in key ]
+    if isinstance(key,bytes) :
+        return { "b64" : base64.b64encode(key).decode("ascii") }
+    if key is None or isinstance(key,(bool,int,float,str)) :
+        return key
+    raise ValueError(f"Cannot save a state-key of type {type(key)}")
+
+def _decodeKey(value:Any) -> Any :
+    '''
+    The inverse of _encodeKey().
+    '''
+    if isinstance(value,list) :
+        return tuple(_decodeKey(v) for v in value)
+    if isinstance(value,dict) :
+        return base64.b64decode(value["b64"])
+    return value
+
+def saveTable(fname:str, table:np.ndarray, meta:Dict) -> None :
+    '''
+    Save a 2D table, along with some Json-serializable meta-data, to the given file.
+    If the meta-data contains "stateKeys", these are converted so that tuple- and
+    bytes-keys survive the round-trip through Json.
+    '''
+    table = np.ascontiguousarray(table)
+    meta = dict(meta)
+    meta["version"] = VERSION
+    meta["dtype"] = table.dtype.str
+    meta["shape"] = list(table.shape)
+    if meta.get("stateKeys") is not None :
+        meta["stateKeys"] = [ _encodeKey(k) for k in meta["stateKeys"] ]
+    metaBytes = json.dumps(meta).encode("utf-8")
+    dataOffset = _HEADER.size + len(metaBytes)
+    dataOffset += (-dataOffset) % ALIGNMENT
+    with open(fname,"wb") as f :
+        f.write(_HEADER.pack(MAGIC, len(metaBytes), zlib.crc32(metaBytes), dataOffset))
+        f.write(metaBytes)
+        f.write(bytes(dataOffset - _HEADER.size - len(metaBytes)))
+        f.write(table.tobytes())
+
+def loadTable(fname:str, mode:str="r") -> Tuple[np.ndarray,Dict] :
+    '''
+    Load a table saved by saveTable(). The table is not read into memory, but mapped
+    with numpy.memmap, so loading is cheap, and processes that load the same file share
+    its pages in the OS page-cache. The mode is that of numpy.memmap: "r" (read-only),
+    "c" (copy-on-write: the table can be modified, but changes are not written back),
+    or "r+" (changes are written back to the file).
+
+    Returns the table and the meta-data. Raises a ValueError if the file is not a
+    table-file, or if its header is corrupted or does not match the file's size.
+    '''
+    with open(fname,"rb") as f :
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size :
+            raise ValueError(f"{fname} is not a Q-table file.")
+        magic, metaLength, metaCrc, dataOffset = _HEADER.unpack(header)
+        if magic != MAGIC :
+            raise ValueError(f"{fname} is not a Q-table file.")
+        metaBytes = f.read(metaLength)
+        f.seek(0,2)
+        fileSize = f.tell()
+    if len(metaBytes) != metaLength or zlib.crc32(metaBytes) != metaCrc :
+        raise ValueError(f"The header of {fname} is corrupted (checksum mismatch).")
+    meta = json.loads(metaBytes)
+    if meta["version"] != VERSION :
+        raise ValueError(f"{fname} has an unsupported version {meta['version']}.")
+    dtype = np.dtype(meta["dtype"])
+    shape = tuple(meta["shape"])
+    dataSize = dtype.itemsize * int(np.prod(shape))
+    if fileSize != dataOffset + dataSize :
+        raise ValueError(f"The size of {fname} does not match the table shape {shape} in its header.")
+    if meta.get("stateKeys") is not None :
+        meta["stateKeys"] = [ _decodeKey(k) for k in meta["stateKeys"] ]
+    if dataSize == 0 :
+        return np.zeros(shape, dtype=dtype), meta
+    table = np.memmap(fname, dtype=dtype, mode=mode, offset=dataOffset, shape=shape)
+    return table, meta
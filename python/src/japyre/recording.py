@@ -0,0 +1,314 @@
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+from .codec import encodeBinary, decodeBinary
+
+# Layout of a recording-file:
+#
+#    magic (8 bytes) | metaLength (uint32) | meta (metaLength bytes of Json)
+#    chunk*
+#
+# where every chunk is:
+#
+#    "CHNK" | episodes (uint32) | compressedLength (uint32) | rawLength (uint32) | crc32 (uint32)
+#    compressedLength bytes: the zlib-compressed records
+#
+# The uncompressed records are each a uint32 length followed by a message in the binary
+# codec (see codec.py): {"cmd":..., "arg":..., "res":...}, where res is the response
+# as GymEnvClient.sendCommand() returned it. A chunk only holds whole episodes: a new
+# chunk is only started at a RESET. So a file can be appended to and read chunk by
+# chunk, and a chunk that was cut off (e.g. by a crash) only loses its own episodes:
+# a Recorder appending to a file first cuts off such a chunk, and a reader skips
+# chunks whose checksum fails, and looks for the next "CHNK" after them.
+# All integers are big-endian.
+
+MAGIC = b"JPYREC01"
+_META_LENGTH = struct.Struct(">I")
+_CHUNK_HEADER = struct.Struct(">4sIIII")
+_CHUNK_MAGIC = b"CHNK"
+_RECORD_LENGTH = struct.Struct(">I")
+
+_STOP = object()
+
+class Recorder:
+    '''
+    Records the commands a GymEnvClient sends, along with the responses, to a file
+    (see the layout above); see GymEnvClient.startRecording(). Recording happens off
+    the hot path: record() just puts the exchange in a queue, and a background thread
+    encodes, compresses and writes it.
+    '''
+
+    def __init__(self, fname:str, meta:Optional[Dict]=None, chunkSize:int=1<<20, compressLevel:int=6):
+        '''
+        Parameters:
+        fname (str): the file to record to; it is created, or appended to if it exists
+                     (after dropping an incomplete last chunk, see scanChunks)
+        meta (dict): Json-serializable information stored in the header of a new file,
+                     e.g. the action-space
+        chunkSize (int): the size of uncompressed records after which a chunk is
+                     written (at the next episode-boundary)
+        compressLevel (int): the zlib compression level
+        '''
+        self.fname = fname
+        self.chunkSize = chunkSize
+        self.compressLevel = compressLevel
+        if os.path.exists(fname) and os.path.getsize(fname) > 0 :
+            self.file = open(fname,"r+b")
+            with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mm :
+                _, offset = readMeta(mm)
+                _, end = scanChunks(mm,offset)
+            # drop what follows the last complete chunk, else it would swallow the new chunks:
+            self.file.truncate(end)
+            self.file.seek(end)
+        else :
+            self.file = open(fname,"wb")
+            metaBytes = json.dumps(meta or {}).encode("utf-8")
+            self.file.write(MAGIC + _META_LENGTH.pack(len(metaBytes)) + metaBytes)
+        self.queue = queue.SimpleQueue()
+        self.records = 0
+        self.chunks = 0
+        self.error = None
+        self.writer = threading.Thread(target=self._run, name="japyre-recorder", daemon=True)
+        self.writer.start()
+
+    def record(self, cmd:str, arg:Any, response:Any) -> None :
+        '''
+        Record an exchange with the server. Note that arrays in it should not be
+        changed afterwards, as they are only encoded later.
+        '''
+        if self.error is not None :
+            raise RuntimeError("The recorder has failed.") from self.error
+        self.queue.put((cmd,arg,response))
+
+    def _run(self) -> None :
+        chunk = bytearray()
+        episodes = 0
+        try:
+            while True :
+                item = self.queue.get()
+                if item is _STOP :
+                    break
+                cmd,arg,response = item
+                if cmd == "RESET" :
+                    if len(chunk) >= self.chunkSize :
+                        self._writeChunk(chunk,episodes)
+                        chunk = bytearray()
+                        episodes = 0
+                    episodes += 1
+                record = encodeBinary({"cmd":cmd, "arg":arg, "res":response})
+                chunk += _RECORD_LENGTH.pack(len(record))
+                chunk += record
+                self.records += 1
+            if chunk :
+                self._writeChunk(chunk,episodes)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.file.close()
+
+    def _writeChunk(self, chunk:bytearray, episodes:int) -> None :
+        compressed = zlib.compress(chunk,self.compressLevel)
+        self.file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, episodes, len(compressed), len(chunk),
+                                           zlib.crc32(compressed)))
+        self.file.write(compressed)
+        self.file.flush()
+        self.chunks += 1
+
+    def close(self) -> None :
+        '''
+        Write what is still buffered, and close the file.
+        '''
+        self.queue.put(_STOP)
+        self.writer.join()
+        if self.error is not None :
+            raise RuntimeError("The recorder has failed.") from self.error
+
+
+def readMeta(mm) -> Tuple[Dict,int] :
+    '''
+    Read the header of a recording-file; returns the meta-data and the offset of the
+    first chunk.
+    '''
+    if mm[:len(MAGIC)] != MAGIC :
+        raise ValueError("Not a recording-file.")
+    (metaLength,) = _META_LENGTH.unpack_from(mm,len(MAGIC))
+    start = len(MAGIC) + _META_LENGTH.size
+    return json.loads(mm[start:start+metaLength]), start + metaLength
+
+def scanChunks(mm, offset:int) -> Tuple[List[Tuple[int,int,int,int,int]],int] :
+    '''
+    Find the complete chunks of a recording-file, starting at the given offset (that of
+    the first chunk, see readMeta). Returns a list of (offset of the compressed data,
+    episodes, compressedLength, rawLength, crc) of every chunk, and the offset right
+    after the last one. A chunk that was cut off, or whose checksum fails, is skipped,
+    and the scan goes on at the next "CHNK" after it.
+    '''
+    chunks = []
+    end = offset
+    while offset + _CHUNK_HEADER.size <= len(mm) :
+        magic, episodes, compressedLength, rawLength, crc = _CHUNK_HEADER.unpack_from(mm,offset)
+        dataOffset = offset + _CHUNK_HEADER.size
+        if (magic == _CHUNK_MAGIC and dataOffset + compressedLength <= len(mm)
+                and zlib.crc32(mm[dataOffset:dataOffset+compressedLength]) == crc) :
+            chunks.append((dataOffset, episodes, compressedLength, rawLength, crc))
+            offset = end = dataOffset + compressedLength
+        else :
+            offset = mm.find(_CHUNK_MAGIC, offset + 1)
+            if offset < 0 :
+                break
+    return chunks, end
+
+class RecordedGymEnv:
+    '''
+    Serves the episodes of a recording-file through the same reset()/step() interface
+    as GymEnvClient, so that e.g. a learner can be run on recorded experience at memory
+    speed, without a Java-side gym.
+
+    reset() starts the next recorded episode (or a given one), and returns its initial
+    observation. step() returns the recorded responses of the episode, one by one, and
+    checks that the given action is the one that was recorded; call step(None), or
+    nextAction(), to just follow the recording. Steps done with STEP_BATCH are served
+    one at a time too.
+
+    The file is memory-mapped, and only the chunk holding the current episode is
+    decompressed, so recordings much bigger than the memory can be replayed. Chunks
+    that are damaged (see scanChunks) are skipped, along with their episodes.
+    '''
+
+    def __init__(self, fname:str):
+        self.fname = fname
+        self.file = open(fname,"rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.meta, offset = readMeta(self.mm)
+        self.actionSpace = self.meta.get("actionSpace")
+        # (offset of the compressed data, compressedLength, rawLength, crc, first episode) of every chunk:
+        self.chunks = []
+        self.numberOfEpisodes = 0
+        for dataOffset, episodes, compressedLength, rawLength, crc in scanChunks(self.mm,offset)[0] :
+            self.chunks.append((dataOffset, compressedLength, rawLength, crc, self.numberOfEpisodes))
+            self.numberOfEpisodes += episodes
+        self.loadedChunk = None
+        self.loadedEpisodes = None
+        self.episode = -1
+        self.steps = []
+        self.position = 0
+
+    def _episodesOfChunk(self, c:int) -> List[Tuple[Any,List]] :
+        '''
+        Decompress chunk c, and split it into episodes (initialObservation,steps), where
+        steps is a list of (action,(obs,reward,done,info)).
+        '''
+        dataOffset, compressedLength, rawLength, crc, _ = self.chunks[c]
+        compressed = self.mm[dataOffset:dataOffset+compressedLength]
+        if zlib.crc32(compressed) != crc :
+            raise ValueError(f"Chunk {c} of {self.fname} is corrupted (checksum mismatch).")
+        raw = zlib.decompress(compressed)
+        episodes = []
+        offset = 0
+        while offset < len(raw) :
+            (n,) = _RECORD_LENGTH.unpack_from(raw,offset)
+            offset += _RECORD_LENGTH.size
+            record = decodeBinary(raw[offset:offset+n])
+            offset += n
+            cmd, arg, res = record["cmd"], record["arg"], record["res"]
+            if cmd == "RESET" :
+                episodes.append((res,[]))
+            elif not episodes :
+                # steps recorded before the first reset have no initial observation
+                continue
+            elif cmd == "STEP" and res is not None :
+                episodes[-1][1].append((arg,tuple(res)))
+            elif cmd == "STEP_BATCH" :
+                for a,r in zip(arg,res) :
+                    episodes[-1][1].append((a,(r[0],r[1],r[2],None)))
+        return episodes
+
+    def _load(self, episode:int) -> Tuple[Any,List] :
+        # find the chunk holding the episode, by its first episode-number:
+        lo, hi = 0, len(self.chunks) - 1
+        while lo < hi :
+            mid = (lo + hi + 1) // 2
+            if self.chunks[mid][4] <= episode :
+                lo = mid
+            else :
+                hi = mid - 1
+        if self.loadedChunk != lo :
+            self.loadedEpisodes = self._episodesOfChunk(lo)
+            self.loadedChunk = lo
+        return self.loadedEpisodes[episode - self.chunks[lo][4]]
+
+    def reset(self, episode:Optional[int]=None) :
+        '''
+        Start the given episode, or else the next one (after the last episode, the
+        first one comes again). Returns the initial observation.
+        '''
+        if self.numberOfEpisodes == 0 :
+            raise ValueError(f"{self.fname} holds no episodes.")
+        self.episode = (self.episode + 1) % self.numberOfEpisodes if episode is None else episode
+        initialObs, self.steps = self._load(self.episode)
+        self.position = 0
+        return initialObs
+
+    def nextAction(self) :
+        '''
+        The action recorded for the next step, or None if the recorded episode has no
+        more steps.
+        '''
+        if self.position < len(self.steps) :
+            return self.steps[self.position][0]
+        return None
+
+    def step(self, action=None) :
+        '''
+        Return the recorded (obs,reward,done,info) of the next step. Raises a ValueError
+        if the given action is not the recorded one, or the recording has no more steps
+        in this episode.
+        '''
+        if self.position >= len(self.steps) :
+            raise ValueError(f"Episode {self.episode} has no more recorded steps.")
+        recordedAction, response = self.steps[self.position]
+        if action is not None and action != recordedAction :
+            raise ValueError(f"The action {action} differs from the recorded action {recordedAction}.")
+        self.position += 1
+        return response
+
+    def step_many(self, actions) -> List :
+        results = []
+        for a in actions :
+            obs,rw,done,_ = self.step(a)
+            results.append((obs,rw,done))
+            if done :
+                break
+        return results
+
+    def softClose(self) -> None :
+        pass
+
+    def close(self) -> None :
+        self.loadedEpisodes = None
+        self.steps = []
+        self.mm.close()
+        self.file.close()
+
+
+# just for testing:
+if __name__ == '__main__':
+    import sys
+    # replay the episodes of a recording, e.g. one made with GymEnvClient.startRecording():
+    env = RecordedGymEnv(sys.argv[1])
+    print(f"### {env.numberOfEpisodes} episodes in {len(env.chunks)} chunks, action space: {env.actionSpace}")
+    for e in range(env.numberOfEpisodes) :
+        o = env.reset()
+        steps = 0
+        totalReward = 0
+        while env.nextAction() is not None :
+            o,r,done,_ = env.step()
+            steps += 1
+            totalReward += r
+        print(f"### episode {e}: {steps} steps, total reward {totalReward}")
+    env.close()
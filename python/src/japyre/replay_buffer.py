@@ -0,0 +1,111 @@
+import numpy as np
+from typing import Optional, Tuple
+
+class ReplayBuffer:
+    '''
+    A fixed-capacity buffer of transitions (s,a,r,s',done), for experience replay: rather
+    than using a transition once and throwing it away, a learner stores it, and learns
+    from minibatches sampled from the buffer. So every (expensive) step on a Java-side
+    gym can be learned from many times.
+
+    States are stored as row-indices into the Q-table (see Qlearning.stateRows), and
+    actions as action-indices. Transitions are kept in preallocated NumPy arrays used
+    as a ring: when the buffer is full, the oldest transition is overwritten.
+
+    Sampling is uniform, or, if prioritized, proportional to priority^alpha, where the
+    priority of a transition is the absolute value of its last temporal-difference
+    error (see updatePriorities). New transitions get the highest priority seen so far,
+    so that they are sampled at least once soon.
+
+    Note that with a sparse Q-table that has a maximum number of states, the row of an
+    evicted state is reused for another state; transitions stored for the evicted state
+    then update the wrong row. Use a large enough maxStates when replaying.
+    '''
+
+    def __init__(self, capacity:int, prioritized:bool=False, alpha:float=0.6,
+                 rng:Optional[np.random.Generator]=None):
+        '''
+        Parameters:
+        capacity (int): the maximum number of transitions kept
+        prioritized (bool): whether to use prioritized sampling
+        alpha (float): how strongly priorities count; 0 is uniform sampling
+        rng : the random generator used for sampling
+        '''
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.states      = np.zeros(capacity, dtype=np.intp)
+        self.actions     = np.zeros(capacity, dtype=np.intp)
+        self.rewards     = np.zeros(capacity, dtype=np.float64)
+        self.nextStates  = np.zeros(capacity, dtype=np.intp)
+        self.dones       = np.zeros(capacity, dtype=bool)
+        self.priorities  = np.zeros(capacity, dtype=np.float64)
+        self.maxPriority = 1.0
+        self.next = 0    # where the next transition goes
+        self.count = 0   # the number of transitions stored
+
+    def __len__(self) -> int :
+        return self.count
+
+    def add(self, state:int, action:int, reward:float, nextState:int, done:bool) -> None :
+        '''
+        Store a single transition.
+        '''
+        i = self.next
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.nextStates[i] = nextState
+        self.dones[i] = done
+        self.priorities[i] = self.maxPriority
+        self.next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def addBatch(self, states, actions, rewards, nextStates, dones) -> None :
+        '''
+        Store a batch of transitions, given as arrays.
+        '''
+        n = len(states)
+        if n > self.capacity :
+            # only the last capacity transitions would survive anyway:
+            states, actions, rewards, nextStates, dones = ( np.asarray(x)[-self.capacity:]
+                for x in (states, actions, rewards, nextStates, dones) )
+            n = self.capacity
+        positions = (self.next + np.arange(n)) % self.capacity
+        self.states[positions] = states
+        self.actions[positions] = actions
+        self.rewards[positions] = rewards
+        self.nextStates[positions] = nextStates
+        self.dones[positions] = dones
+        self.priorities[positions] = self.maxPriority
+        self.next = int((self.next + n) % self.capacity)
+        self.count = min(self.count + n, self.capacity)
+
+    def sample(self, batchSize:int) -> Tuple[np.ndarray,...] :
+        '''
+        Sample a minibatch of transitions (with replacement). Returns a tuple
+        (indices,states,actions,rewards,nextStates,dones) of arrays; the indices are
+        positions in the buffer, to be passed to updatePriorities().
+        '''
+        if self.count == 0 :
+            raise ValueError("Cannot sample from an empty replay buffer.")
+        if self.prioritized :
+            p = self.priorities[:self.count] ** self.alpha
+            cumulative = np.cumsum(p)
+            targets = self.rng.random(batchSize) * cumulative[-1]
+            indices = np.minimum(np.searchsorted(cumulative, targets, side="right"), self.count - 1)
+        else :
+            indices = self.rng.integers(0, self.count, batchSize)
+        return (indices, self.states[indices], self.actions[indices], self.rewards[indices],
+                self.nextStates[indices], self.dones[indices])
+
+    def updatePriorities(self, indices:np.ndarray, tdErrors:np.ndarray, epsilon:float=1e-3) -> None :
+        '''
+        Set the priorities of the given transitions to the absolute value of their
+        temporal-difference errors (plus a small epsilon, so that every transition can
+        still be sampled).
+        '''
+        priorities = np.abs(tdErrors) + epsilon
+        self.priorities[indices] = priorities
+        self.maxPriority = max(self.maxPriority, float(priorities.max()))
@@ -0,0 +1,203 @@
+import os
+import sys
+import mmap
+import struct
+import tempfile
+import uuid
+from typing import Any, List, Optional
+
+# Layout of a ring-file:
+#
+#    magic (8 bytes) | capacity (uint64) | head (uint64) | padding up to DATA_OFFSET
+#    capacity bytes of data, used as a ring
+#
+# The producer (the server) appends records to the ring. A record is referred to by its
+# absolute position: the number of ring-bytes written before it, so a record lives at
+# (position % capacity). head is the absolute position where the next record goes.
+# A record never wraps around the end of the ring; if it does not fit, the producer
+# skips to the start of the ring.
+
+MAGIC = b"JPYRING1"
+_HEADER = struct.Struct("<8sQQ")
+DATA_OFFSET = 64
+ALIGNMENT = 64
+
+SHM_OPEN = "SHM_OPEN"   # the command a client sends to share a ring with the server
+SHM_REF  = "__shm__"    # the key of the reference that replaces an array in a message
+
+def _defaultDirectory() -> str :
+    # /dev/shm is memory-backed on Linux; elsewhere we fall back to a regular temp-dir,
+    # whose pages are still shared through the OS page-cache:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+class SharedRing:
+    '''
+    A ring-buffer in a memory-mapped file, through which a server on the same host can
+    hand over large NumPy arrays (e.g. image-observations) to a client, without pushing
+    them through the socket. The server writes an array into the ring with put(), and
+    sends a small reference to it instead. The client turns the reference into a NumPy
+    view on the ring with view(); no copy is made.
+
+    The client creates the ring with create(), and tells the server its path (see the
+    command SHM_OPEN); the server then maps the same file with attach().
+
+    A view is valid until the producer has written capacity more bytes to the ring,
+    after which its data gets overwritten. So with observations of S bytes, the views of
+    the last capacity/S - 1 observations are still valid. Copy an array if it has to be
+    kept longer; isValid() tells whether a reference still is.
+    '''
+
+    def __init__(self, path:str, mm:mmap.mmap, capacity:int, owner:bool):
+        self.path = path
+        self.mm = mm
+        self.capacity = capacity
+        self.owner = owner
+        self.head = 0
+
+    @classmethod
+    def create(cls, capacity:int, directory:Optional[str]=None) -> "SharedRing" :
+        '''
+        Create a new ring-file with room for the given number of bytes.
+        '''
+        capacity += (-capacity) % ALIGNMENT
+        path = os.path.join(directory or _defaultDirectory(), f"japyre-{os.getpid()}-{uuid.uuid4().hex[:8]}.ring")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, DATA_OFFSET + capacity)
+            mm = mmap.mmap(fd, DATA_OFFSET + capacity)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(mm, 0, MAGIC, capacity, 0)
+        return cls(path,mm,capacity,owner=True)
+
+    @classmethod
+    def attach(cls, path:str) -> "SharedRing" :
+        '''
+        Map an existing ring-file, created by create(). Raises a ValueError if the file
+        is not a ring-file.
+        '''
+        fd = os.open(path, os.O_RDWR)
+        try:
+            mm = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        magic, capacity, head = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or len(mm) != DATA_OFFSET + capacity :
+            mm.close()
+            raise ValueError(f"{path} is not a ring-file.")
+        ring = cls(path,mm,capacity,owner=False)
+        ring.head = head
+        return ring
+
+    def unlink(self) -> None :
+        '''
+        Remove the ring-file. The mappings of both sides stay valid, so this can be done
+        as soon as the server has attached to the ring.
+        '''
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self) -> None :
+        if self.owner :
+            self.unlink()
+        try:
+            self.mm.close()
+        except BufferError:
+            # there are still views on the ring; the mapping is released with the last one
+            pass
+
+    def _spaceNeeded(self, nbytes:int) -> int :
+        '''
+        The number of ring-bytes putting an array of nbytes would use up, including
+        the end of the ring that is skipped if the array does not fit there.
+        '''
+        size = nbytes + (-nbytes) % ALIGNMENT
+        offset = self.head % self.capacity
+        if offset + size > self.capacity :
+            return self.capacity - offset + size
+        return size
+
+    def put(self, array) -> Optional[List] :
+        '''
+        Write a NumPy array into the ring, and return a reference to it, or None if the
+        array is bigger than the ring.
+        '''
+        import numpy as np
+        nbytes = array.nbytes
+        size = nbytes + (-nbytes) % ALIGNMENT
+        if size > self.capacity or array.dtype.hasobject :
+            return None
+        offset = self.head % self.capacity
+        if offset + size > self.capacity :
+            self.head += self.capacity - offset
+            offset = 0
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=self.mm, offset=DATA_OFFSET + offset)
+        target[...] = array
+        position = self.head
+        self.head += size
+        _HEADER.pack_into(self.mm, 0, MAGIC, self.capacity, self.head)
+        return [position, array.dtype.str, list(array.shape)]
+
+    def currentHead(self) -> int :
+        return _HEADER.unpack_from(self.mm, 0)[2]
+
+    def isValid(self, ref:List) -> bool :
+        '''
+        Check whether the data of the given reference has not been overwritten yet.
+        '''
+        return self.currentHead() - ref[0] <= self.capacity
+
+    def view(self, ref:List) :
+        '''
+        Return a read-only NumPy view on the array the given reference refers to.
+        '''
+        import numpy as np
+        position, dtype, shape = ref
+        view = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=self.mm,
+                          offset=DATA_OFFSET + position % self.capacity)
+        view.flags.writeable = False
+        return view
+
+    def export(self, obj:Any, threshold:int) -> Any :
+        '''
+        Return a copy of the given message in which every NumPy array of at least
+        threshold bytes is put in the ring, and replaced by a reference {SHM_REF:ref}.
+        Smaller arrays are left in the message. So are the arrays that no longer fit
+        once the message has used up the whole ring, as they would otherwise overwrite
+        the arrays put earlier in the same message.
+        '''
+        return self._export(obj,threshold,[self.capacity])
+
+    def _export(self, obj:Any, threshold:int, budget:List[int]) -> Any :
+        if isinstance(obj,dict) :
+            return { k:self._export(v,threshold,budget) for k,v in obj.items() }
+        if isinstance(obj,(list,tuple)) :
+            return [ self._export(v,threshold,budget) for v in obj ]
+        np = sys.modules.get("numpy")
+        if np is not None and isinstance(obj,np.ndarray) and obj.nbytes >= threshold :
+            needed = self._spaceNeeded(obj.nbytes)
+            if needed <= budget[0] :
+                ref = self.put(obj)
+                if ref is not None :
+                    budget[0] -= needed
+                    return { SHM_REF:ref }
+        return obj
+
+    def resolve(self, obj:Any) -> Any :
+        '''
+        The inverse of export(): replace every reference in the given message by a
+        view on the ring. Dictionaries and lists are updated in place.
+        '''
+        if isinstance(obj,dict) :
+            if len(obj) == 1 and SHM_REF in obj :
+                return self.view(obj[SHM_REF])
+            for k,v in obj.items() :
+                if isinstance(v,(dict,list)) :
+                    obj[k] = self.resolve(v)
+        elif isinstance(obj,list) :
+            for i,v in enumerate(obj) :
+                if isinstance(v,(dict,list)) :
+                    obj[i] = self.resolve(v)
+        return obj
@@ -0,0 +1,190 @@
+import socket
+import json
+import struct
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING :
+    import asyncio
+
+LINE_FRAMING   = "line"    # every message is terminated by a newline-character
+LENGTH_FRAMING = "length"  # every message is preceded by a 4-byte big-endian length
+
+_LENGTH_HEADER = struct.Struct(">I")
+
+class SocketChannel:
+    '''
+    A reader/writer of messages over a socket. It is the Python-side twin of the Java
+    class ObjectReaderWriter_OverSocket. A single recv() on a stream-socket can deliver
+    only a part of a message, or parts of several messages. This class takes care
+    of splitting the incoming byte-stream into whole messages (frames).
+
+    Two framings are supported:
+
+       "line"   : a message is a line terminated by a newline-character. This is
+                  the default, and is compatible with readLine()/println() used at
+                  the Java-side.
+       "length" : a message is preceded by a 4-byte big-endian unsigned integer
+                  specifying its length in bytes. This is only understood by
+                  a Python-side peer.
+
+    Incoming data is received into a single receive-buffer, which is reused across
+    calls and only grows when a message does not fit in it.
+    '''
+
+    def __init__(self, sock:socket.socket, framing:str=LINE_FRAMING, receiveBufferSize:int=4096):
+        '''
+        Parameters:
+        sock (socket): a connected stream-socket
+        framing (str): either "line" or "length"
+        receiveBufferSize (int): the initial size of the receive-buffer; the buffer
+                                 grows when a bigger message arrives.
+        '''
+        if framing != LINE_FRAMING and framing != LENGTH_FRAMING :
+            raise ValueError(f"Unknown framing: {framing}")
+        self.socket = sock
+        self.framing = framing
+        self.buffer = bytearray(max(receiveBufferSize,16))
+        # the received but not yet consumed bytes are in self.buffer[self.start:self.end]
+        self.start = 0
+        self.end = 0
+        # position up to which we already looked for a newline:
+        self.scanned = 0
+        # the number of bytes that went over the wire, including framing:
+        self.bytesSent = 0
+        self.bytesReceived = 0
+
+    def _receive(self) -> bool :
+        '''
+        Receive more bytes from the socket into the receive-buffer. Consumed bytes
+        at the front of the buffer are discarded first, and the buffer is doubled
+        when it is full. Returns False if the peer has closed the connection.
+        '''
+        if self.start > 0 :
+            n = self.end - self.start
+            self.buffer[0:n] = self.buffer[self.start:self.end]
+            self.scanned -= self.start
+            self.start = 0
+            self.end = n
+        if self.end == len(self.buffer) :
+            self.buffer.extend(bytes(len(self.buffer)))
+        with memoryview(self.buffer) as view :
+            n = self.socket.recv_into(view[self.end:])
+        if n == 0 :
+            return False
+        self.end += n
+        self.bytesReceived += n
+        return True
+
+    def _take(self, length:int, skip:int) -> bytes :
+        '''
+        Remove the first length bytes of unconsumed data and return them; skip more
+        bytes are dropped after it (the frame delimiter).
+        '''
+        frame = bytes(self.buffer[self.start:self.start + length])
+        self.start += length + skip
+        self.scanned = self.start
+        if self.start == self.end :
+            self.start = self.end = self.scanned = 0
+        return frame
+
+    def readFrame(self) -> Optional[bytes] :
+        '''
+        Read the next whole message from the socket, and return it as bytes (without
+        the frame delimiter or length-header). Returns None if the peer has closed
+        the connection.
+        '''
+        if self.framing == LINE_FRAMING :
+            while True :
+                i = self.buffer.find(b"\n", self.scanned, self.end)
+                if i >= 0 :
+                    length = i - self.start
+                    # tolerate the \r\n line-ending that Java's println uses on Windows:
+                    if length > 0 and self.buffer[i-1] == 13 :
+                        return self._take(length - 1, 2)
+                    return self._take(length, 1)
+                self.scanned = self.end
+                if not self._receive() :
+                    # like Java's readLine(), a last unterminated line is still a line:
+                    if self.end > self.start :
+                        return self._take(self.end - self.start, 0)
+                    return None
+        else :
+            header = _LENGTH_HEADER.size
+            while self.end - self.start < header :
+                if not self._receive() :
+                    return None
+            (length,) = _LENGTH_HEADER.unpack_from(self.buffer, self.start)
+            self.start += header
+            while self.end - self.start < length :
+                if not self._receive() :
+                    raise ConnectionError("The connection was closed in the middle of a message.")
+            return self._take(length, 0)
+
+    def writeFrame(self, payload:bytes) -> None :
+        '''
+        Send the given bytes as a single message.
+        '''
+        frame = encodeFrame(payload,self.framing)
+        self.socket.sendall(frame)
+        self.bytesSent += len(frame)
+
+    def read(self) -> Any :
+        '''
+        Read the next message, and return it as an object decoded from Json.
+        Returns None if the peer has closed the connection.
+        '''
+        frame = self.readFrame()
+        if frame is None :
+            return None
+        return json.loads(frame)
+
+    def write(self, obj:Any) -> None :
+        '''
+        Send the given object, encoded as a Json-string.
+        '''
+        self.writeFrame(json.dumps(obj).encode("utf-8"))
+
+
+def framingOverhead(framing:str=LINE_FRAMING) -> int :
+    '''
+    The number of bytes a framing adds to every message.
+    '''
+    return 1 if framing == LINE_FRAMING else _LENGTH_HEADER.size
+
+def encodeFrame(payload:bytes, framing:str=LINE_FRAMING) -> bytes :
+    '''
+    Return the bytes to put on the wire to send the given payload as a single
+    message, with the given framing.
+    '''
+    if framing == LINE_FRAMING :
+        return payload + b"\n"
+    return _LENGTH_HEADER.pack(len(payload)) + payload
+
+async def readFrameAsync(reader:"asyncio.StreamReader", framing:str=LINE_FRAMING) -> Optional[bytes] :
+    '''
+    The asyncio counterpart of SocketChannel.readFrame(): read the next whole message
+    from the given stream-reader. Returns None if the peer has closed the connection.
+    '''
+    # asyncio takes long to import, and is only needed by the asyncio-based parts:
+    import asyncio
+    if framing == LINE_FRAMING :
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # like Java's readLine(), a last unterminated line is still a line:
+            return e.partial if e.partial else None
+        if line.endswith(b"\r\n") :
+            return line[:-2]
+        return line[:-1]
+    else :
+        try:
+            header = await reader.readexactly(_LENGTH_HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial :
+                raise ConnectionError("The connection was closed in the middle of a message.")
+            return None
+        (length,) = _LENGTH_HEADER.unpack(header)
+        try:
+            return await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("The connection was closed in the middle of a message.")
@@ -0,0 +1,162 @@
+import numpy as np
+from typing import Hashable, Iterable, List, Optional
+
+class SparseQTable:
+    '''
+    A Q-table whose rows are only allocated when a state is visited for the first time,
+    so its memory grows with the number of states actually seen, rather than with the
+    size of the whole state space. Rows are keyed directly by a hashable state-key
+    (see obskey.canonicalKey), and stored in a single 2D NumPy array (the arena)
+    that is doubled when it is full.
+
+    Optionally, the number of stored states can be capped with maxStates. When the cap
+    is reached, the least visited states are evicted (a chunk at a time), and their rows
+    are reused. Visit-counts are halved on every eviction, so that states that were
+    popular long ago can eventually be evicted too.
+
+    table[key] gives the row of Q-values of a state, as a view into the arena. Such a
+    view is only valid until the next allocation of a row (the arena may be reallocated,
+    or the row evicted); use rows() to obtain the rows of several states at once.
+    '''
+
+    def __init__(self, numberOfActions:int, initialCapacity:int=1024,
+                 maxStates:Optional[int]=None,
+                 rng:Optional[np.random.Generator]=None):
+        '''
+        Parameters:
+        numberOfActions (int): the number of actions, so the length of every row
+        initialCapacity (int): the number of rows the arena initially has room for
+        maxStates (int): if given, the maximum number of states kept in the table
+        rng : the random generator used to initialize new rows with small random values
+        '''
+        self.numberOfActions = numberOfActions
+        self.maxStates = maxStates
+        self.rng = rng if rng is not None else np.random.default_rng()
+        capacity = initialCapacity if maxStates is None else min(initialCapacity,maxStates)
+        self.values = np.empty((max(capacity,1),numberOfActions))
+        self.visits = np.zeros(len(self.values), dtype=np.int64)
+        # the key of the state stored in every row, or None if the row is free:
+        self.keys = [None] * len(self.values)
+        self.index = {}
+        self.freeRows = []
+        self.used = 0      # rows [0..used) have been handed out at least once
+        self.evictions = 0
+
+    @classmethod
+    def fromRows(cls, values:np.ndarray, keys:List[Hashable], maxStates:Optional[int]=None,
+                 rng:Optional[np.random.Generator]=None) -> "SparseQTable" :
+        '''
+        Create a table whose arena is the given 2D array (which can e.g. be memory-mapped),
+        where row r holds the Q-values of the state keys[r]. The array is only copied when
+        a new state has to be added.
+        '''
+        table = cls(values.shape[1],initialCapacity=1,maxStates=maxStates,rng=rng)
+        table.values = values
+        table.visits = np.zeros(len(values), dtype=np.int64)
+        table.keys = list(keys)
+        table.index = { k:r for r,k in enumerate(table.keys) }
+        table.used = len(table.keys)
+        return table
+
+    def __len__(self) -> int :
+        return len(self.index)
+
+    def __contains__(self, key:Hashable) -> bool :
+        return key in self.index
+
+    def _grow(self) -> None :
+        capacity = 2 * len(self.values)
+        if self.maxStates is not None :
+            capacity = min(capacity,self.maxStates)
+        values = np.empty((capacity,self.numberOfActions))
+        values[:self.used] = self.values[:self.used]
+        visits = np.zeros(capacity, dtype=np.int64)
+        visits[:self.used] = self.visits[:self.used]
+        self.values = values
+        self.visits = visits
+        self.keys.extend([None] * (capacity - len(self.keys)))
+
+    def _evict(self, needed:int, protected:set) -> None :
+        '''
+        Evict at least the given number of least visited states, but none of the
+        protected ones.
+        '''
+        chunk = max(needed, self.maxStates // 16)
+        candidates = np.fromiter((r for r,k in enumerate(self.keys[:self.used]) if k is not None and k not in protected),
+                                 dtype=np.intp)
+        chunk = min(chunk,len(candidates))
+        if chunk < needed :
+            raise ValueError("Cannot make room in the Q-table; maxStates is too small.")
+        if chunk < len(candidates) :
+            victims = candidates[np.argpartition(self.visits[candidates],chunk-1)[:chunk]]
+        else :
+            victims = candidates
+        for r in victims :
+            del self.index[self.keys[r]]
+            self.keys[r] = None
+            self.freeRows.append(int(r))
+        self.visits[:self.used] >>= 1
+        self.evictions += len(victims)
+
+    def _allocate(self, key:Hashable) -> int :
+        if self.freeRows :
+            r = self.freeRows.pop()
+        else :
+            if self.used == len(self.values) :
+                self._grow()
+            r = self.used
+            self.used += 1
+        self.values[r] = self.rng.random(self.numberOfActions) / 100.0
+        self.visits[r] = 0
+        self.keys[r] = key
+        self.index[key] = r
+        return r
+
+    def rows(self, keys:Iterable[Hashable]) -> np.ndarray :
+        '''
+        Return the arena row-indices of the states with the given keys, allocating
+        rows for states not seen before. The returned rows stay valid until the next
+        call of rows() or row().
+        '''
+        keys = list(keys)
+        if self.maxStates is not None :
+            missing = len(set(k for k in keys if k not in self.index))
+            needed = len(self.index) + missing - self.maxStates
+            if needed > 0 :
+                self._evict(needed,set(keys))
+        index = self.index
+        result = np.empty(len(keys), dtype=np.intp)
+        for i,k in enumerate(keys) :
+            r = index.get(k)
+            if r is None :
+                r = self._allocate(k)
+            result[i] = r
+        np.add.at(self.visits,result,1)
+        return result
+
+    def row(self, key:Hashable) -> int :
+        '''
+        Return the arena row-index of the state with the given key, allocating a row if
+        the state was not seen before.
+        '''
+        r = self.index.get(key)
+        if r is None :
+            if self.maxStates is not None and len(self.index) >= self.maxStates :
+                self._evict(len(self.index) + 1 - self.maxStates,{key})
+            r = self._allocate(key)
+        self.visits[r] += 1
+        return r
+
+    def __getitem__(self, key:Hashable) -> np.ndarray :
+        # row() may reallocate the arena, so it must be called before reading self.values:
+        r = self.row(key)
+        return self.values[r]
+
+    def stateKeys(self) -> List[Hashable] :
+        '''
+        Return the keys of the stored states, in the order of their rows.
+        '''
+        return [ k for k in self.keys[:self.used] if k is not None ]
+
+    def __str__(self) -> str :
+        return "\n".join(f"{k}: {self.values[r]}" for k,r in self.index.items())
@@ -0,0 +1,85 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+class SquareWorld:
+    '''
+    A Python port of the Java-side SquareWorld gym (see SquareWorld.java). It is a
+    tiled NxN grid, where a robot is dropped in its center. Its goal is to reach the
+    top-right corner of the grid (location (N-1,N-1)). The robot can move
+    left/right/up/down. Moving off the grid causes the robot to be broken.
+    Getting to the goal location gives a reward of 100; getting broken -100; and
+    else the reward is 0.
+
+    The class offers the same methods as the Java interface IJavaGymEnv, so that it
+    can be served by the Python-side GymEnvServer as a stand-in for the Java gym.
+    Observations are dictionaries {"x":..,"y":..}, just like the Json-objects the
+    Java-side sends. To mimic gyms with bigger observations (e.g. for benchmarking),
+    paddingSize extra numbers can be added to every observation, under the name "pad".
+    The padding is a NumPy array, like e.g. an image would be.
+    '''
+
+    LEFT  = "left"
+    RIGHT = "right"
+    UP    = "up"
+    DOWN  = "down"
+
+    def __init__(self, size:int, paddingSize:int=0):
+        self.size = size
+        self.padding = None
+        if paddingSize > 0 :
+            import numpy as np
+            self.padding = np.full(paddingSize, 0.5, dtype=np.float32)
+        self.x = size // 2
+        self.y = size // 2
+        self.stepCount = 0
+
+    def reset(self) -> Dict :
+        self.x = self.size // 2
+        self.y = self.size // 2
+        self.stepCount = 0
+        return self.observe()
+
+    def close(self) -> None :
+        pass
+
+    def actionSpace(self) -> List[str] :
+        return [SquareWorld.LEFT, SquareWorld.RIGHT, SquareWorld.UP, SquareWorld.DOWN]
+
+    def observe(self) -> Dict :
+        if self.padding is not None :
+            return { "x":self.x, "y":self.y, "pad":self.padding }
+        return { "x":self.x, "y":self.y }
+
+    def goalAchieved(self) -> bool :
+        return self.x == self.size-1 and self.y == self.size-1
+
+    def offTheGrid(self) -> bool :
+        return self.x < 0 or self.x >= self.size or self.y < 0 or self.y >= self.size
+
+    def isTerminalState(self) -> bool :
+        return self.goalAchieved() or self.offTheGrid()
+
+    def step(self, action:str) -> Optional[Tuple[Any,float,bool]] :
+        '''
+        Execute the given action. Returns a tuple (obs,reward,done), or None if the
+        robot is already in a terminal state.
+        '''
+        if self.isTerminalState() :
+            return None
+        if action == SquareWorld.LEFT :
+            self.x -= 1
+        elif action == SquareWorld.RIGHT :
+            self.x += 1
+        elif action == SquareWorld.DOWN :
+            self.y -= 1
+        elif action == SquareWorld.UP :
+            self.y += 1
+        reward = 100.0 if self.goalAchieved() else (-100.0 if self.offTheGrid() else 0.0)
+        self.stepCount += 1
+        return (self.observe(), reward, self.isTerminalState())
+
+
+# just for testing:
+if __name__ == '__main__':
+    sw = SquareWorld(6)
+    for a in [SquareWorld.RIGHT, SquareWorld.RIGHT, SquareWorld.UP, SquareWorld.RIGHT, SquareWorld.RIGHT] :
+        print(f">> {a}: {sw.step(a)}")
@@ -1,8 +1,9 @@
 import gym
 import numpy as np
 from gym import spaces
-from gymenv_client import GymEnvClient
-from stable_baselines3 import PPO
+from .gymenv_client import GymEnvClient
+from .vec_gymenv import VecGymEnv
+from .obs_schema import ObservationSchema, Field
 
 class SqWorldEnv(gym.Env) :
     '''
@@ -21,26 +22,53 @@ class SqWorldEnv(gym.Env) :
     Getting to the goal location gives a reward of 100; getting broken -100; and else the reward
     is 0. The task of RL is to find a sequence of interactions that would maximize the total
     reward.
+
+    Observations are decoded to arrays [x,y] by an ObservationSchema, which also defines
+    the observation_space. Note that the returned arrays are reused, see ObservationSchema.
     '''
 
-    def __init__(self, worldSize):
+    def __init__(self, worldSize, host="127.0.0.1", port=9999, client=None, **clientOptions):
+        '''
+        The clientOptions are passed to the GymEnvClient, e.g. sharedMemorySize=2**20
+        to receive large observation-arrays as views on a shared-memory ring.
+        Alternatively, an already connected client can be given, e.g. one handed out
+        by an EnvServerSupervisor (see supervisor.py); host and port are then ignored.
+        '''
         super(SqWorldEnv, self).__init__()
         self.size = worldSize
-        self.javaGym = GymEnvClient("127.0.0.1",9999)
+        self.javaGym = client if client is not None else GymEnvClient(host,port,**clientOptions)
+        self.schema = sqWorldSchema(worldSize)
         self.action_space = spaces.Discrete(len(self.javaGym.actionSpace))
-        self.observation_space = spaces.Box(low=-1, high=worldSize, shape=(1,), dtype=np.int8) 
+        self.observation_space = self.schema.observationSpace()
 
     def reset(self):
         o = self.javaGym.reset()
-        return np.array([o["x"], o["y"]])
+        return self.schema.decode(o)
 
     def close(self):
         self.javaGym.close()
 
     def step(self,action):
         o,rw,done,info = self.javaGym.step(self.javaGym.actionSpace[action])
-        return (np.array([o["x"], o["y"]]), rw, done, info)
+        return (self.schema.decode(o), rw, done, info)
+
+def sqWorldSchema(worldSize) -> ObservationSchema :
+    '''
+    The schema of SquareWorld observations: the robot's position (x,y), which can
+    be one tile off the grid.
+    '''
+    return ObservationSchema([ Field("x", low=-1, high=worldSize),
+                               Field("y", low=-1, high=worldSize) ], dtype=np.int32)
+
+def makeSqWorldVecEnv(worldSize, ports, host="127.0.0.1") -> VecGymEnv :
+    '''
+    Create a vectorized SquareWorld env over several SquareWorldGymServers, all
+    running on the given host, one on each of the given ports.
+    '''
+    return VecGymEnv([ (host,p) for p in ports ], sqWorldSchema(worldSize))
 
+# To train e.g. a PPO-model on it (stable-baselines3 is imported only here, as it takes long):
+#from stable_baselines3 import PPO
 #model = PPO("MlpPolicy", env, verbose=1)
 #model.learn(total_timesteps=10_000)
 
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List
+
+# Checks that the client/server core of japyre still starts fast, e.g. to be run in CI
+# after changing imports:
+#
+#    python -m japyre.startup_check --budget 150
+#
+# The test python/tests/test_startup.py runs the same check, with the default budget.
+#
+# Every core module is imported in a fresh interpreter. The check fails if that takes
+# longer than the budget, or if it loads one of the heavy modules below: those take
+# hundreds of milliseconds (torch even seconds) to import, which every forked worker
+# or freshly started ModelServer would pay for before serving anything.
+
+CORE_MODULES = [
+    "japyre",
+    "japyre.gymenv_client",
+    "japyre.async_gymenv_client",
+    "japyre.gymenv_server",
+    "japyre.commandserver",
+    "japyre.modelserver",
+]
+
+# the maximum import time of a core module, in milliseconds:
+DEFAULT_BUDGET = 150.0
+
+HEAVY_MODULES = [ "numpy", "gym", "gymnasium", "torch", "stable_baselines3", "asyncio" ]
+
+# the asyncio-based clients need asyncio, of course:
+ALLOWED = { "japyre.async_gymenv_client" : ["asyncio"] }
+
+_PROBE = '''
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{ "millis":(t1-t0)*1000, "loaded":[ m for m in {heavy!r} if m in sys.modules ] }}))
+'''
+
+def measure(module:str, repeat:int=3) -> Dict :
+    '''
+    Import the module in fresh interpreters, and return the fastest import time (in
+    milliseconds) and the heavy modules it loaded.
+    '''
+    # import this very copy of japyre, also when it is not installed:
+    sourceDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (sourceDir, env.get("PYTHONPATH")) if p)
+    best = None
+    for _ in range(repeat) :
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             check=True, capture_output=True, text=True, env=env).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result["millis"] < best["millis"] :
+            best = result
+    return best
+
+def check(budgetMillis:float=DEFAULT_BUDGET, modules:List[str]=CORE_MODULES) -> List[str] :
+    '''
+    Check the given modules; returns the problems found (an empty list if none).
+    '''
+    problems = []
+    for module in modules :
+        result = measure(module)
+        loaded = [ m for m in result["loaded"] if m not in ALLOWED.get(module,[]) ]
+        print(f"{module:<30}{result['millis']:>8.1f} ms  {'loads ' + ', '.join(loaded) if loaded else ''}")
+        if loaded :
+            problems.append(f"importing {module} loads {', '.join(loaded)}")
+        if result["millis"] > budgetMillis :
+            problems.append(f"importing {module} takes {result['millis']:.1f} ms, over the budget of {budgetMillis} ms")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that the core of japyre is imported fast, and without heavy dependencies.")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="the maximum import time of a module, in milliseconds")
+    parser.add_argument("modules", nargs="*", default=CORE_MODULES)
+    args = parser.parse_args()
+    problems = check(args.budget, args.modules)
+    for p in problems :
+        print(f"FAILED: {p}")
+    sys.exit(1 if problems else 0)
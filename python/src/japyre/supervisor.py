@@ -0,0 +1,380 @@
+import os
+import sys
+import time
+import queue
+import socket
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .gymenv_client import GymEnvClient
+
+logger = logging.getLogger(__name__)
+
+# The command to start a Python stand-in GymEnvServer (see gymenv_server.py), e.g. to
+# test without a JVM. The Java-side counterpart would be e.g.
+#
+#    ["java", "-cp", classpath, "eu.iv4xr.japyre.rl.examples.SquareWorldGymServer", "{port}"]
+#
+STAND_IN_COMMAND = [sys.executable, "-m", "japyre.gymenv_server", "--port", "{port}"]
+
+def freePort(host:str="127.0.0.1") -> int :
+    '''
+    Return a TCP port that is free at the moment. Another process can still take it
+    before the server binds it; the supervisor then simply tries again.
+    '''
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s :
+        s.bind((host,0))
+        return s.getsockname()[1]
+
+class ServerProcess:
+    '''
+    A GymEnvServer running in its own process, started from a command-template: a list
+    of arguments, in which "{port}" and "{host}" are replaced by the port the server
+    should listen at, and the host. This copy of japyre is put on the PYTHONPATH of the
+    process, so that e.g. STAND_IN_COMMAND also works from a checkout.
+    '''
+
+    def __init__(self, commandTemplate:Sequence[str], host:str="127.0.0.1", quiet:bool=True):
+        self.commandTemplate = list(commandTemplate)
+        self.host = host
+        self.quiet = quiet
+        self.port = None
+        self.process = None
+
+    def start(self) -> None :
+        self.port = freePort(self.host)
+        command = [ a.replace("{port}",str(self.port)).replace("{host}",self.host) for a in self.commandTemplate ]
+        logger.info("starting %s", " ".join(command))
+        # so that a Python server finds this copy of japyre, installed or not:
+        sourceDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (sourceDir, env.get("PYTHONPATH")) if p)
+        self.process = subprocess.Popen(command, stdin=subprocess.DEVNULL, env=env,
+                                        stdout=subprocess.DEVNULL if self.quiet else None)
+
+    def alive(self) -> bool :
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self, timeout:float=5.0) -> None :
+        if self.process is None :
+            return
+        if self.process.poll() is None :
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+class SupervisedEnvClient:
+    '''
+    A GymEnvClient whose server is looked after by an EnvServerSupervisor. It offers
+    the same methods as GymEnvClient. When the server crashes, the supervisor restarts
+    it and reconnects this client, transparently:
+
+        - reset() (and other commands) are then simply sent again, to the new server;
+        - step() cannot be redone, as the episode is lost; it returns the last
+          observation, a zero reward, and done=True, with the info
+          {"truncated":True, "serverRestarted":True}, so that the learner resets.
+          step_many() likewise returns [(lastObservation,0.0,True)].
+    '''
+
+    def __init__(self, supervisor:"EnvServerSupervisor", index:int):
+        self.supervisor = supervisor
+        self.index = index
+        self.server = ServerProcess(supervisor.commandTemplate, supervisor.host, supervisor.quiet)
+        self.client = None
+        self.actionSpace = None
+        self.lastObservation = None
+        self.restarts = 0
+
+    def launch(self) -> None :
+        '''
+        Start the server, and connect to it once it is ready.
+        '''
+        for attempt in range(self.supervisor.startAttempts) :
+            self.server.start()
+            try:
+                self.client = self._connect()
+                self.actionSpace = self.client.actionSpace
+                return
+            except RuntimeError as e:
+                # e.g. another process took the port; try again on another:
+                logger.warning("server %d did not start: %s", self.index, e)
+                self.server.stop()
+        raise RuntimeError(f"Server {self.index} could not be started.")
+
+    def _connect(self) -> GymEnvClient :
+        '''
+        Connect to the server, retrying until it is ready; the server is ready when it
+        accepts the connection and answers GET_ACTIONSPACE.
+        '''
+        deadline = time.monotonic() + self.supervisor.startupTimeout
+        while True :
+            if not self.server.alive() :
+                raise RuntimeError(f"the server exited with {self.server.process.returncode}")
+            try:
+                return GymEnvClient(self.server.host, self.server.port, **self.supervisor.clientOptions)
+            except OSError:
+                if time.monotonic() > deadline :
+                    raise RuntimeError(f"the server is not ready after {self.supervisor.startupTimeout} seconds")
+                time.sleep(0.05)
+
+    def restart(self) -> None :
+        '''
+        Restart the server, and reconnect to it.
+        '''
+        logger.warning("restarting server %d", self.index)
+        if self.client is not None :
+            # the connection is broken, so just drop it:
+            try:
+                self.client.socket.close()
+            except OSError:
+                pass
+            if self.client.ring is not None :
+                self.client.ring.close()
+            self.client = None
+        self.server.stop()
+        self.restarts += 1
+        self.launch()
+
+    def ping(self) -> bool :
+        '''
+        Check that the server is alive and answers within the supervisor's pingTimeout.
+        Does not restart it.
+        '''
+        if self.client is None or not self.server.alive() :
+            return False
+        try:
+            return self.client.ping(self.supervisor.pingTimeout)
+        except socket.timeout:
+            # alive, but hung:
+            logger.warning("server %d did not answer PING within %s seconds", self.index, self.supervisor.pingTimeout)
+            return False
+        except (OSError, ValueError):
+            return False
+
+    def _exchange(self, cmd:str, arg=None) -> Tuple[Any,bool] :
+        '''
+        Send a command to the server, and return (response,False); or, if the server
+        has crashed, restart it and return (None,True).
+        '''
+        try:
+            return self.client.sendCommand(cmd,arg), False
+        except OSError:
+            # the server has crashed, or the connection is broken:
+            self.restart()
+            return None, True
+
+    def sendCommand(self, cmd:str, arg=None) :
+        r, restarted = self._exchange(cmd,arg)
+        if restarted and cmd != "KILL" :
+            r = self.client.sendCommand(cmd,arg)
+        return r
+
+    def reset(self) :
+        o = self.sendCommand("RESET")
+        self.lastObservation = o
+        return o
+
+    def step(self, action) :
+        r, restarted = self._exchange("STEP",action)
+        if restarted :
+            return (self.lastObservation, 0.0, True, {"truncated":True, "serverRestarted":True})
+        self.lastObservation = r[0]
+        return r
+
+    def step_many(self, actions) :
+        results, restarted = self._exchange("STEP_BATCH",list(actions))
+        if restarted :
+            return [(self.lastObservation, 0.0, True)]
+        if results :
+            self.lastObservation = results[-1][0]
+        return results
+
+    def softClose(self) -> None :
+        self._exchange("CLOSE")
+
+    def close(self) -> None :
+        '''
+        Give this client back to the supervisor's pool; use EnvServerSupervisor.close()
+        to actually stop the servers.
+        '''
+        self.supervisor.release(self)
+
+    def shutdown(self) -> None :
+        if self.client is not None :
+            try:
+                # a hung server would never answer CLOSE:
+                self.client.socket.settimeout(self.supervisor.pingTimeout)
+                self.client.close()
+            except OSError:
+                pass
+            self.client = None
+        self.server.stop()
+
+class EnvServerSupervisor:
+    '''
+    Launches N GymEnvServers, each in its own process, and keeps them running. For
+    example, to run 8 SquareWorld servers in the JVM:
+
+        supervisor = EnvServerSupervisor(["java", "-cp", classpath,
+                                          "eu.iv4xr.japyre.rl.examples.SquareWorldGymServer", "{port}"], 8)
+        env = SqWorldEnv(6, client=supervisor.acquire())
+
+    The servers are started from a command-template, on free ports, and the supervisor
+    waits until each accepts a connection. The connections are kept in a pool: acquire()
+    hands one out (as a SupervisedEnvClient, which can be used as a GymEnvClient), and
+    release() (or its close()) gives it back. A server that crashes is restarted, and
+    its client reconnected; see SupervisedEnvClient.
+
+    A GymEnvServer serves a single client, so the health-check uses that client's own
+    connection: healthCheck() sends the cheap command PING to every idle server, and
+    restarts those that do not answer in time (so also those that hang). It can also be
+    run periodically in the background.
+    '''
+
+    def __init__(self, commandTemplate:Sequence[str]=STAND_IN_COMMAND, numberOfServers:int=1,
+                 host:str="127.0.0.1", startupTimeout:float=30.0, healthCheckInterval:Optional[float]=None,
+                 quiet:bool=True, startAttempts:int=3, pingTimeout:float=5.0, **clientOptions):
+        '''
+        Parameters:
+        commandTemplate : the command to start a server; "{port}" and "{host}" in it are
+                          replaced by the server's port and host
+        numberOfServers (int) : the number of servers to launch
+        startupTimeout (float) : how many seconds a server may take to become ready
+        healthCheckInterval (float) : if given, healthCheck() is run every so many seconds,
+                          in a background thread
+        quiet (bool) : whether the servers' standard output is discarded
+        startAttempts (int) : how many times starting a server is tried, before giving up
+        pingTimeout (float) : how many seconds a server may take to answer a PING in the
+                          health-check, before it is considered hung and restarted
+        clientOptions : passed to the GymEnvClients, e.g. codec="binary"
+        '''
+        self.commandTemplate = list(commandTemplate)
+        self.host = host
+        self.startupTimeout = startupTimeout
+        self.quiet = quiet
+        self.startAttempts = startAttempts
+        self.pingTimeout = pingTimeout
+        self.clientOptions = clientOptions
+        self.members = [ SupervisedEnvClient(self,i) for i in range(numberOfServers) ]
+        self.idle = queue.Queue()
+        self.closed = threading.Event()
+        # launch all servers first, so that they start up in parallel:
+        try:
+            for m in self.members :
+                m.server.start()
+            for m in self.members :
+                try:
+                    m.client = m._connect()
+                    m.actionSpace = m.client.actionSpace
+                except RuntimeError :
+                    m.server.stop()
+                    m.launch()
+                self.idle.put(m)
+        except:
+            self.close()
+            raise
+        self.healthChecker = None
+        if healthCheckInterval is not None :
+            self.healthChecker = threading.Thread(target=self._checkPeriodically, args=(healthCheckInterval,),
+                                                  name="japyre-health-check", daemon=True)
+            self.healthChecker.start()
+
+    def acquire(self, timeout:Optional[float]=None) -> SupervisedEnvClient :
+        '''
+        Take a client from the pool, waiting until one is free (at most timeout seconds,
+        if given; a queue.Empty is then raised).
+        '''
+        return self.idle.get(timeout=timeout)
+
+    def release(self, client:SupervisedEnvClient) -> None :
+        '''
+        Give a client back to the pool.
+        '''
+        self.idle.put(client)
+
+    @contextmanager
+    def lease(self, timeout:Optional[float]=None) :
+        '''
+        Use a client from the pool in a with-block; it is given back afterwards.
+        '''
+        client = self.acquire(timeout)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def addresses(self) -> List[tuple] :
+        '''
+        The (host,port) of every server, e.g. for a VecGymEnv. Note that clients made
+        from these are not reconnected when a server is restarted.
+        '''
+        return [ (m.server.host, m.server.port) for m in self.members ]
+
+    def healthCheck(self) -> int :
+        '''
+        PING every idle server, and restart those that do not answer. Servers whose
+        client is in use are checked when the client next sends a command. Returns the
+        number of servers restarted.
+
+        The servers are taken from the pool one at a time, so that the others can still
+        be acquired meanwhile.
+        '''
+        restarted = 0
+        for _ in range(self.idle.qsize()) :
+            try:
+                m = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not m.ping() :
+                    m.restart()
+                    restarted += 1
+            finally:
+                self.idle.put(m)
+        return restarted
+
+    def _checkPeriodically(self, interval:float) -> None :
+        while not self.closed.wait(interval) :
+            try:
+                self.healthCheck()
+            except Exception:
+                logger.exception("the health-check failed")
+
+    def stats(self) -> Dict :
+        return {
+            "servers" : len(self.members),
+            "alive" : sum(1 for m in self.members if m.server.alive()),
+            "idle" : self.idle.qsize(),
+            "restarts" : sum(m.restarts for m in self.members)
+        }
+
+    def close(self) -> None :
+        '''
+        Stop all servers.
+        '''
+        self.closed.set()
+        for m in self.members :
+            m.shutdown()
+
+
+# just for testing:
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    supervisor = EnvServerSupervisor(STAND_IN_COMMAND, 2)
+    with supervisor.lease() as env :
+        print(f"### action space: {env.actionSpace}")
+        env.reset()
+        print(f"### {env.step('up')}")
+        # kill the server behind the client's back; the next step reports a truncated episode:
+        env.server.process.kill()
+        env.server.process.wait()
+        print(f"### {env.step('up')}")
+        print(f"### {env.reset()}")
+    print(f"### {supervisor.stats()}")
+    supervisor.close()
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from .obskey import canonicalKey
+
+class TransitionCache:
+    '''
+    A bounded cache of the transitions of a deterministic gym: it maps an (observation,
+    action) pair to the (observation,reward,done) the gym answered when the action was
+    done in a state with that observation. Observations are keyed by canonicalKey(), see
+    obskey.py. When the cache is full, the least recently used transition is evicted.
+
+    Note that this is only correct if the observation fully determines the gym's state
+    (and the gym is deterministic); see GymEnvClient for how it is used.
+    '''
+
+    def __init__(self, capacity:int=100000):
+        self.capacity = capacity
+        self.transitions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # transitions that turned out to differ from the gym's actual answer:
+        self.mismatches = 0
+
+    def __len__(self) -> int :
+        return len(self.transitions)
+
+    @staticmethod
+    def key(obs:Any, action:Any) -> Hashable :
+        return (canonicalKey(obs), canonicalKey(action))
+
+    def lookup(self, key:Hashable) -> Optional[Tuple[Any,float,bool]] :
+        '''
+        Return the cached (observation,reward,done) of the transition, or None if it
+        is not cached.
+        '''
+        t = self.transitions.get(key)
+        if t is None :
+            self.misses += 1
+            return None
+        self.transitions.move_to_end(key)
+        self.hits += 1
+        return t
+
+    def store(self, key:Hashable, obs:Any, reward:float, done:bool) -> None :
+        self.transitions[key] = (obs,reward,done)
+        self.transitions.move_to_end(key)
+        if len(self.transitions) > self.capacity :
+            self.transitions.popitem(last=False)
+            self.evictions += 1
+
+    def verify(self, key:Hashable, obs:Any, reward:float, done:bool) -> None :
+        '''
+        Check a cached transition against the gym's actual answer, and correct it if
+        it differs.
+        '''
+        cached = self.transitions.get(key)
+        if cached is not None and (canonicalKey(cached[0]) != canonicalKey(obs)
+                                   or cached[1] != reward or cached[2] != done) :
+            self.mismatches += 1
+            self.transitions[key] = (obs,reward,done)
+
+    def clear(self) -> None :
+        self.transitions.clear()
+
+    def stats(self) -> Dict :
+        lookups = self.hits + self.misses
+        return {
+            "size" : len(self.transitions),
+            "capacity" : self.capacity,
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hitRate" : self.hits / lookups if lookups > 0 else 0.0,
+            "evictions" : self.evictions,
+            "mismatches" : self.mismatches
+        }
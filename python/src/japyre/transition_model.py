@@ -0,0 +1,70 @@
+import numpy as np
+from typing import Optional, Tuple
+
+class TransitionModel:
+    '''
+    A model of a deterministic gym, learned from the transitions observed on it, for
+    Dyna-style planning (see Qlearning.learn): every (state,action) pair that was tried
+    is mapped to the reward and next state it led to, so that a learner can do many
+    simulated Q-updates from the model for every (expensive) step on a Java-side gym.
+
+    Like in a ReplayBuffer, states are stored as row-indices into the Q-table (see
+    Qlearning.stateRows) and actions as action-indices, in preallocated NumPy arrays.
+    Unlike a replay buffer, every (state,action) pair is stored only once: observing it
+    again overwrites its outcome. When the model is full, the pair stored first is
+    evicted to make room.
+
+    The same caveat about sparse Q-tables with a maximum number of states applies as
+    for ReplayBuffer.
+    '''
+
+    def __init__(self, capacity:int, rng:Optional[np.random.Generator]=None):
+        '''
+        Parameters:
+        capacity (int): the maximum number of (state,action) pairs kept
+        rng : the random generator used for sampling
+        '''
+        self.capacity = capacity
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.states      = np.zeros(capacity, dtype=np.intp)
+        self.actions     = np.zeros(capacity, dtype=np.intp)
+        self.rewards     = np.zeros(capacity, dtype=np.float64)
+        self.nextStates  = np.zeros(capacity, dtype=np.intp)
+        self.dones       = np.zeros(capacity, dtype=bool)
+        # (state,action) -> its position in the arrays:
+        self.index = {}
+        self.next = 0    # where the next new pair goes
+        self.count = 0   # the number of pairs stored
+
+    def __len__(self) -> int :
+        return self.count
+
+    def add(self, state:int, action:int, reward:float, nextState:int, done:bool) -> None :
+        '''
+        Record that doing the action in the state gave the reward and next state.
+        '''
+        pair = (state,action)
+        i = self.index.get(pair)
+        if i is None :
+            i = self.next
+            if self.count == self.capacity :
+                del self.index[(int(self.states[i]),int(self.actions[i]))]
+            self.index[pair] = i
+            self.states[i] = state
+            self.actions[i] = action
+            self.next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.rewards[i] = reward
+        self.nextStates[i] = nextState
+        self.dones[i] = done
+
+    def sample(self, batchSize:int) -> Tuple[np.ndarray,...] :
+        '''
+        Sample a batch of stored transitions, uniformly (with replacement). Returns a
+        tuple (states,actions,rewards,nextStates,dones) of arrays.
+        '''
+        if self.count == 0 :
+            raise ValueError("Cannot sample from an empty model.")
+        indices = self.rng.integers(0, self.count, batchSize)
+        return (self.states[indices], self.actions[indices], self.rewards[indices],
+                self.nextStates[indices], self.dones[indices])
@@ -0,0 +1,183 @@
+import os
+import socket
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit, parse_qs
+
+if TYPE_CHECKING :
+    import asyncio
+
+# Addresses of servers can be given as a (host,port) pair, as before, or as a URI:
+#
+#    tcp://host:port             TCP, with TCP_NODELAY on
+#    unix:///path/to/socket      a Unix-domain socket; only for a client and server
+#                                on the same host, and without the TCP/IP overhead
+#
+# Socket options can be added as a query, e.g. tcp://127.0.0.1:9999?nodelay=0&sndbuf=262144
+#
+#    nodelay : 1 (the default) or 0; whether TCP_NODELAY is set, i.e. whether Nagle's
+#              algorithm is off. Request/reply protocols like ours send small messages
+#              and wait for the answer, which Nagle's algorithm (along with delayed ACKs)
+#              can hold back for tens of milliseconds.
+#    sndbuf  : the size of the kernel's send-buffer (SO_SNDBUF), in bytes
+#    rcvbuf  : the size of the kernel's receive-buffer (SO_RCVBUF), in bytes
+
+TCP  = "tcp"
+UNIX = "unix"
+
+class Endpoint:
+    '''
+    The address of a server, along with the socket options to use on connections to
+    it (or, at the server-side, on the connections it accepts).
+    '''
+
+    def __init__(self, scheme:str, host:Optional[str]=None, port:Optional[int]=None, path:Optional[str]=None,
+                 noDelay:bool=True, sendBufferSize:Optional[int]=None, receiveBufferSize:Optional[int]=None):
+        if scheme != TCP and scheme != UNIX :
+            raise ValueError(f"Unknown transport: {scheme}")
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.path = path
+        self.noDelay = noDelay
+        self.sendBufferSize = sendBufferSize
+        self.receiveBufferSize = receiveBufferSize
+
+    def family(self) -> int :
+        return socket.AF_UNIX if self.scheme == UNIX else socket.AF_INET
+
+    def address(self):
+        '''
+        The address in the form socket.connect() and socket.bind() want it.
+        '''
+        return self.path if self.scheme == UNIX else (self.host,self.port)
+
+    def __str__(self) -> str :
+        '''
+        The URI of this endpoint, including its socket options.
+        '''
+        if self.scheme == UNIX :
+            uri = f"unix://{self.path}"
+        else :
+            uri = f"tcp://{self.host}:{self.port}"
+        options = []
+        if not self.noDelay :
+            options.append("nodelay=0")
+        if self.sendBufferSize is not None :
+            options.append(f"sndbuf={self.sendBufferSize}")
+        if self.receiveBufferSize is not None :
+            options.append(f"rcvbuf={self.receiveBufferSize}")
+        return uri + ("?" + "&".join(options) if options else "")
+
+def parseAddress(host, port:Optional[int]=None) -> Endpoint :
+    '''
+    Turn the address a server is specified with into an Endpoint. The host is either
+    an Endpoint, a URI (in which case port is ignored), or a host-name or ip, in which
+    case port is its port-number.
+    '''
+    if isinstance(host,Endpoint) :
+        return host
+    if "://" not in host :
+        return Endpoint(TCP,host,port)
+    uri = urlsplit(host)
+    query = { k:v[-1] for k,v in parse_qs(uri.query).items() }
+    noDelay = query.get("nodelay","1") not in ("0","false")
+    sendBufferSize = int(query["sndbuf"]) if "sndbuf" in query else None
+    receiveBufferSize = int(query["rcvbuf"]) if "rcvbuf" in query else None
+    if uri.scheme == UNIX :
+        return Endpoint(UNIX, path=uri.netloc + uri.path,
+                        sendBufferSize=sendBufferSize, receiveBufferSize=receiveBufferSize)
+    if uri.scheme == TCP :
+        return Endpoint(TCP, uri.hostname, uri.port, noDelay=noDelay,
+                        sendBufferSize=sendBufferSize, receiveBufferSize=receiveBufferSize)
+    raise ValueError(f"Unknown transport in the address {host}")
+
+def configure(sock:socket.socket, endpoint:Endpoint) -> socket.socket :
+    '''
+    Set the socket options of the given endpoint on a connected socket.
+    '''
+    if endpoint.scheme == TCP :
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if endpoint.noDelay else 0)
+    if endpoint.sendBufferSize is not None :
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, endpoint.sendBufferSize)
+    if endpoint.receiveBufferSize is not None :
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, endpoint.receiveBufferSize)
+    return sock
+
+def connect(endpoint:Endpoint) -> socket.socket :
+    '''
+    Open a connection to the given endpoint.
+    '''
+    sock = socket.socket(endpoint.family(), socket.SOCK_STREAM)
+    try:
+        # buffer sizes must be set before connecting, to affect the TCP window:
+        configure(sock,endpoint)
+        sock.connect(endpoint.address())
+    except:
+        sock.close()
+        raise
+    return sock
+
+def listen(endpoint:Endpoint, reuseAddress:bool=True) -> socket.socket :
+    '''
+    Create a socket listening at the given endpoint. A stale Unix-socket file left
+    by an earlier server is removed first. With TCP port 0, a free port is chosen,
+    and written back into endpoint.port.
+    '''
+    sock = socket.socket(endpoint.family(), socket.SOCK_STREAM)
+    try:
+        if endpoint.scheme == UNIX :
+            removeSocketFile(endpoint)
+        elif reuseAddress :
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # accepted sockets inherit the buffer sizes of the listening socket:
+        if endpoint.sendBufferSize is not None :
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, endpoint.sendBufferSize)
+        if endpoint.receiveBufferSize is not None :
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, endpoint.receiveBufferSize)
+        sock.bind(endpoint.address())
+        sock.listen()
+    except:
+        sock.close()
+        raise
+    if endpoint.scheme == TCP :
+        endpoint.port = sock.getsockname()[1]
+    return sock
+
+def removeSocketFile(endpoint:Endpoint) -> None :
+    '''
+    Remove the file of a Unix-socket endpoint, if there is one.
+    '''
+    if endpoint.scheme == UNIX :
+        try:
+            os.unlink(endpoint.path)
+        except FileNotFoundError:
+            pass
+
+async def openConnection(endpoint:Endpoint, limit:int):
+    '''
+    The asyncio counterpart of connect(); returns a (reader,writer) pair.
+    '''
+    # asyncio takes long to import, and is only needed by the asyncio-based parts:
+    import asyncio
+    if endpoint.scheme == UNIX :
+        reader, writer = await asyncio.open_unix_connection(endpoint.path, limit=limit)
+    else :
+        reader, writer = await asyncio.open_connection(endpoint.host, endpoint.port, limit=limit)
+    configure(writer.get_extra_info("socket"),endpoint)
+    return reader, writer
+
+async def startServer(clientConnected, endpoint:Endpoint) -> "asyncio.AbstractServer" :
+    '''
+    The asyncio counterpart of listen(): serve the connections to the given endpoint
+    with the given coroutine clientConnected(reader,writer).
+    '''
+    import asyncio
+    async def configured(reader, writer):
+        configure(writer.get_extra_info("socket"),endpoint)
+        await clientConnected(reader,writer)
+    if endpoint.scheme == UNIX :
+        removeSocketFile(endpoint)
+        return await asyncio.start_unix_server(configured, endpoint.path)
+    server = await asyncio.start_server(configured, endpoint.host, endpoint.port, reuse_address=True)
+    endpoint.port = server.sockets[0].getsockname()[1]
+    return server
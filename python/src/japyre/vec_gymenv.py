@@ -0,0 +1,179 @@
+import numpy as np
+from typing import Any, Callable, List, Sequence, Tuple, Union
+from .gymenv_client import GymEnvClient
+from .obs_schema import ObservationSchema
+
+try:
+    # when stable-baselines3 is available, we make VecGymEnv a proper SB3 VecEnv:
+    from stable_baselines3.common.vec_env import VecEnv as _VecEnvBase
+except ImportError:
+    _VecEnvBase = object
+
+class VecGymEnv(_VecEnvBase):
+    '''
+    A vectorized Gym-env over K Java-side GymEnvServers, e.g. K instances of
+    SquareWorldGymServer each running on its own port. Every call to reset() and
+    step() is forwarded to all K servers at once: the command is first sent to
+    every server, and only then are the responses collected. So the K Java-gyms
+    work in parallel, and the total wait is roughly that of the slowest server
+    rather than the sum over all servers.
+
+    Observations are converted to NumPy arrays by a user-given function, and
+    returned stacked as an array of shape (K,) + observation_space.shape. Rewards
+    and done-flags are returned as arrays of shape (K,). A sub-env that reaches a
+    terminal state is automatically reset; the observation that ended its episode
+    is then passed in its info-dictionary under the key "terminal_observation",
+    and the returned observation is the initial state of the new episode.
+
+    When stable-baselines3 is installed, this class is a subclass of its VecEnv,
+    so it can be passed directly to e.g. PPO.
+    '''
+
+    def __init__(self,
+            addresses : Sequence[Union[Tuple[str,int],str]],
+            observationConverter : Union[ObservationSchema,Callable[[Any],Any]],
+            observation_space=None,
+            action_space=None,
+            **clientOptions):
+        '''
+        Connect to the GymEnvServers at the given addresses.
+
+        Parameters:
+        addresses : a list of (host,port) pairs or address-URIs (see transport.py),
+                    one for every sub-env
+        observationConverter : an ObservationSchema, or a function that converts an
+                    observation received from a GymEnvServer to a NumPy array (or a
+                    sequence of numbers) fitting the observation_space
+        observation_space : a gym Box describing a single converted observation; when
+                    a schema is given, the space is derived from it by default
+        action_space : a gym Discrete space; when not given, one is constructed
+                    from the action-space reported by the servers. Actions are
+                    indices in the servers' list of action-names.
+        clientOptions : passed to the GymEnvClient of every sub-env, e.g. codec="binary"
+        '''
+        self.clients = [ GymEnvClient(*(a if isinstance(a,tuple) else (a,)),**clientOptions) for a in addresses ]
+        self.actionNames = self.clients[0].actionSpace
+        if action_space is None :
+            from gym import spaces
+            action_space = spaces.Discrete(len(self.actionNames))
+        self.observationConverter = observationConverter
+        if isinstance(observationConverter,ObservationSchema) :
+            # the schema decodes observations straight into the rows of obsBuffer:
+            self.schema = observationConverter
+            if observation_space is None :
+                observation_space = observationConverter.observationSpace()
+        else :
+            self.schema = None
+        numEnvs = len(self.clients)
+        if _VecEnvBase is object :
+            self.num_envs = numEnvs
+            self.observation_space = observation_space
+            self.action_space = action_space
+        else :
+            super().__init__(numEnvs,observation_space,action_space)
+        self.obsBuffer = np.zeros((numEnvs,) + tuple(observation_space.shape), dtype=observation_space.dtype)
+        self.rewards = np.zeros(numEnvs, dtype=np.float32)
+        self.dones = np.zeros(numEnvs, dtype=bool)
+        self.pendingActions = None
+
+    def _convert(self, i:int, obs) -> None :
+        '''
+        Convert an observation of sub-env i, and store it in obsBuffer.
+        '''
+        if self.schema is not None :
+            self.schema.decode(obs,out=self.obsBuffer[i])
+        else :
+            self.obsBuffer[i] = self.observationConverter(obs)
+
+    def _broadcast(self, cmd:str, args:List, indices:Sequence[int]) -> List :
+        '''
+        Send cmd to the sub-envs with the given indices, then gather their responses.
+        '''
+        for k,i in enumerate(indices) :
+            self.clients[i].sendRequest(cmd,args[k])
+        return [ self.clients[i].receiveResponse(cmd) for i in indices ]
+
+    def reset(self) :
+        '''
+        Reset all sub-envs, and return their stacked initial observations.
+        '''
+        indices = range(self.num_envs)
+        observations = self._broadcast("RESET",[None] * self.num_envs,indices)
+        for i,o in enumerate(observations) :
+            self._convert(i,o)
+        return self.obsBuffer.copy()
+
+    def step_async(self, actions) -> None :
+        self.pendingActions = actions
+        for i,client in enumerate(self.clients) :
+            client.sendRequest("STEP",self.actionNames[int(actions[i])])
+
+    def step_wait(self) :
+        infos = [ {} for _ in range(self.num_envs) ]
+        finished = []
+        for i,client in enumerate(self.clients) :
+            o,rw,done,_ = client.receiveResponse("STEP")
+            self._convert(i,o)
+            self.rewards[i] = rw
+            self.dones[i] = done
+            if done :
+                infos[i]["terminal_observation"] = self.obsBuffer[i].copy()
+                finished.append(i)
+        # auto-reset the sub-envs that reached a terminal state:
+        if finished :
+            observations = self._broadcast("RESET",[None] * len(finished),finished)
+            for i,o in zip(finished,observations) :
+                self._convert(i,o)
+        self.pendingActions = None
+        return (self.obsBuffer.copy(), self.rewards.copy(), self.dones.copy(), infos)
+
+    def step(self, actions) :
+        '''
+        Do the given actions, one for every sub-env. Returns a tuple
+        (observations,rewards,dones,infos).
+        '''
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self) -> None :
+        for client in self.clients :
+            client.close()
+
+    def _targets(self, indices) -> List[int] :
+        if indices is None :
+            return list(range(self.num_envs))
+        if isinstance(indices,int) :
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name, indices=None) -> List :
+        return [ getattr(self.clients[i],attr_name) for i in self._targets(indices) ]
+
+    def set_attr(self, attr_name, value, indices=None) -> None :
+        for i in self._targets(indices) :
+            setattr(self.clients[i],attr_name,value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs) -> List :
+        return [ getattr(self.clients[i],method_name)(*method_args,**method_kwargs) for i in self._targets(indices) ]
+
+    def env_is_wrapped(self, wrapper_class, indices=None) -> List[bool] :
+        return [ False for i in self._targets(indices) ]
+
+    def seed(self, seed=None) -> List :
+        # the Java-side gyms manage their own random seeds
+        return [ None for i in range(self.num_envs) ]
+
+
+# just for testing:
+if __name__ == '__main__':
+    from gym import spaces
+    # this assumes two SquareWorldGymServers are running, at ports 9999 and 10000:
+    size = 6
+    env = VecGymEnv([("127.0.0.1",9999),("127.0.0.1",10000)],
+                    lambda o : (o["x"],o["y"]),
+                    spaces.Box(low=-1, high=size, shape=(2,), dtype=np.int32))
+    print(env.reset())
+    for k in range(10):
+        obs,rewards,dones,infos = env.step(np.random.randint(0,4,size=env.num_envs))
+        print(f'[{k}] {obs.tolist()} {rewards} {dones}')
+    env.close()
@@ -0,0 +1,198 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from .squareworld import SquareWorld
+
+try:
+    # when stable-baselines3 is available, we make SquareWorldVecEnv a proper SB3 VecEnv:
+    from stable_baselines3.common.vec_env import VecEnv as _VecEnvBase
+except ImportError:
+    _VecEnvBase = object
+
+# the moves (dx,dy) of the actions, in the order of SquareWorld.actionSpace():
+# left, right, up, down
+MOVES = np.array([[-1,0], [1,0], [0,1], [0,-1]], dtype=np.int32)
+
+class VecSquareWorld:
+    '''
+    B SquareWorlds at once, in-process: the positions of the B robots are kept in a
+    NumPy array of shape (B,2), and step() moves all of them with a few array
+    operations. The rules and rewards are those of SquareWorld (and of the Java-side
+    SquareWorld.java): the robots start in the center of the NxN grid, reaching the
+    top-right corner (N-1,N-1) gives a reward of 100, moving off the grid -100, and
+    else the reward is 0.
+
+    This is meant as a high-throughput reference, without any sockets: to check changes
+    to e.g. Qlearning quickly, and to benchmark the rest of japyre against. Actions
+    are indices in SquareWorld.actionSpace(), and observations are the positions [x,y].
+
+    With autoReset (the default), a robot that reaches a terminal state is put back in
+    the center right after that step; the positions that ended the episodes are then
+    in terminalPositions. Without it, a robot in a terminal state stays there, and
+    further steps give it a reward of 0 and done=True, until it is reset.
+    '''
+
+    def __init__(self, size:int, numberOfEnvs:int, autoReset:bool=True):
+        self.size = size
+        self.numberOfEnvs = numberOfEnvs
+        self.autoReset = autoReset
+        self.positions = np.full((numberOfEnvs,2), size // 2, dtype=np.int32)
+        self.rewards = np.zeros(numberOfEnvs, dtype=np.float64)
+        self.dones = np.zeros(numberOfEnvs, dtype=bool)
+        self.stepCounts = np.zeros(numberOfEnvs, dtype=np.int64)
+        self.terminalPositions = self.positions.copy()
+
+    def actionSpace(self) -> List[str] :
+        return SquareWorld(self.size).actionSpace()
+
+    def reset(self, indices:Optional[Sequence[int]]=None) -> np.ndarray :
+        '''
+        Reset the given envs (all, if none are given), and return the positions of all.
+        The returned array is the env's own; copy it to keep it.
+        '''
+        if indices is None :
+            indices = slice(None)
+        self.positions[indices] = self.size // 2
+        self.dones[indices] = False
+        self.stepCounts[indices] = 0
+        return self.positions
+
+    def step(self, actions:np.ndarray) -> Tuple[np.ndarray,np.ndarray,np.ndarray] :
+        '''
+        Do the given actions, one for every env. Returns a tuple (positions,rewards,dones)
+        of arrays of shape (B,2), (B,) and (B,). The returned arrays are the env's own,
+        and are overwritten by the next step; copy them to keep them.
+        '''
+        # the robots already in a terminal state do not move:
+        active = ~self.dones
+        moves = MOVES[np.asarray(actions, dtype=np.intp)]
+        self.positions += moves * active[:,np.newaxis]
+        x = self.positions[:,0]
+        y = self.positions[:,1]
+        goal = (x == self.size - 1) & (y == self.size - 1)
+        offTheGrid = (x < 0) | (x >= self.size) | (y < 0) | (y >= self.size)
+        self.rewards[:] = 0.0
+        self.rewards[goal & active] = 100.0
+        self.rewards[offTheGrid & active] = -100.0
+        self.dones[:] = goal | offTheGrid
+        self.stepCounts += active
+        if self.autoReset :
+            finished = np.flatnonzero(self.dones)
+            if len(finished) > 0 :
+                self.terminalPositions[finished] = self.positions[finished]
+                self.positions[finished] = self.size // 2
+                self.stepCounts[finished] = 0
+            # the dones of this step are returned, but the new episodes are not done:
+            dones = self.dones.copy()
+            self.dones[:] = False
+            return self.positions, self.rewards, dones
+        return self.positions, self.rewards, self.dones
+
+class SquareWorldVecEnv(_VecEnvBase):
+    '''
+    A vectorized Gym-env over a VecSquareWorld, with the same interface as VecGymEnv
+    (and the same observations as SqWorldEnv: int32 arrays [x,y]), but without any
+    Java-side gym or socket. So it can stand in for a VecGymEnv over B
+    SquareWorldGymServers, e.g. to train a PPO-model on thousands of envs.
+
+    Sub-envs are automatically reset; the observation that ended an episode is passed
+    in its info-dictionary under the key "terminal_observation".
+
+    When stable-baselines3 is installed, this class is a subclass of its VecEnv.
+    '''
+
+    def __init__(self, size:int, numberOfEnvs:int):
+        from gym import spaces
+        self.world = VecSquareWorld(size,numberOfEnvs)
+        self.actionNames = self.world.actionSpace()
+        observation_space = spaces.Box(low=-1, high=size, shape=(2,), dtype=np.int32)
+        action_space = spaces.Discrete(len(self.actionNames))
+        if _VecEnvBase is object :
+            self.num_envs = numberOfEnvs
+            self.observation_space = observation_space
+            self.action_space = action_space
+        else :
+            super().__init__(numberOfEnvs,observation_space,action_space)
+        self.pendingActions = None
+
+    def reset(self) :
+        return self.world.reset().copy()
+
+    def step_async(self, actions) -> None :
+        self.pendingActions = actions
+
+    def step_wait(self) :
+        positions,rewards,dones = self.world.step(self.pendingActions)
+        self.pendingActions = None
+        infos = [ {} for _ in range(self.num_envs) ]
+        for i in np.flatnonzero(dones) :
+            infos[i]["terminal_observation"] = self.world.terminalPositions[i].copy()
+        return (positions.copy(), rewards.astype(np.float32), dones, infos)
+
+    def step(self, actions) :
+        '''
+        Do the given actions, one for every sub-env. Returns a tuple
+        (observations,rewards,dones,infos).
+        '''
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self) -> None :
+        pass
+
+    def _targets(self, indices) -> List[int] :
+        if indices is None :
+            return list(range(self.num_envs))
+        if isinstance(indices,int) :
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name, indices=None) -> List :
+        return [ getattr(self.world,attr_name) for i in self._targets(indices) ]
+
+    def set_attr(self, attr_name, value, indices=None) -> None :
+        setattr(self.world,attr_name,value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs) -> List :
+        return [ getattr(self.world,method_name)(*method_args,**method_kwargs) for i in self._targets(indices) ]
+
+    def env_is_wrapped(self, wrapper_class, indices=None) -> List[bool] :
+        return [ False for i in self._targets(indices) ]
+
+    def seed(self, seed=None) -> List :
+        # SquareWorld is deterministic
+        return [ None for i in range(self.num_envs) ]
+
+
+# just for testing:
+if __name__ == '__main__':
+    import time
+    from .qlearning import Qlearning
+    # Q-learning on 1024 SquareWorlds at once, with one vectorized Q-update per step (the
+    # envs often share a (state,action) pair, so their updates are averaged, see applyMinibatch):
+    size = 6
+    N_plus_2 = size + 2
+    world = VecSquareWorld(size,1024)
+    qalg = Qlearning(N_plus_2 * N_plus_2, len(MOVES))
+    rng = np.random.default_rng(0)
+    positions = world.reset().copy()
+    start = time.perf_counter()
+    for k in range(200) :
+        states = (positions[:,0] + 1) * N_plus_2 + positions[:,1] + 1
+        actions = qalg.qtable[states].argmax(axis=1)
+        explore = rng.random(world.numberOfEnvs) < qalg.exploreProbability
+        actions[explore] = rng.integers(0, len(MOVES), explore.sum())
+        nextPositions,rewards,dones = world.step(actions)
+        nextPositions = np.where(dones[:,np.newaxis], world.terminalPositions, nextPositions)
+        nextStates = (nextPositions[:,0] + 1) * N_plus_2 + nextPositions[:,1] + 1
+        qalg.applyMinibatch(states,actions,nextStates,rewards,dones)
+        positions = world.positions.copy()
+    print(f"### {200 * world.numberOfEnvs} steps in {time.perf_counter() - start:.3f}s")
+    # the greedy run from the center:
+    world = VecSquareWorld(size,1,autoReset=False)
+    positions = world.reset()
+    for k in range(2 * size) :
+        action = int(qalg.qtable[(positions[0,0] + 1) * N_plus_2 + positions[0,1] + 1].argmax())
+        positions,rewards,dones = world.step([action])
+        print(f">> {world.actionSpace()[action]}: {positions[0].tolist()} {rewards[0]} {dones[0]}")
+        if dones[0] :
+            break
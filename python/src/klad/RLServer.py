@@ -1,7 +1,16 @@
-import CommandServer
 import json
+import random
+import logging
+from japyre.commandserver import CommandServer, OK_
 from typing import Any, Callable, Dict, List
 
+logger = logging.getLogger(__name__)
+
+# what GET_NEXTACTION answers, instead of an action, when an episode or the whole
+# training is over (see the Java class JapyreTrainer):
+EPISODE_END  = "EPISODE_END"
+TRAINING_END = "TRAINING_END"
+
 class Model:
     def save(self, filename:str) -> None :
         ''' Save this model to a file. '''
@@ -48,7 +57,88 @@ class Model:
         raise
 
 
+class TabularQModel(Model):
+    '''
+    A minimal Model: a Q-table, as a dictionary from states to {action:value}, trained
+    with Q-learning and epsilon-greedy exploration. States are Json-objects, as sent by
+    the Java-side; they are keyed by their canonical Json-string. The training config
+    is that of the Java class TrainingConfiguration: numberOfEpisodes, maxEpisodeLength,
+    alpha and gamma. An episode ends after maxEpisodeLength actions, or when the state
+    offers no actions.
+    '''
+
+    def __init__(self, modelParameters:Dict):
+        '''
+        Parameters:
+        modelParameters (dict): optionally "seed" and "exploreProbability"
+        '''
+        self.seed = modelParameters.get("seed",127)
+        self.exploreProbability = modelParameters.get("exploreProbability",0.2)
+        self.rng = random.Random(self.seed)
+        self.qtable = {}
+        self.setTrainingAlgorithm({})
+
+    @staticmethod
+    def stateKey(state:Any) -> str :
+        return json.dumps(state,sort_keys=True)
+
+    def save(self, filename:str) -> None :
+        with open(filename,"w") as f :
+            json.dump({"seed":self.seed, "exploreProbability":self.exploreProbability, "qtable":self.qtable}, f)
+
+    def load(self, filename:str) -> "TabularQModel" :
+        with open(filename) as f :
+            saved = json.load(f)
+        model = TabularQModel({"seed":saved["seed"], "exploreProbability":saved["exploreProbability"]})
+        model.qtable = saved["qtable"]
+        return model
+
+    def setTrainingAlgorithm(self, trainingConf:Dict) -> None :
+        self.numberOfEpisodes = trainingConf.get("numberOfEpisodes",1)
+        self.maxEpisodeLength = trainingConf.get("maxEpisodeLength",10)
+        self.alpha = trainingConf.get("alpha",0.5)
+        self.gamma = trainingConf.get("gamma",0.9)
+        self.episode = 0
+        self.episodeLength = 0
+
+    def getNextTrainedAction(self, currentState:Dict) -> str :
+        actionValues = self.qtable.get(self.stateKey(currentState))
+        if not actionValues :
+            raise ValueError(f"The state {currentState} is unknown to the model.")
+        return max(actionValues, key=actionValues.get)
+
+    def getNextActionToTry(self, currentState:Dict, possibleActions:List[str]) -> str :
+        if self.episodeLength >= self.maxEpisodeLength or not possibleActions :
+            self.episode += 1
+            self.episodeLength = 0
+            return TRAINING_END if self.episode >= self.numberOfEpisodes else EPISODE_END
+        self.episodeLength += 1
+        actionValues = self.qtable.setdefault(self.stateKey(currentState), {})
+        for a in possibleActions :
+            # small random initial values, to break ties:
+            actionValues.setdefault(a, self.rng.random() / 100.0)
+        if self.rng.random() < self.exploreProbability :
+            return self.rng.choice(possibleActions)
+        return max(possibleActions, key=actionValues.get)
+
+    def applyReward(self, oldState:Dict, action:str, newstate:Dict, reward:float) -> None :
+        actionValues = self.qtable.setdefault(self.stateKey(oldState), {})
+        nextValues = self.qtable.get(self.stateKey(newstate))
+        best = max(nextValues.values()) if nextValues else 0.0
+        old = actionValues.get(action, 0.0)
+        actionValues[action] = old + self.alpha * (reward + self.gamma * best - old)
+
+
 class TrainingServer:
+    '''
+    A server that trains a Model on a game that is run at the Java-side (see the Java
+    class JapyreTrainer). The Java-side drives the game, and asks this server which
+    action to try next with GET_NEXTACTION, passing along the reward of the previous
+    action, which the model then learns from.
+
+    The Java-side reads the answer to every command as a String, so a command that
+    fails is answered with a String too, starting with "ERROR: ".
+    '''
     def __init__(self, host:str, port:int, modelConstructor:Callable[[Dict],Model]):
         self.host = host
         self.port = port
@@ -57,57 +147,77 @@ class TrainingServer:
         self.trainer = None
         self.previousState = None
         self.commandServer = CommandServer(host,port)
+        self.registerHandlers()
+
+    def registerHandlers(self) -> None :
+        server = self.commandServer
+        server.registerHandler("MK_FRESH_MODEL", self.answeringFailures("MK_FRESH_MODEL",self.makeFreshModel))
+        server.registerHandler("SAVE", self.answeringFailures("SAVE",self.save), argSchema=str)
+        server.registerHandler("LOAD", self.answeringFailures("LOAD",self.load), argSchema=str)
+        server.registerHandler("SET_TRAINING_CONFIG", self.answeringFailures("SET_TRAINING_CONFIG",self.setTrainingConfig))
+        # these are sent for every step of the game, so they take the fast path:
+        server.registerHandler("GET_NEXTACTION", self.answeringFailures("GET_NEXTACTION",self.getNextAction),
+                               fastPath=True)
+        server.registerHandler("GET_NEXT_TRAINEDACTION",
+                               self.answeringFailures("GET_NEXT_TRAINEDACTION",self.getNextTrainedAction),
+                               fastPath=True)
+
+    @staticmethod
+    def answeringFailures(cmd:str, handler:Callable[[Any],str]) -> Callable[[Any],str] :
+        '''
+        Wrap a handler, so that a failure is answered with an "ERROR: ..." String
+        rather than with CommandServer's error-object, which the Java-side cannot read.
+        '''
+        def answer(arg) :
+            try:
+                return handler(arg)
+            except Exception as e:
+                logger.exception("Serving %s failed", cmd)
+                return f"ERROR: {cmd} failed: {e}"
+        return answer
+
+    def makeFreshModel(self, modelParameters:Dict) -> str :
+        self.model = self.modelConstructor(modelParameters)
+        self.previousState = None
+        return OK_
+
+    def save(self, filename:str) -> str :
+        self.model.save(filename)
+        return OK_
+
+    def load(self, filename:str) -> str :
+        # a fresh server has no model yet to load with:
+        model = self.model if self.model is not None else self.modelConstructor({})
+        self.model = model.load(filename)
+        self.previousState = None
+        return OK_
+
+    def setTrainingConfig(self, trainingConfig:Dict) -> str :
+        self.model.setTrainingAlgorithm(trainingConfig)
+        return OK_
+
+    def getNextAction(self, arg:Dict) -> str :
+        state           = arg["st"]   # current observation/state
+        action          = arg["prev"] # the action that leads to the current state
+        reward          = arg["rew"]  # the reward given upon reaching the current state
+        possibleActions = arg["opts"] # list of next-actions that are possible on the current state
+        if action is not None :
+            self.model.applyReward(self.previousState,action,state,reward)
+        self.previousState = state
+        return self.model.getNextActionToTry(state,possibleActions)
 
-    def interpretCommand(self,cmd,arg):
-        retval = "OK__"
-        arg__ = json.dumps(arg)
-        if cmd == "MK_FRESH_MODEL" : 
-                modelParameters = arg__
-                self.model = self.modelConstructor(modelParameters)
-                self.previousState = None
-                return retval
-        if cmd == "SAVE"  :
-                filename = arg__
-                self.model.save(filename)
-                return retval
-        if cmd == "LOAD"  :
-                filename = arg__
-                self.model = self.model.load(filename)  
-                self.previousState = None
-                return retval
-
-        if cmd == "SET_TRAINING_CONFIG"  :
-                trainingConfig = arg__
-                self.model = self.model.setTrainingAlgorithm(trainingConfig)
-                return retval        
-
-        if cmd == "GET_NEXTACTION" :
-                state           = arg__["st"]   # current observation/state
-                action          = arg__["prev"] # the action that leads to the current state
-                reward          = arg__["rew"]  # the reward given upon reaching the current state
-                possibleActions = arg__["opts"] # list of next-actions that are possible on the current state
-                if  action != None :
-                    self.model.applyReward(self.previousState,action,state,reward)
-                self.previousState = state
-                nextAction =  self.model.getNextActionToTry(state,possibleActions)
-                return nextAction
-
-        if cmd == "GET_NEXT_TRAINEDACTION" :
-                state     = arg__  # current observation/state
-                nextAction = self.model.getNextTrainedAction(state)
-                return nextAction
-
-        raise ValueError("## receiving an unknown command: " + cmd)
+    def getNextTrainedAction(self, state:Dict) -> str :
+        return self.model.getNextTrainedAction(state)
 
     def deploy(self,receiveBufferSize=4096) -> None :
         print("> About to deploy a model-training-server.")   
-        def foo(cmd,arg) :
-            return self.interpretCommand(cmd,arg)   
-        self.commandServer.attachInterpreter(foo)
         self.commandServer.deploy(receiveBufferSize)
 
 
 
 # just for testing:
 if __name__ == '__main__':
-    print("Boo!")
+    # serve the Java-side JapyreTrainer, e.g. for the SquareWorld in its tests:
+    logging.basicConfig(level=logging.INFO)
+    server = TrainingServer("127.0.0.1", 9999, TabularQModel)
+    server.deploy()
@@ -0,0 +1,31 @@
+import threading
+from japyre.commandserver import ERROR
+from japyre.modelregistry import ModelRegistry
+from japyre.modelserver import ModelServer
+
+def loadModel(mId):
+    if mId == "missing" :
+        raise FileNotFoundError(mId)
+    return mId.upper()
+
+def test_failing_model_only_fails_its_own_requests_in_a_batch():
+    server = ModelServer("127.0.0.1", 0)
+    # a batch is only processed once it holds all three requests:
+    server.attachModelRegistry(ModelRegistry(loadModel),
+                               nextActionsGetter=lambda model,args : [ (model,a) for a in args ],
+                               maxBatchSize=3, maxWaitMicros=5_000_000)
+    query = server.commandserver.handlers["GETNEXTACTION_OF"].function
+    requests = [ {"model":"good", "arg":1}, {"model":"missing", "arg":2}, {"model":"good", "arg":3} ]
+    answers = [None] * len(requests)
+    def ask(k):
+        answers[k] = query(requests[k])
+    threads = [ threading.Thread(target=ask, args=(k,)) for k in range(len(requests)) ]
+    for t in threads :
+        t.start()
+    for t in threads :
+        t.join(10)
+    server.batcher.close()
+    assert server.batchingStats()["largestBatch"] == 3
+    assert answers[0] == ("GOOD",1)
+    assert answers[2] == ("GOOD",3)
+    assert ERROR in answers[1] and "missing" in answers[1][ERROR]
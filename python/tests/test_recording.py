@@ -0,0 +1,46 @@
+import os
+from japyre.recording import Recorder, RecordedGymEnv
+
+def recordEpisodes(fname, numberOfEpisodes, firstEpisode=0):
+    # chunkSize=1 puts every episode in a chunk of its own:
+    recorder = Recorder(fname, meta={"actionSpace":["left","right"]}, chunkSize=1)
+    for e in range(firstEpisode, firstEpisode + numberOfEpisodes) :
+        recorder.record("RESET", None, {"x":e})
+        recorder.record("STEP", "right", [{"x":e+1}, 0.0, False, None])
+        recorder.record("STEP", "right", [{"x":e+2}, 100.0, True, None])
+    recorder.close()
+
+def replayAll(fname):
+    env = RecordedGymEnv(fname)
+    episodes = []
+    for e in range(env.numberOfEpisodes) :
+        o = env.reset()
+        steps = []
+        while env.nextAction() is not None :
+            steps.append(env.step())
+        episodes.append((o,steps))
+    env.close()
+    return episodes
+
+def test_appending_after_a_cut_off_chunk(tmp_path):
+    fname = str(tmp_path / "rec.jpyrec")
+    recordEpisodes(fname, 3)
+    # a crash while writing the last chunk:
+    with open(fname,"r+b") as f :
+        f.truncate(os.path.getsize(fname) - 5)
+    recordEpisodes(fname, 3, firstEpisode=10)
+    episodes = replayAll(fname)
+    assert [ o["x"] for o,_ in episodes ] == [0, 1, 10, 11, 12]
+    assert all(len(steps) == 2 and steps[-1][2] for _,steps in episodes)
+
+def test_reader_skips_a_damaged_chunk(tmp_path):
+    fname = str(tmp_path / "rec.jpyrec")
+    recordEpisodes(fname, 3)
+    env = RecordedGymEnv(fname)
+    dataOffset = env.chunks[1][0]
+    env.close()
+    with open(fname,"r+b") as f :
+        f.seek(dataOffset + 2)
+        f.write(b"\xff\xff")
+    episodes = replayAll(fname)
+    assert [ o["x"] for o,_ in episodes ] == [0, 2]
@@ -0,0 +1,42 @@
+from japyre.codec import JSON_CODEC, encodeMessage, decodeMessage
+from klad.RLServer import TrainingServer, TabularQModel, EPISODE_END, TRAINING_END
+
+def exchange(server, cmd, arg):
+    # as the Java-side JapyreTrainer would send it, and read the answer:
+    response,_ = server.commandServer._interpret(encodeMessage({"cmd":cmd, "arg":arg}, JSON_CODEC))
+    answer = decodeMessage(response, JSON_CODEC)
+    assert isinstance(answer, str), answer
+    return answer
+
+def train(server, numberOfEpisodes):
+    # a corridor 0..3, starting at 0; reaching 3 gives 100 and ends the episode:
+    assert exchange(server, "SET_TRAINING_CONFIG", {"numberOfEpisodes":numberOfEpisodes, "maxEpisodeLength":20,
+                                                    "alpha":0.5, "gamma":0.9}) == "OK__"
+    x, previousAction, reward, episodes = 0, None, 0.0, 0
+    while True :
+        opts = [] if x == 3 else ["left","right"]
+        action = exchange(server, "GET_NEXTACTION", {"st":{"x":x}, "prev":previousAction, "rew":reward, "opts":opts})
+        if action in (EPISODE_END, TRAINING_END) :
+            episodes += 1
+            x, previousAction, reward = 0, None, 0.0
+            if action == TRAINING_END :
+                return episodes
+            continue
+        x = max(0, x - 1) if action == "left" else x + 1
+        previousAction, reward = action, (100.0 if x == 3 else 0.0)
+
+def test_train_save_and_load(tmp_path):
+    fname = str(tmp_path / "model.json")
+    server = TrainingServer("127.0.0.1", 0, TabularQModel)
+    assert exchange(server, "MK_FRESH_MODEL", {"seed":1, "exploreProbability":0.5}) == "OK__"
+    assert train(server, 200) == 200
+    assert exchange(server, "SAVE", fname) == "OK__"
+    # a fresh server, that has no model yet, loads the trained one:
+    fresh = TrainingServer("127.0.0.1", 0, TabularQModel)
+    assert exchange(fresh, "LOAD", fname) == "OK__"
+    assert [ exchange(fresh, "GET_NEXT_TRAINEDACTION", {"x":x}) for x in range(3) ] == ["right"] * 3
+
+def test_failures_are_answered_with_a_string(tmp_path):
+    server = TrainingServer("127.0.0.1", 0, TabularQModel)
+    assert exchange(server, "LOAD", str(tmp_path / "missing.json")).startswith("ERROR: LOAD failed")
+    assert exchange(server, "GET_NEXT_TRAINEDACTION", {"x":0}).startswith("ERROR: ")
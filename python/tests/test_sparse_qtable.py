@@ -0,0 +1,11 @@
+import numpy as np
+from japyre.sparse_qtable import SparseQTable
+
+def test_writes_through_getitem_survive_growing_the_arena():
+    table = SparseQTable(2, initialCapacity=1)
+    for k in range(10) :
+        # every new state may make the arena grow, while its row is being handed out:
+        table[k][:] = k
+    assert len(table.values) >= 10
+    for k in range(10) :
+        assert np.array_equal(table[k], [k,k])
@@ -0,0 +1,10 @@
+import pytest
+from japyre import startup_check
+
+# Importing the client/server core must stay fast, and must not pull in NumPy, gym,
+# torch etc.; see japyre/startup_check.py.
+
+@pytest.mark.parametrize("module", startup_check.CORE_MODULES)
+def test_core_module_starts_within_budget(module):
+    problems = startup_check.check(startup_check.DEFAULT_BUDGET, [module])
+    assert problems == []
@@ -0,0 +1,41 @@
+import os
+import signal
+import sys
+import pytest
+from japyre.supervisor import EnvServerSupervisor, STAND_IN_COMMAND
+
+@pytest.fixture
+def supervisor():
+    supervisor = EnvServerSupervisor(STAND_IN_COMMAND, 1, startupTimeout=20.0, pingTimeout=0.5)
+    yield supervisor
+    supervisor.close()
+
+def test_crashed_server_is_restarted(supervisor):
+    with supervisor.lease() as env :
+        env.reset()
+        assert env.step("up")[3] is None
+        env.server.process.kill()
+        env.server.process.wait()
+        obs,reward,done,info = env.step("up")
+        assert done and info == {"truncated":True, "serverRestarted":True}
+        # the new server serves a new episode:
+        env.reset()
+        assert not env.step("up")[2]
+    assert supervisor.stats()["restarts"] == 1
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs SIGSTOP")
+def test_hung_server_is_restarted_by_the_health_check(supervisor):
+    assert supervisor.healthCheck() == 0
+    hungProcess = supervisor.members[0].server.process
+    os.kill(hungProcess.pid, signal.SIGSTOP)
+    try:
+        assert supervisor.healthCheck() == 1
+    finally:
+        if hungProcess.poll() is None :
+            hungProcess.kill()
+            hungProcess.wait()
+    assert supervisor.members[0].server.process is not hungProcess
+    with supervisor.lease() as env :
+        env.reset()
+        assert not env.step("up")[2]
+    assert supervisor.healthCheck() == 0
@@ -10,6 +10,7 @@ import java.net.SocketException;
 
 import com.google.gson.Gson;
 import com.google.gson.GsonBuilder;
+import com.google.gson.JsonElement;
 
 /**
  * Provide a convenient reader/writer to read and write objects over a socket.
@@ -31,6 +32,13 @@ public class ObjectReaderWriter_OverSocket {
 	BufferedReader reader;
 	PrintWriter writer;
 
+	/**
+	 * The number of characters of Json written and read so far, without the
+	 * line-ends; for Json in ASCII, as Gson produces by default, these are bytes.
+	 */
+	public long bytesSent = 0;
+	public long bytesReceived = 0;
+
 	// Configuring the json serializer/deserializer. Register custom serializers
 	// here.
 	// Transient modifiers should be excluded, otherwise they will be send with json
@@ -43,6 +51,15 @@ public class ObjectReaderWriter_OverSocket {
 		writer = new PrintWriter(socket.getOutputStream(), true);
 	}
 
+	/**
+	 * Convert an object to its Json-tree, using the same serializer as
+	 * {@link #write(Object)}. This is useful to take a snapshot of an object
+	 * that will still be mutated before it is actually sent.
+	 */
+	public static JsonElement toJsonTree(Object o) {
+		return gson.toJsonTree(o) ;
+	}
+
 	/**
 	 * Send an object to the host. The object will first be serialized to a json
 	 * string, so it is assumed that the json serializer knows how to handle the
@@ -53,6 +70,7 @@ public class ObjectReaderWriter_OverSocket {
 		if (debug) {
 			System.out.println("** SENDING: " + json);
 		}
+		bytesSent += json.length();
 		writer.println(json);
 	}
 
@@ -66,6 +84,9 @@ public class ObjectReaderWriter_OverSocket {
 		// System.out.println("** waiting for answer....") ;
 		// reader.ready() ;
 		String response = reader.readLine();
+		if (response != null) {
+			bytesReceived += response.length();
+		}
 		// we do not have to cast to T, since req.responseType is of type Class<T>
 		if (debug) {
 			System.out.println("** RECEIVING: " + response);
@@ -4,7 +4,13 @@ import java.io.IOException;
 import java.net.ServerSocket;
 import java.net.Socket;
 import java.net.UnknownHostException;
+import java.util.ArrayList;
+import java.util.LinkedHashMap;
 import java.util.List;
+import java.util.Map;
+
+import com.google.gson.JsonArray;
+import com.google.gson.JsonElement;
 
 import eu.iv4xr.japyre.connection.ObjectReaderWriter_OverSocket;
 
@@ -38,11 +44,117 @@ public class GymEnvServer<Observation> {
     
     public static class TrainingCommand {
     	public String cmd  ;
-    	public String arg  ;
+    	/**
+    	 * The argument of the command. This is a single action-string for STEP, and
+    	 * a Json-array of action-strings for STEP_BATCH.
+    	 */
+    	public JsonElement arg  ;
     }
     
     static final String OK_  = "OK__" ;
     
+    /**
+     * A histogram of latencies, with a bucket for every power of two microseconds, just
+     * like the Python-side LatencyHistogram (see instrumentation.py): bucket i counts
+     * latencies t with 2^(i-1) <= t < 2^i microseconds (bucket 0 those below 1).
+     */
+    static class LatencyHistogram {
+    	static final int NUMBER_OF_BUCKETS = 31 ;
+    	long[] buckets = new long[NUMBER_OF_BUCKETS] ;
+    	long count = 0 ;
+    	long totalNanos = 0 ;
+    	long maxNanos = 0 ;
+    	
+    	void record(long nanos) {
+    		int b = 64 - Long.numberOfLeadingZeros(nanos / 1000) ;
+    		buckets[Math.min(b, NUMBER_OF_BUCKETS - 1)]++ ;
+    		count++ ;
+    		totalNanos += nanos ;
+    		maxNanos = Math.max(maxNanos,nanos) ;
+    	}
+    	
+    	/**
+    	 * The p-th percentile (0 <= p <= 100), in microseconds; the upper bound of the
+    	 * bucket it falls in.
+    	 */
+    	double percentile(double p) {
+    		if (count == 0) return 0.0 ;
+    		double rank = p / 100 * count ;
+    		long seen = 0 ;
+    		for (int b = 0 ; b < NUMBER_OF_BUCKETS ; b++) {
+    			seen += buckets[b] ;
+    			if (seen >= rank && buckets[b] > 0) {
+    				return Math.min((double) (1L << b), maxNanos / 1000.0) ;
+    			}
+    		}
+    		return maxNanos / 1000.0 ;
+    	}
+    	
+    	Map<String,Object> snapshot() {
+    		Map<String,Object> s = new LinkedHashMap<>() ;
+    		s.put("count", count) ;
+    		s.put("meanMicros", count == 0 ? 0.0 : totalNanos / (count * 1000.0)) ;
+    		s.put("p50Micros", percentile(50)) ;
+    		s.put("p99Micros", percentile(99)) ;
+    		s.put("maxMicros", maxNanos / 1000.0) ;
+    		List<Long> bs = new ArrayList<>() ;
+    		for (long n : buckets) bs.add(n) ;
+    		s.put("buckets", bs) ;
+    		return s ;
+    	}
+    }
+    
+    /**
+     * The statistics of a command served: how often it was served, the time spent
+     * executing it on the GymEnv (the interpret-phase), and the bytes of Json received
+     * and sent for it. Sent to Python on STATS, in the same form as the Python-side
+     * servers do (see instrumentation.py), but only with the interpret-phase.
+     */
+    static class CommandStats {
+    	long count = 0 ;
+    	long bytesSent = 0 ;
+    	long bytesReceived = 0 ;
+    	LatencyHistogram interpret = new LatencyHistogram() ;
+    	
+    	void record(long nanos, long sent, long received) {
+    		count++ ;
+    		bytesSent += sent ;
+    		bytesReceived += received ;
+    		interpret.record(nanos) ;
+    	}
+    	
+    	Map<String,Object> snapshot() {
+    		Map<String,Object> phases = new LinkedHashMap<>() ;
+    		phases.put("interpret", interpret.snapshot()) ;
+    		Map<String,Object> s = new LinkedHashMap<>() ;
+    		s.put("count", count) ;
+    		s.put("bytesSent", bytesSent) ;
+    		s.put("bytesReceived", bytesReceived) ;
+    		s.put("phases", phases) ;
+    		return s ;
+    	}
+    }
+    
+    Map<String,CommandStats> stats = new LinkedHashMap<>() ;
+    long startedAt = System.currentTimeMillis() ;
+    
+    Map<String,Object> statsSnapshot() {
+    	Map<String,Object> commands = new LinkedHashMap<>() ;
+    	long sent = 0 ;
+    	long received = 0 ;
+    	for (Map.Entry<String,CommandStats> e : stats.entrySet()) {
+    		commands.put(e.getKey(), e.getValue().snapshot()) ;
+    		sent += e.getValue().bytesSent ;
+    		received += e.getValue().bytesReceived ;
+    	}
+    	Map<String,Object> s = new LinkedHashMap<>() ;
+    	s.put("seconds", (System.currentTimeMillis() - startedAt) / 1000.0) ;
+    	s.put("bytesSent", sent) ;
+    	s.put("bytesReceived", received) ;
+    	s.put("commands", commands) ;
+    	return s ;
+    }
+    
     public void start() throws IOException {
     	System.out.println(String.format("> Starting a GynEnv-server at port %s.", port));
  
@@ -52,6 +164,7 @@ public class GymEnvServer<Observation> {
     	readerwriter = new ObjectReaderWriter_OverSocket(clientsocket) ;
     	boolean keepRunning = true ;
     	while (keepRunning) {
+    		long receivedBefore = readerwriter.bytesReceived ;
     		TrainingCommand cmd =  readerwriter.read(TrainingCommand.class) ;
     		if (cmd == null) {
     			System.out.println(String.format("> The client left."));
@@ -61,27 +174,65 @@ public class GymEnvServer<Observation> {
     			keepRunning = false ;
     			break ;
     		}
+    		// the answer is computed first, and only then written, so that the time of
+    		// writing it is not counted as interpret-time:
+    		Object answer = null ;
+    		boolean answers = true ;
+    		long t0 = System.nanoTime() ;
     		switch (cmd.cmd) {
     		  case "RESET" : // Python wants the GymEnv to reset its state
-    			  Observation o = gymEnv.reset(); 
-    			  readerwriter.write(o) ;
+    			  answer = gymEnv.reset(); 
     			  break ;
     		  case "CLOSE" : // Python wants the GymEnv to close
     			  gymEnv.close(); 
-    			  readerwriter.write(OK_) ;
+    			  answer = OK_ ;
     			  break ;
     		  case "GET_ACTIONSPACE" : // Python wants the GymEnv to send back its action-space
-    			  List<String> actions = gymEnv.actionSpace() ;
-    			  readerwriter.write(actions) ;
+    			  answer = gymEnv.actionSpace() ;
     			  break ;	  
     		  case "STEP"  :  // Python wants the GymEnv to do one step and sends back new observation, reward etc
-    			  String action = cmd.arg ;
-    			  RLStepData<Observation>  r = gymEnv.step(action) ;
-    			  readerwriter.write(r) ;
+    			  String action = cmd.arg.getAsString() ;
+    			  answer = gymEnv.step(action) ;
+    			  break ;
+    		  case "STEP_BATCH" : // Python wants the GymEnv to do a sequence of steps, in one round-trip
+    			  JsonArray results = new JsonArray() ;
+    			  for (JsonElement a : cmd.arg.getAsJsonArray()) {
+    				  RLStepData<Observation> ra = gymEnv.step(a.getAsString()) ;
+    				  if (ra == null) break ;
+    				  // the GymEnv may reuse the same observation-object over the steps,
+    				  // so we take a snapshot of it now:
+    				  results.add(ObjectReaderWriter_OverSocket.toJsonTree(ra)) ;
+    				  // stop at the first terminal state:
+    				  if (ra.end) break ;
+    			  }
+    			  answer = results ;
+    			  break ;
+    		  case "SET_CODEC" : // Python proposes another message-encoding; we only speak Json
+    			  answer = "json" ;
+    			  break ;
+    		  case "SHM_OPEN" : // Python offers a shared-memory ring for observations; not supported yet
+    			  answer = null ;
+    			  break ;
+    		  case "PING" : // Python checks that this server is still alive
+    			  answer = OK_ ;
+    			  break ;
+    		  case "STATS" : // Python asks how much time the commands took so far
+    			  answer = statsSnapshot() ;
     			  break ;
     		  case "KILL" : // Python wants to close this server :|
     			  keepRunning = false ;
+    			  answers = false ;
+    			  break ;
+    		  default : // unknown commands are not answered
+    			  answers = false ;
     		}	
+    		long interpretNanos = System.nanoTime() - t0 ;
+    		long sentBefore = readerwriter.bytesSent ;
+    		if (answers) {
+    			readerwriter.write(answer) ;
+    		}
+    		stats.computeIfAbsent(cmd.cmd, c -> new CommandStats())
+    		     .record(interpretNanos, readerwriter.bytesSent - sentBefore, readerwriter.bytesReceived - receivedBefore) ;
     	}
     	System.out.println(String.format("> Closing GynEnv-server..."));
     	readerwriter.close(); 
@@ -7,7 +7,8 @@ import eu.iv4xr.japyre.rl.GymEnvServer;
 /**
  * Run the main-method of this class to wrap an instance of {@link eu.iv4xr.japyre.rl.examples.SquareWorld}
  * Gym and deploys it as a server that responds to requests from the Python-side.
- * In this example the world-size is set to 6.
+ * In this example the world-size is set to 6. The port is 9999, unless another
+ * is given as the first argument (as the Python-side EnvServerSupervisor does).
  * 
  * @author Wish
  */
@@ -18,7 +19,7 @@ public class SquareWorldGymServer {
 	public static void main(String[] args) throws IOException {
 		SquareWorld sw = new SquareWorld(WORLD_SIZE) ;
 		//SquareWorld.debug = true ;
-		int port = 9999 ;
+		int port = args.length > 0 ? Integer.parseInt(args[0]) : 9999 ;
 		GymEnvServer<SquareWorld.Location> server = new GymEnvServer<>(port,sw) ;
 		//server.turnDebugMode(true);
 		server.start();